@@ -1,16 +1,22 @@
 """Contains the classes and functions that form the underlying logic of the journal application"""
 from math import floor
-from tkinter import Tk, Menu
-from tkinter.messagebox import askquestion
-from tkinter.ttk import Button, Frame
-
-from PIL import Image, ImageTk
+from os.path import exists, abspath
+from tkinter import Tk, Menu, PhotoImage, StringVar, Event
+from tkinter.messagebox import askquestion, showwarning
+from tkinter.ttk import Button, Frame, Label
+from typing import Iterable
 
 from autoimport import import_entries, delete_imports
 from backup import check_backup
-from configurations import dimensions, backup_enabled, autodelete_imports
+from base_widgets import BusyIndicator
+from configurations import dimensions, backup_enabled, autodelete_imports, debounce_writes, flush_settings, \
+    default_database, prefetch_pages
+from database import upgrade_database
 from database_info import database_is_empty
 from notebook import Journal
+from session import get_session
+from startup import StartupPipeline
+from tempfiles import coalesce_writes, flush_tempfiles
 
 # TODO add methods for creating new database
 # TODO add menu option to auto-clean imports
@@ -26,6 +32,25 @@ class App(Tk):
         tags.insert(2, 'App')
         self.bindtags(tags)
 
+        # Tempfiles log each change and are written in full at most every FLUSH_INTERVAL ms
+        coalesce_writes(self)
+        # The size of the window is written once it stops changing rather than on every <Configure>
+        debounce_writes(self)
+
+        # The upgrade and the backup run on a worker while the window is built, and the import waits for them
+        self.startup = StartupPipeline(self)
+        self.startup.begin('window')
+        # The databases are upgraded before the backup copies them. Pages that are opened first read unmeasured entries
+        # as empty until the readers are refreshed
+        # The number of databases upgraded and entries imported, which the readers are refreshed for
+        self._startup_changes = 0
+        self.startup.run_in_background('upgrade', upgrade_databases, open_databases(), callback=self._count_changes)
+        if backup_enabled():
+            self.startup.run_in_background('backup', backup, after=('upgrade',))
+        else:
+            self.startup.skip('backup')
+        self.startup.run_in_background('import', autoimport, after=('upgrade', 'backup'), callback=self._count_changes)
+
         themes = ThemeEngine()
         self.option_readfile(themes.options_file)
         themes.set_ttk_style()
@@ -39,14 +64,7 @@ class App(Tk):
         self.clear_content_icon = get_icon('ic_delete_sweep')
         self.delete_icon = get_icon('ic_delete_forever')
 
-        img = Image.open('.resources/wm_icon.png')
-        app_icon = ImageTk.PhotoImage(image=img)
-
-        if backup_enabled():
-            check = check_backup()
-            if check != 1:
-                # print(check)
-                pass
+        app_icon = PhotoImage(file='.resources/wm_icon.png')
 
         self.title('Meta-Jurnl')
         self.iconphoto(True, app_icon)
@@ -83,10 +101,23 @@ class App(Tk):
         toolbar = Frame(master=self, relief='flat', borderwidth=0, padding=5)
         toolbar.pack(fill='x')
 
-        self.journal = Journal(master=self)
+        status_bar = Frame(master=self, relief='sunken', borderwidth=1, padding=(5, 2))
+        status_bar.pack(side='bottom', fill='x')
+        self.status_var = StringVar(master=self)
+        Label(master=status_bar, textvariable=self.status_var).pack(side='left')
+        startup_indicator = BusyIndicator(master=status_bar)
+        startup_indicator.pack(side='right')
+        self.startup.add_progress_listener(self.status_var.set)
+        self.startup.add_progress_listener(lambda m: startup_indicator.set_busy(self.startup.running))
+
+        # Only the tab on show is built unless the other saved tabs are set to be built whenever the application is idle
+        self.journal = Journal(master=self, prefetch=prefetch_pages())
         self.journal.pack(fill='both', expand=True)
 
-        self.autoimport()
+        # The readers are refreshed once the new entries are in, if there were any
+        self.startup.when_ready('window', 'upgrade', 'import', callback=self._refresh_after_startup)
+        if get_session().skipped:
+            self.startup.when_ready('window', callback=self._report_skipped_tabs)
 
         self.new_reader = Button(master=toolbar, image=self.new_reader_icon, command=self.add_reader)
         new_writer = Button(master=toolbar, image=self.new_writer_icon, command=self.add_writer)
@@ -133,10 +164,27 @@ class App(Tk):
 
         self.change_buttons()
 
-        self.after(1000, self.deiconify)
+        # The window is ready as soon as it is mapped, which ends the first stage
+        self.bind('<Map>', self._window_mapped, add=True)
+        self.deiconify()
 
         self.mainloop()
 
+    def destroy(self):
+        self.journal.save_state()
+        flush_tempfiles()
+        flush_settings()
+        super(App, self).destroy()
+
+    def _report_skipped_tabs(self):
+        showwarning(title='Tabs not reopened', parent=self,
+                    message='These tabs from an earlier version could not be read and were not reopened:\n\n{}'.format(
+                        '\n'.join(get_session().skipped)))
+
+    def _window_mapped(self, event: Event):
+        if event.widget is self and not self.startup.ready('window'):
+            self.startup.finish('window')
+
     def update_dimensions(self, event):
         # s_width = self.winfo_screenwidth() / 2
         # s_height = self.winfo_screenheight() / 2
@@ -224,10 +272,61 @@ class App(Tk):
         self.journal.clear()
 
     def autoimport(self):
-        import_entries()
-        self.journal.refresh_readers()
-        if autodelete_imports():
-            delete_imports()
+        if autoimport():
+            self.journal.refresh_readers()
+
+    def _count_changes(self, count: int):
+        self._startup_changes += count
+
+    def _refresh_after_startup(self):
+        """Refreshes the readers if the upgrade or the import changed a database, or may have before failing"""
+        errors = self.startup.errors
+        if self._startup_changes or 'upgrade' in errors or 'import' in errors:
+            self.startup.run('refresh', self.journal.refresh_readers)
+        else:
+            self.startup.skip('refresh')
+
+
+def open_databases():
+    """Gets the default database and those of the open tabs, each once
+
+    :return: a set of the locations of the databases that exist
+    """
+    session = get_session()
+    paths = [default_database()] + [session.load(x).get('database') for x in session.tabs()]
+    return {abspath(x) for x in paths if x and exists(x)}
+
+
+def upgrade_databases(paths: Iterable[str]):
+    """Brings databases up to date. Runs on a worker during startup, so it is given the locations rather than reading
+    the session store, which belongs to the Tk thread
+
+    :param paths: the locations of the databases
+    :return: an int representing the number of databases that were changed
+    """
+    return sum(upgrade_database(path) for path in paths)
+
+
+def backup():
+    """Runs a backup if one is due. Runs on a worker during startup
+
+    :return: 1 if a backup was made, or None
+    """
+    result = check_backup()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def autoimport():
+    """Imports new entries and deletes the imported files, if set to. Runs on a worker during startup
+
+    :return: an int representing the number of entries that were imported
+    """
+    count = import_entries()
+    if autodelete_imports():
+        delete_imports()
+    return count
 
 
 def _test():
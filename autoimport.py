@@ -10,9 +10,11 @@ from writer import create_entry
 def import_entries():
     """Imports journal entries ('.mjson' files) and their associated attachments and creates a new entry in the db
 
+    :return: an int representing the number of entries that were imported
     """
     loc = imports_location()
     db = default_database()
+    count = 0
     if not exists(loc):
         makedirs(loc)
     for file in scandir(loc):
@@ -39,6 +41,8 @@ def import_entries():
                     with open(file, 'w') as up:
                         dump(j, up)
                         up.close()
+                    count += 1
+    return count
 
 
 def delete_imports():
@@ -2,8 +2,9 @@ from copy import deepcopy
 from os import listdir, remove, chdir
 from os.path import exists, abspath
 from database_info import DatabaseManager
+from lazy_imports import lazy_import
 
-from dateutil.parser import parse
+parser = lazy_import('dateutil.parser')
 
 
 class AutoRunModule:
@@ -27,7 +28,7 @@ class AutoRunModule:
                     fstream.close()
                 temp = entry.split('<DATE>')
                 temp = temp[1].split('<BODY>')
-                date = parse(temp[0].strip())
+                date = parser.parse(temp[0].strip())
                 temp = temp[1].split('<TAGS>')
                 body = temp[0].strip()
                 temp = temp[1].split('<ATTACHMENTS>')
@@ -1,7 +1,7 @@
 """Contains widget templates"""
-from tkinter import Widget, Canvas
-from tkinter.ttk import Frame, Button, Scrollbar, Style, Entry
-from typing import Any
+from tkinter import Widget, Canvas, Event, IntVar
+from tkinter.ttk import Frame, Button, Scrollbar, Style, Entry, Checkbutton, Progressbar
+from typing import Any, Callable, List, Dict, Set, Tuple, Union, Iterable
 
 from modules import ReaderModule
 
@@ -155,6 +155,283 @@ class ScrollingFrame(Frame):
         canvas.bind("<Leave>", _unbind_mouse)
 
 
+class BusyIndicator(Progressbar):
+    """A small progress bar that moves while something is being loaded in the background"""
+
+    def __init__(self, **kwargs):
+        super(BusyIndicator, self).__init__(mode='indeterminate', length=40, **kwargs)
+
+    def set_busy(self, busy: bool):
+        if busy:
+            self.start(20)
+        else:
+            self.stop()
+
+
+class VirtualList(Frame):
+    """A scrolling list which only has widgets for the rows in view, so its cost does not grow with the number of items.
+    Rows are made by make_row and recycled as the list scrolls, with fill_row setting a row to show the item at an
+    index. When given, prefetch is called with the range of indexes in view before the rows are filled, so their
+    contents can be fetched in one batch, either there and then or on a worker followed by another refresh"""
+
+    def __init__(self, make_row: Callable[[Frame], Widget], fill_row: Callable[[Widget, int], None],
+                 prefetch: Callable[[int, int], None] = None, **kwargs):
+        super(VirtualList, self).__init__(**kwargs)
+
+        self._make_row = make_row
+        self._fill_row = fill_row
+        self._prefetch = prefetch
+
+        self._count = 0
+        self._first = 0
+        self._rows: List[Widget] = []
+        self._spare: List[Widget] = []
+        self._row_height = 0
+
+        self._scrollbar = Scrollbar(master=self, orient='vertical', command=self.yview)
+        self._scrollbar.pack(side='right', fill='y')
+        self._body = Frame(master=self)
+        self._body.pack(side='left', fill='both', expand=True)
+        self._body.columnconfigure(0, weight=1)
+        # The rows follow the size of the list, so they must not change it
+        self._body.grid_propagate(False)
+
+        self._body.bind('<Configure>', self._on_configure)
+        self._body.bind('<Enter>', self._bind_mouse)
+        self._body.bind('<Leave>', self._unbind_mouse)
+
+    @property
+    def count(self):
+        return self._count
+
+    @count.setter
+    def count(self, v: int):
+        """Sets the number of items and redraws the rows, keeping the scroll position where possible"""
+        self._count = v
+        self._first = max(min(self._first, v - len(self._rows)), 0)
+        self.refresh()
+
+    @property
+    def first(self):
+        """The index of the item in the top row"""
+        return self._first
+
+    @property
+    def visible(self):
+        """The number of rows in view"""
+        return len(self._rows)
+
+    def row(self, index: int):
+        """Gets the row showing the item at an index
+
+        :param index: an int representing the item
+        :return: the row widget, or None if the item is not in view
+        """
+        if self._first <= index < min(self._first + len(self._rows), self._count):
+            return self._rows[index - self._first]
+        return None
+
+    def refresh(self):
+        """Refills the rows in view, e.g. after the items have changed"""
+        stop = min(self._first + len(self._rows), self._count)
+        if self._prefetch and stop > self._first:
+            self._prefetch(self._first, stop)
+        for i, row in enumerate(self._rows):
+            index = self._first + i
+            if index < self._count:
+                self._fill_row(row, index)
+                row.grid()
+            else:
+                row.grid_remove()
+        if self._count:
+            self._scrollbar.set(self._first / self._count, stop / self._count)
+        else:
+            self._scrollbar.set(0, 1)
+
+    def scroll_to(self, first: int):
+        first = max(min(first, self._count - len(self._rows)), 0)
+        if first != self._first:
+            self._first = first
+            self.refresh()
+
+    def see(self, index: int):
+        """Scrolls the least distance that brings the item at an index into view"""
+        if index < self._first:
+            self.scroll_to(index)
+        elif index >= self._first + len(self._rows):
+            self.scroll_to(index - len(self._rows) + 1)
+
+    def yview(self, *args):
+        """Handles the commands of the scrollbar"""
+        if args[0] == 'moveto':
+            self.scroll_to(round(float(args[1]) * self._count))
+        elif args[0] == 'scroll':
+            step = len(self._rows) if args[2] == 'pages' else 1
+            self.scroll_to(self._first + int(args[1]) * step)
+
+    def _on_configure(self, event: Event):
+        if not self._row_height:
+            row = self._new_row()
+            row.update_idletasks()
+            self._row_height = max(row.winfo_reqheight(), 1)
+            self._body.configure(width=row.winfo_reqwidth(), height=10 * self._row_height)
+        wanted = max(event.height // self._row_height, 1)
+        while len(self._rows) < wanted:
+            self._new_row()
+        # Rows beyond the height are hidden rather than destroyed, so resizing back does not make them again
+        for row in self._rows[wanted:]:
+            row.grid_remove()
+        self._spare.extend(reversed(self._rows[wanted:]))
+        del self._rows[wanted:]
+        self._first = max(min(self._first, self._count - wanted), 0)
+        self.refresh()
+
+    def _new_row(self):
+        if self._spare:
+            row = self._spare.pop()
+        else:
+            row = self._make_row(self._body)
+            row.bind('<Enter>', self._bind_mouse, add=True)
+        row.grid(row=len(self._rows), column=0, sticky='ew')
+        self._rows.append(row)
+        return row
+
+    def _bind_mouse(self, event=None):
+        self.bind_all('<4>', self._on_mousewheel)
+        self.bind_all('<5>', self._on_mousewheel)
+        self.bind_all('<MouseWheel>', self._on_mousewheel)
+
+    def _unbind_mouse(self, event=None):
+        self.unbind_all('<4>')
+        self.unbind_all('<5>')
+        self.unbind_all('<MouseWheel>')
+
+    def _on_mousewheel(self, event: Event):
+        """Linux uses event.num; Windows / Mac uses event.delta"""
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self._first - 3)
+        elif event.num == 5 or event.delta < 0:
+            self.scroll_to(self._first + 3)
+
+
+class TagCheckbutton(Checkbutton):
+    """A row of a TagChecklist, which is recycled to show whichever tag is scrolled to it"""
+
+    def __init__(self, **kwargs):
+        self.var = IntVar(master=kwargs.get('master'))
+        super(TagCheckbutton, self).__init__(variable=self.var, **kwargs)
+
+        self.tag = ''
+
+
+class TagChecklist(Frame):
+    """A virtual list of checkbuttons for choosing tags. The selection is one set of str and only the rows in view have
+    widgets and variables, so journals with thousands of tags cost no more than ones with a few"""
+
+    def __init__(self, command: Callable[[], None] = None, autosort: bool = False, styles: Tuple[str, str] = None,
+                 **kwargs):
+        """
+
+        :param command: a callable that is called after the user checks or unchecks a tag
+        :param autosort: a bool indicating whether selected tags are listed before the others
+        :param styles: a tuple of the style names for selected and unselected tags, or None for the default style
+        """
+        super(TagChecklist, self).__init__(**kwargs)
+
+        self._command = command
+        self._autosort = autosort
+        self._styles = styles
+
+        self._tags: List[str] = []
+        self._folded: Dict[str, str] = {}
+        self._selected: Set[str] = set()
+        self._pattern = ''
+        self._matches: Union[List[str], None] = None
+        self._shown: List[str] = []
+
+        self._list = VirtualList(master=self, make_row=self._make_row, fill_row=self._fill_row)
+        self._list.pack(fill='both', expand=True)
+
+    @property
+    def tags(self):
+        return tuple(self._tags)
+
+    @tags.setter
+    def tags(self, v: Iterable[str]):
+        self._tags = sorted(set(v))
+        self._folded = {tag: tag.lower() for tag in self._tags}
+        self._matches = None
+        self.pattern = self._pattern
+
+    @property
+    def selected(self):
+        return tuple(tag for tag in self._tags if tag in self._selected)
+
+    @selected.setter
+    def selected(self, v: Iterable[str]):
+        self._selected = set(v)
+        self._arrange()
+
+    @property
+    def unselected(self):
+        return tuple(tag for tag in self._tags if tag not in self._selected)
+
+    @property
+    def pattern(self):
+        return self._pattern
+
+    @pattern.setter
+    def pattern(self, v: str):
+        """Shows only the tags containing a str, ignoring case. When the str extends the last one, only the tags that
+        matched last time are searched, so typing into a filter stays fast"""
+        v = v.lower()
+        source = self._matches if self._matches is not None and self._pattern in v else self._tags
+        self._matches = [tag for tag in source if v in self._folded[tag]]
+        self._pattern = v
+        self._arrange()
+
+    @property
+    def autosort(self):
+        return self._autosort
+
+    @autosort.setter
+    def autosort(self, v: bool):
+        self._autosort = v
+        self._arrange()
+
+    def _arrange(self):
+        matches = self._matches if self._matches is not None else self._tags
+        if self._autosort:
+            selected = self._selected
+            self._shown = [t for t in matches if t in selected] + [t for t in matches if t not in selected]
+        else:
+            self._shown = matches
+        self._list.count = len(self._shown)
+
+    def _make_row(self, master: Frame):
+        button = TagCheckbutton(master=master)
+        button.configure(command=lambda b=button: self._toggle(b))
+        return button
+
+    def _fill_row(self, button: TagCheckbutton, index: int):
+        tag = self._shown[index]
+        selected = tag in self._selected
+        button.tag = tag
+        button.var.set(int(selected))
+        button.configure(text=tag)
+        if self._styles:
+            button.configure(style=self._styles[0 if selected else 1])
+
+    def _toggle(self, button: TagCheckbutton):
+        if button.var.get():
+            self._selected.add(button.tag)
+        else:
+            self._selected.discard(button.tag)
+        self._arrange()
+        if self._command:
+            self._command()
+
+
 # class GraphGrid:
 #     def __init__(self, height=1, width=1, **kwargs):
 #
@@ -0,0 +1,448 @@
+"""An in-memory bitmap index over the entries of a journal database, used for interactive filtering. Every entry is
+given a dense ordinal by date, and each attribute is stored as a bitset (a Python int) over those ordinals, so filters
+can be combined with bitwise operations instead of queries"""
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import closing
+from datetime import datetime
+from os.path import abspath
+from sqlite3 import connect, OperationalError
+from threading import Lock
+from typing import Dict, Iterable, Tuple, List
+
+from configurations import default_database
+from database_info import get_change_counter
+from query_runner import execute
+from session import last_accessed, access_version
+
+DATE_PARTS = ('year', 'month', 'day', 'hour', 'minute', 'weekday')
+SORT_KEYS = ('created', 'last_edit', 'last_access', 'length', 'words', 'avg_word_len', 'tags', 'attachments', 'thread')
+# The queries that load each per-entry column, besides 'created', 'thread', and 'last_access', which is kept in the
+# session store
+_COLUMNS = {'last_edit': 'SELECT entry_id, last_edit FROM dates',
+            'length': 'SELECT entry_id, chars FROM entry_metrics',
+            'words': 'SELECT entry_id, words FROM entry_metrics',
+            'avg_word_len': 'SELECT entry_id, avg_word_len FROM entry_metrics',
+            'lines': 'SELECT entry_id, lines FROM entry_metrics',
+            'reading_time': 'SELECT entry_id, reading_time FROM entry_metrics',
+            'tags': 'SELECT entry_id, COUNT(DISTINCT tag) FROM tags WHERE tag!=\'(UNTAGGED)\' GROUP BY entry_id',
+            'attachments': 'SELECT entry_id, COUNT(*) FROM attachments GROUP BY entry_id'}
+# The number of bits decoded at a time when paging through a bitmap
+_CHUNK = 4096
+
+
+def popcount(bits: int):
+    """Counts the entries in a bitmap
+
+    :param bits: an int representing a bitmap
+    :return: an int representing the number of set bits
+    """
+    return bin(bits).count('1')
+
+
+def range_mask(low: int, high: int):
+    """Builds a bitmap with every ordinal from low up to, but not including, high set
+
+    :param low: an int representing the first ordinal in the range
+    :param high: an int representing the ordinal after the last one in the range
+    :return: an int representing the bitmap
+    """
+    if high <= low:
+        return 0
+    return ((1 << high) - 1) ^ ((1 << low) - 1)
+
+
+def _from_ordinals(ordinals: Iterable[int], size: int):
+    buffer = bytearray((size >> 3) + 1)
+    for o in ordinals:
+        buffer[o >> 3] |= 1 << (o & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _weekday(date: datetime):
+    """Gets the weekday of a date, numbered from Sunday as SQLite's strftime('%w') does"""
+    return (date.weekday() + 1) % 7
+
+
+class BitmapIndex:
+    """Holds one bitmap per tag, date part bucket, and attribute flag for a single version of a database"""
+
+    def __init__(self, database: str = None):
+        self._path = database if database else default_database()
+        # Read before building, so a change made while building is picked up by the next version check
+        self._version = get_change_counter(self._path)
+
+        with closing(connect(self._path)) as d:
+            rows = d.execute('SELECT entry_id, created FROM dates ORDER BY created, entry_id').fetchall()
+            self._ids: Tuple[int] = tuple(x[0] for x in rows)
+            self._ordinals: Dict[int, int] = {id_: o for o, id_ in enumerate(self._ids)}
+            self._created: List[datetime] = [datetime.fromisoformat(x[1]) if x[1] else datetime.min for x in rows]
+            self._all = range_mask(0, len(self._ids))
+
+            self._tag_ordinals: Dict[str, array] = {}
+            counts = array('H', bytes(2 * len(self._ids)))
+            for entry, tag in d.execute('SELECT DISTINCT entry_id, tag FROM tags').fetchall():
+                o = self._ordinals.get(entry)
+                if o is not None:
+                    self._tag_ordinals.setdefault(tag, array('L')).append(o)
+                    counts[o] += 1
+            by_count: Dict[int, List[int]] = {}
+            for o, count in enumerate(counts):
+                by_count.setdefault(count, []).append(o)
+            self._tag_counts = {k: _from_ordinals(v, len(self._ids)) for k, v in by_count.items()}
+
+            self._attachments = self.bits(x[0] for x in d.execute('SELECT entry_id FROM attachments').fetchall())
+            relations = d.execute('SELECT child, parent FROM relations').fetchall()
+            self._parent = self.bits(x[0] for x in relations)
+            self._children = self.bits(x[1] for x in relations)
+
+        self._tags: Dict[str, int] = {}
+        self._date_parts: Dict[str, Dict[int, int]] = {}
+        self._columns: Dict[str, list] = {'created': self._created}
+        self._accesses = 0
+        self._relations: List[Tuple[int, int]] = relations
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def ids(self):
+        """The ids of every entry, in date order
+
+        :rtype: Tuple[int]
+        """
+        return self._ids
+
+    @property
+    def all(self):
+        return self._all
+
+    @property
+    def has_attachments(self):
+        return self._attachments
+
+    @property
+    def has_parent(self):
+        return self._parent
+
+    @property
+    def has_children(self):
+        return self._children
+
+    def bits(self, ids: Iterable[int]):
+        """Converts a collection of entry ids to a bitmap
+
+        :param ids: an iterable of int representing entries
+        :return: an int representing the bitmap of the entries that are in the index
+        """
+        ordinals = self._ordinals
+        return _from_ordinals((ordinals[i] for i in ids if i in ordinals), len(self._ids))
+
+    def decode(self, bits: int):
+        """Converts a bitmap to the ids of its entries
+
+        :param bits: an int representing a bitmap
+        :return: a tuple of int representing the entries, in date order
+        :rtype: Tuple[int]
+        """
+        ids = self._ids
+        s = bin(bits)[:1:-1]
+        found = []
+        i = s.find('1')
+        while i != -1:
+            found.append(ids[i])
+            i = s.find('1', i + 1)
+        return tuple(found)
+
+    def ordinal(self, entry_id: int):
+        """Gets the ordinal of an entry, or None if it is not in the index"""
+        return self._ordinals.get(entry_id)
+
+    def nth(self, bits: int, n: int):
+        """Finds the ordinal of the nth set bit of a bitmap, counting a chunk of bits at a time and only decoding the
+        chunk it falls in
+
+        :param bits: an int representing a bitmap
+        :param n: an int representing how many set bits come before the one wanted
+        :return: an int representing the ordinal, or None if the bitmap has n set bits or fewer
+        """
+        offset = 0
+        while bits:
+            piece = bits & ((1 << _CHUNK) - 1)
+            count = popcount(piece)
+            if n < count:
+                s = bin(piece)[:1:-1]
+                i = s.find('1')
+                for _ in range(n):
+                    i = s.find('1', i + 1)
+                return offset + i
+            n -= count
+            bits >>= _CHUNK
+            offset += _CHUNK
+        return None
+
+    def position(self, key: Tuple[datetime, int], after: bool = True):
+        """Finds where a (created, entry_id) key falls in the date order, whether or not the entry is in the index
+
+        :param key: a tuple of the creation date and the id of an entry
+        :param after: a bool: True for the ordinal following the key, False for the ordinal of the key or the one after
+        :return: an int representing the ordinal
+        """
+        created, entry_id = key
+        low = bisect_left(self._created, created)
+        high = bisect_right(self._created, created, low)
+        ids = self._ids[low:high]
+        return low + (bisect_right(ids, entry_id) if after else bisect_left(ids, entry_id))
+
+    def select(self, bits: int, start: int = 0, end: int = None, limit: int = None, reverse: bool = False):
+        """Gets the ordinals of the set bits of a bitmap between two ordinals, decoding only as much of the bitmap as
+        the limit requires
+
+        :param bits: an int representing a bitmap
+        :param start: an int representing the first ordinal to look at
+        :param end: an int representing the ordinal after the last one to look at, or None for the end of the index
+        :param limit: an int representing the most ordinals to return, or None for all of them
+        :param reverse: a bool indicating whether the ordinals should be taken from the end of the range instead
+        :return: a list of int representing the ordinals, in ascending order
+        :rtype: List[int]
+        """
+        end = len(self._ids) if end is None else end
+        limit = len(self._ids) if limit is None else limit
+        bits &= range_mask(start, end)
+        found = []
+        if not reverse:
+            bits >>= start
+            offset = start
+            while bits and len(found) < limit:
+                piece = bits & ((1 << _CHUNK) - 1)
+                if not piece:
+                    # Skip straight to the next set bit rather than walking through empty chunks
+                    skip = (bits & -bits).bit_length() - 1
+                    bits >>= skip
+                    offset += skip
+                    continue
+                s = bin(piece)[:1:-1]
+                i = s.find('1')
+                while i != -1 and len(found) < limit:
+                    found.append(offset + i)
+                    i = s.find('1', i + 1)
+                bits >>= _CHUNK
+                offset += _CHUNK
+            return found
+        while bits and len(found) < limit:
+            low = max(bits.bit_length() - _CHUNK, 0)
+            s = bin(bits >> low)[2:]
+            i = s.find('1')
+            while i != -1 and len(found) < limit:
+                found.append(low + len(s) - 1 - i)
+                i = s.find('1', i + 1)
+            bits &= (1 << low) - 1
+        found.reverse()
+        return found
+
+    def rows(self, ordinals: Iterable[int]):
+        """Gets the creation date and id of the entries at the given ordinals
+
+        :param ordinals: an iterable of int representing ordinals
+        :return: a list of tuples of the creation date and id of each entry
+        :rtype: List[Tuple[datetime, int]]
+        """
+        return [(self._created[o], self._ids[o]) for o in ordinals]
+
+    def created_dates(self, ids: Iterable[int]):
+        """Gets the creation dates of the given entries without querying the database
+
+        :param ids: an iterable of int representing entry ids
+        :return: a list of datetime, with None for ids that are not in the index
+        :rtype: List[datetime]
+        """
+        ordinals, created = self._ordinals, self._created
+        return [created[ordinals[i]] if i in ordinals else None for i in ids]
+
+    def negate(self, bits: int):
+        return self._all & ~bits
+
+    def tag(self, tag: str):
+        """Gets the bitmap of the entries with a given tag. Bitmaps are built the first time a tag is asked for
+
+        :param tag: a str representing the tag
+        :return: an int representing the bitmap
+        """
+        bits = self._tags.get(tag)
+        if bits is None:
+            bits = self._tags[tag] = _from_ordinals(self._tag_ordinals.get(tag, ()), len(self._ids))
+        return bits
+
+    def any_of(self, tags: Iterable[str]):
+        bits = 0
+        for tag in tags:
+            bits |= self.tag(tag)
+        return bits
+
+    def all_of(self, tags: Iterable[str]):
+        tags = set(tags)
+        if not tags:
+            return 0
+        bits = self._all
+        for tag in tags:
+            bits &= self.tag(tag)
+        return bits
+
+    def only(self, tags: Iterable[str]):
+        tags = set(tags)
+        bits = self._tag_counts.get(len(tags), 0)
+        for tag in tags:
+            bits &= self.tag(tag)
+        return bits
+
+    def created_range(self, lower: datetime, upper: datetime):
+        """Gets the bitmap of the entries created between two dates, inclusive
+
+        :param lower: a datetime representing the start of the range
+        :param upper: a datetime representing the end of the range
+        :return: an int representing the bitmap
+        """
+        return range_mask(bisect_left(self._created, lower), bisect_right(self._created, upper))
+
+    def date_part(self, part: str, low: int, high: int):
+        """Gets the bitmap of the entries whose date has a part (year, month, day, hour, minute, or weekday) between two
+        values, inclusive. Weekdays are numbered from 0 for Sunday
+
+        :param part: a str in DATE_PARTS
+        :param low: an int representing the lowest value of the part
+        :param high: an int representing the highest value of the part
+        :return: an int representing the bitmap
+        """
+        if part == 'year':
+            return self.created_range(datetime(max(low, 1), 1, 1), datetime(min(high, 9999), 12, 31, 23, 59, 59,
+                                                                             999999))
+        buckets = self._date_part_buckets(part)
+        bits = 0
+        for value in range(low, high + 1):
+            bits |= buckets.get(value, 0)
+        return bits
+
+    def histogram(self, part: str, bits: int = None):
+        """Counts the entries for each value of a date part
+
+        :param part: a str in DATE_PARTS
+        :param bits: an int representing the bitmap of the entries to count, or None to count every entry
+        :return: a dict of the values of the part and the number of entries with each value
+        :rtype: Dict[int, int]
+        """
+        buckets = self._date_part_buckets(part)
+        if bits is None:
+            return {k: popcount(v) for k, v in buckets.items()}
+        return {k: popcount(v & bits) for k, v in buckets.items() if v & bits}
+
+    def column(self, key: str):
+        """Gets the value of a sort key for every entry, indexed by ordinal. Columns are loaded the first time they are
+        asked for, from the dates, entry_metrics, tags, attachments, and relations tables, so no bodies are read
+
+        :param key: a str in SORT_KEYS, or 'lines' or 'reading_time'
+        :return: a list of the values, with missing dates as datetime.min and missing counts and metrics as 0
+        :rtype: list
+        """
+        values = self._columns.get(key)
+        # The last access times change without the database changing, so they are read again after an entry is opened
+        if values is not None and (key != 'last_access' or self._accesses == access_version()):
+            return values
+        if key not in SORT_KEYS and key not in _COLUMNS:
+            raise KeyError('Allowed sort keys include {}.'.format(', '.join(SORT_KEYS)))
+        if key == 'thread':
+            values = self._thread_sizes()
+        elif key == 'last_access':
+            self._accesses = access_version()
+            values = [datetime.min] * len(self._ids)
+            for entry_id, value in last_accessed(self._path).items():
+                o = self._ordinals.get(entry_id)
+                if o is not None:
+                    values[o] = value
+        else:
+            dates = key == 'last_edit'
+            values = [datetime.min if dates else 0] * len(self._ids)
+            with closing(connect(self._path)) as d:
+                try:
+                    rows = execute(d, _COLUMNS[key])
+                except OperationalError:
+                    # Databases that have not been upgraded yet have no entry_metrics table, so every entry counts as
+                    # unmeasured until the upgrade changes the database and the index is built again
+                    rows = []
+                for entry_id, value in rows:
+                    o = self._ordinals.get(entry_id)
+                    if o is not None and value is not None:
+                        values[o] = datetime.fromisoformat(value) if dates else value
+        self._columns[key] = values
+        return values
+
+    def _thread_sizes(self):
+        """Counts the entries in the thread of each entry, a thread being every entry linked to it through parents and
+        children"""
+        roots = list(range(len(self._ids)))
+
+        def find(o: int):
+            while roots[o] != o:
+                roots[o] = roots[roots[o]]
+                o = roots[o]
+            return o
+
+        for child, parent in self._relations:
+            a, b = self._ordinals.get(child), self._ordinals.get(parent)
+            if a is not None and b is not None:
+                roots[find(a)] = find(b)
+        sizes: Dict[int, int] = {}
+        for o in range(len(roots)):
+            root = find(o)
+            sizes[root] = sizes.get(root, 0) + 1
+        return [sizes[find(o)] for o in range(len(roots))]
+
+    def sort(self, ordinals: List[int], keys: Iterable[Tuple[str, bool]]):
+        """Sorts ordinals by several keys. Ties left by every key are broken by date and then id
+
+        :param ordinals: a list of int representing ordinals, in ascending order
+        :param keys: an iterable of tuples of a str in SORT_KEYS and a bool indicating whether the order is descending
+        :return: a list of int representing the sorted ordinals
+        :rtype: List[int]
+        """
+        ordinals = list(ordinals)
+        # Python's sort is stable, so sorting by the least significant key first gives the combined order
+        for key, descending in reversed(list(keys)):
+            ordinals.sort(key=self.column(key).__getitem__, reverse=descending)
+        return ordinals
+
+    def _date_part_buckets(self, part: str):
+        buckets = self._date_parts.get(part)
+        if buckets is None:
+            ordinals: Dict[int, List[int]] = {}
+            if part == 'weekday':
+                values = map(_weekday, self._created)
+            else:
+                values = (getattr(c, part) for c in self._created)
+            for o, value in enumerate(values):
+                ordinals.setdefault(value, []).append(o)
+            buckets = self._date_parts[part] = {k: _from_ordinals(v, len(self._ids)) for k, v in ordinals.items()}
+        return buckets
+
+
+_indexes: Dict[str, BitmapIndex] = {}
+# Worker threads build indexes too, and a journal's index should only be built once per version
+_indexes_lock = Lock()
+
+
+def get_index(database: str = None, version: int = None):
+    """Gets the index for a database, rebuilding it if the database has changed since it was built
+
+    :param database: a str representing the location of the database
+    :param version: an int representing a change counter that was already read, e.g. once for a whole snapshot, in
+    which case an index built for that version is used without reading the counter again. Any other index is checked
+    against the counter, as counters can go back as well as forward, e.g. when a backup is restored
+    :return: a BitmapIndex for the current version of the database
+    :rtype: BitmapIndex
+    """
+    path = abspath(database) if database else default_database()
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None or index.version != version and index.version != get_change_counter(path):
+            index = _indexes[path] = BitmapIndex(path)
+        return index
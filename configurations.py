@@ -1,18 +1,40 @@
-"""Classes and functions for manipulating and maintaining the application's configuration file(s)"""
+"""Classes and functions for manipulating and maintaining the application's configuration file(s). The file is read
+once into a Settings object and only read again when its modification time or size changes, so the functions below do
+no file I/O unless they change a setting. Changes are written under a lock on the file, merged into what is on disk at
+that moment, so two instances of the application can share the file"""
 from ast import literal_eval
 from configparser import ConfigParser
+from contextlib import contextmanager
 from datetime import datetime
-from os import getcwd
+from os import getcwd, stat, getpid, replace
 from os.path import exists, isdir, abspath, join, basename
-from typing import List, Union
+from threading import RLock, current_thread, main_thread
+from time import monotonic
+from tkinter import Misc
+from typing import List, Union, Tuple, Dict
 
-from database import create_database
+try:
+    from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:
+    # Windows
+    flock = None
+    from msvcrt import locking, LK_LOCK, LK_UNLCK
 
+from database import create_database, upgrade_database
 
-def create_file(database: str = None):
+CONFIG_FILE = 'settings.config'
+# The seconds the loaded settings are trusted before the file is checked for changes again
+REVALIDATE_INTERVAL = 1.0
+# Options that change many times a second, e.g. while the window is dragged, and are written once they settle
+DEBOUNCED = {('Visual', 'dimensions'), ('Notebook', 'current')}
+DEBOUNCE_INTERVAL = 1000
+
+
+def create_file(database: str = None, path: str = CONFIG_FILE):
     """Creates the config file for the application. Creates a database named 'jurnl.sqlite' if it does not exist
 
     :param database: a str path pointing to the database that the config file is initially built for
+    :param path: a str representing the location of the config file
     """
     if not database:
         database = join(getcwd(), 'jurnl.sqlite')
@@ -40,20 +62,246 @@ def create_file(database: str = None):
         }
         parser['Notebook'] = {
             'pages': '[]',
-            'current': ''
+            'current': '',
+            'prefetch pages': 'False'
         }
         parser['Visual'] = {
             'theme': '(dark, green)',
             'dimensions': '(1500, 600)'
         }
         # TODO add option for obscuring system files (read and write in bytes instead of str)
-        with open('settings.config', 'w') as f:
+        with open(path, 'w') as f:
             parser.write(f)
             f.close()
     else:
         raise FileNotFoundError('The provided database \'{}\' does not exist.'.format(name))
 
 
+@contextmanager
+def _file_lock(path: str):
+    """Holds an exclusive lock on a file for as long as the context is open, waiting for other processes to release
+    theirs first"""
+    with open(path, 'a+') as file:
+        if flock:
+            flock(file.fileno(), LOCK_EX)
+        else:
+            file.seek(0)
+            locking(file.fileno(), LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if flock:
+                flock(file.fileno(), LOCK_UN)
+            else:
+                file.seek(0)
+                locking(file.fileno(), LK_UNLCK, 1)
+
+
+class Settings:
+    """The settings in the config file, kept in memory. The file is checked for changes at most every
+    REVALIDATE_INTERVAL seconds, by comparing its modification time and size, and read again only if it has changed.
+
+    Changes are kept as pending until they are committed. A change is committed straight away unless it is made in an
+    edit(), which commits every change made in it at once, or it is to one of the DEBOUNCED options and a widget has
+    been given to debounce() them with"""
+
+    def __init__(self, path: str = CONFIG_FILE):
+        """
+
+        :param path: a str representing the location of the config file
+        """
+        self._path = path
+        self._parser: Union[ConfigParser, None] = None
+        self._stamp: Union[Tuple[int, int], None] = None
+        self._checked = 0.0
+        # Backups write from a worker thread
+        self._lock = RLock()
+        self._depth = 0
+        self._pending: Dict[Tuple[str, str], Union[str, None]] = {}
+        self._master: Union[Misc, None] = None
+        self._interval = DEBOUNCE_INTERVAL
+        self._timer = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def pending(self):
+        """A bool representing whether any changes have not been written yet"""
+        return bool(self._pending)
+
+    @property
+    def parser(self) -> ConfigParser:
+        """The loaded settings, with any pending changes, read again first if the file has changed since"""
+        with self._lock:
+            now = monotonic()
+            if self._parser is None or now - self._checked >= REVALIDATE_INTERVAL:
+                self._checked = now
+                if self._parser is None or self._read_stamp() != self._stamp:
+                    self.reload()
+            return self._parser
+
+    def reload(self):
+        """Reads the config file, creating it first if it does not exist. Pending changes are kept"""
+        with self._lock:
+            if not exists(self._path):
+                create_file(path=self._path)
+            parser = ConfigParser()
+            parser.read(self._path)
+            self._stamp = self._read_stamp()
+            self._apply(parser)
+            self._parser = parser
+            self._checked = monotonic()
+
+    def get(self, section: str, option: str, **kwargs) -> str:
+        return self.parser.get(section, option, **kwargs)
+
+    def getint(self, section: str, option: str, **kwargs) -> int:
+        return self.parser.getint(section, option, **kwargs)
+
+    def getfloat(self, section: str, option: str, **kwargs) -> float:
+        return self.parser.getfloat(section, option, **kwargs)
+
+    def getboolean(self, section: str, option: str, **kwargs) -> bool:
+        return self.parser.getboolean(section, option, **kwargs)
+
+    def getliteral(self, section: str, option: str):
+        """Gets an option written as a Python literal, e.g. a tuple"""
+        return literal_eval(self.parser.get(section, option))
+
+    def getpath(self, section: str, option: str) -> str:
+        return abspath(self.parser.get(section, option))
+
+    def options(self, section: str) -> Dict[str, str]:
+        """Gets every option in a section"""
+        return dict(self.parser.items(section))
+
+    def copy(self):
+        """Gets the settings as a new ConfigParser, which may be changed without changing these"""
+        parser = ConfigParser()
+        parser.read_dict(self.parser)
+        return parser
+
+    def set(self, section: str, option: str, value: str):
+        """Changes an option. It is written now, at the end of the edit() it is made in, or once it settles if it is
+        debounced"""
+        with self._lock:
+            if self.parser.get(section, option, fallback=None) == value:
+                return
+            self._parser.set(section, option, value)
+            self._pending[(section, option)] = value
+            self._changed((section, option))
+
+    def remove_option(self, section: str, option: str):
+        with self._lock:
+            if self.parser.remove_option(section, option):
+                self._pending[(section, option)] = None
+                self._changed((section, option))
+
+    @contextmanager
+    def edit(self):
+        """Groups changes, so they are written together in one write when the outermost edit closes:
+
+            with settings.edit() as s:
+                s.set('Backup', 'enabled', 'yes')
+                s.set('Backup', 'number of backups', '3')
+
+        If an exception is raised in the edit, none of its changes are made. Other threads wait for the edit to close
+        before they make changes of their own
+        """
+        with self._lock:
+            if not self._depth:
+                before = dict(self._pending)
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                # Nothing made in an edit that fails is written
+                if self._depth == 1:
+                    self._pending = before
+                    self._parser = None
+                raise
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    self.commit()
+
+    def debounce(self, master: Misc, interval: int = DEBOUNCE_INTERVAL):
+        """Writes changes to the DEBOUNCED options only once they have not changed for an interval
+
+        :param master: the widget whose event loop runs the writes, usually the main window
+        :param interval: an int representing the milliseconds an option must be left unchanged before it is written
+        """
+        self._master = master
+        self._interval = interval
+
+    def commit(self):
+        """Writes the pending changes. The file is locked, read again and the changes made to it, so changes written by
+        another instance in the meantime are kept, then it is replaced through a temporary file"""
+        with self._lock:
+            if not self._pending:
+                return
+            with _file_lock('{}.lock'.format(self._path)):
+                if not exists(self._path):
+                    create_file(path=self._path)
+                parser = ConfigParser()
+                parser.read(self._path)
+                self._apply(parser)
+                temporary = '{}.{}.tmp'.format(self._path, getpid())
+                with open(temporary, 'w') as f:
+                    parser.write(f)
+                replace(temporary, self._path)
+                self._stamp = self._read_stamp()
+            self._pending.clear()
+            self._parser = parser
+            self._checked = monotonic()
+
+    def _changed(self, key: Tuple[str, str]):
+        if self._depth:
+            return
+        if key in DEBOUNCED and self._master is not None and current_thread() is main_thread():
+            if self._timer is not None:
+                self._master.after_cancel(self._timer)
+            self._timer = self._master.after(self._interval, self._settled)
+        else:
+            self.commit()
+
+    def _settled(self):
+        self._timer = None
+        self.commit()
+
+    def _apply(self, parser: ConfigParser):
+        """Makes the pending changes to a parser"""
+        for (section, option), value in self._pending.items():
+            if value is None:
+                parser.remove_option(section, option)
+            else:
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                parser.set(section, option, value)
+
+    def _read_stamp(self):
+        try:
+            s = stat(self._path)
+        except FileNotFoundError:
+            return None
+        return s.st_mtime_ns, s.st_size
+
+
+settings = Settings()
+
+
+def debounce_writes(master: Misc, interval: int = DEBOUNCE_INTERVAL):
+    """Writes changes to the DEBOUNCED options of the settings once they settle. See Settings.debounce"""
+    settings.debounce(master, interval)
+
+
+def flush_settings():
+    """Writes any changes to the settings that are waiting, e.g. when the application closes"""
+    settings.commit()
+
+
 # TODO check that database settings point to correct locations
 def config(**options):
     """If options are supplied, attempts to edit those options in the file. Otherwise, gets and returns the options
@@ -63,24 +311,20 @@ def config(**options):
     """
     if options:
         keys = options.keys()
-        if 'enabled' in keys:
-            backup_enabled(options['enabled'])
-        if 'last backup' in keys:
-            last_backup(options['last backup'])
-        if 'backup interval' in keys:
-            backup_interval(options['backup interval'])
-        if 'number of backups' in keys:
-            number_of_backups(options['number of backups'])
-        if 'current database' in keys:
-            default_database(options['current database'])
-        if 'backup location' in keys:
-            backup_location(options['backup location'])
-    else:
-        if not exists('settings.config'):
-            create_file()
-    p = ConfigParser()
-    p.read('settings.config')
-    return p
+        with settings.edit():
+            if 'enabled' in keys:
+                backup_enabled(options['enabled'])
+            if 'last backup' in keys:
+                last_backup(options['last backup'])
+            if 'backup interval' in keys:
+                backup_interval(options['backup interval'])
+            if 'number of backups' in keys:
+                number_of_backups(options['number of backups'])
+            if 'current database' in keys:
+                default_database(options['current database'])
+            if 'backup location' in keys:
+                backup_location(options['backup location'])
+    return settings.copy()
 
 
 def backup_enabled(option: str = None):
@@ -89,18 +333,10 @@ def backup_enabled(option: str = None):
     :param option: a str: 'yes' indicates that backups are enabled, 'no' indicates disabled
     :return: a str indicating whether backups are enabled
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if option in ['yes', 'no']:
-        p['Backup']['enabled'] = option
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Backup', 'enabled', option)
     elif option is None:
-        v = p['Backup']['enabled']
-        return v
+        return settings.get('Backup', 'enabled')
 
 
 def last_backup(date: datetime = None):
@@ -109,17 +345,10 @@ def last_backup(date: datetime = None):
     :param date: a datetime indicating the last time a backup was performed
     :return: a str or datetime indicating the last time a backup was performed
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if type(date) == datetime:
-        p['Backup']['last backup'] = date.strftime('%Y-%m-%d %H:%M:%S')
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Backup', 'last backup', date.strftime('%Y-%m-%d %H:%M:%S'))
     elif date is None:
-        v = p['Backup']['last backup']
+        v = settings.get('Backup', 'last backup')
         if v == 'Never':
             return None
         else:
@@ -132,18 +361,10 @@ def backup_interval(interval: Union[float, int] = None):
     :param interval: an int indicating the number of hours between backups
     :return: an int indicating the number of hours between backups
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if type(interval) in [float, int]:
-        p['Backup']['backup interval'] = str(interval)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Backup', 'backup interval', str(interval))
     elif interval is None:
-        v = float(p['Backup']['backup interval'])
-        return v
+        return settings.getfloat('Backup', 'backup interval')
 
 
 def number_of_backups(number: int = None):
@@ -152,18 +373,10 @@ def number_of_backups(number: int = None):
     :param number: an int indicating the number of hours between backups
     :return: an int indicating the number of hours between backups
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if type(number) == int:
-        p['Backup']['number of backups'] = str(number)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Backup', 'number of backups', str(number))
     elif number is None:
-        v = int(p['Backup']['number of backups'])
-        return v
+        return settings.getint('Backup', 'number of backups')
 
 
 def default_database(path: str = None):
@@ -172,20 +385,13 @@ def default_database(path: str = None):
     :param path: a str indicating the location of the database
     :return: a str indicating the location of the database
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if path is None:
-        v = p['Filesystem']['default database']
-        return abspath(v)
+        return settings.getpath('Filesystem', 'default database')
     elif exists(path):
-        databases([path])
-        p.read('settings.config')
-        p['Filesystem']['default database'] = abspath(path)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        upgrade_database(path)
+        with settings.edit():
+            databases([path])
+            settings.set('Filesystem', 'default database', abspath(path))
     else:
         raise IOError('Not a valid path to a directory')
 
@@ -197,18 +403,10 @@ def backup_location(path: str = None):
     :param path: a str indicating the location of the database backups
     :return: a str indicating the location of the database backups
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if path is None:
-        v = p['Filesystem']['backup location']
-        return abspath(v)
+        return settings.getpath('Filesystem', 'backup location')
     elif exists(path) and isdir(path):
-        p['Filesystem']['backup location'] = abspath(path)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Filesystem', 'backup location', abspath(path))
     else:
         raise IOError('Not a valid path to a directory')
 
@@ -220,18 +418,10 @@ def imports_location(path: str = None):
     :param path: a str indicating the location of the database backups
     :return: a str indicating the location of the database backups
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if path is None:
-        v = p['Filesystem']['imports']
-        return abspath(v)
+        return settings.getpath('Filesystem', 'imports')
     elif exists(path) and isdir(path):
-        p['Filesystem']['imports'] = abspath(path)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Filesystem', 'imports', abspath(path))
     else:
         raise IOError('Not a valid path to a directory')
 
@@ -243,18 +433,10 @@ def autodelete_imports(value: bool = None):
     :param value: a str indicating the location of the database backups
     :return: a str indicating the location of the database backups
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if value is None:
-        v = p.getboolean('Filesystem', 'autodelete imports')
-        return v
+        return settings.getboolean('Filesystem', 'autodelete imports')
     else:
-        p['Filesystem']['imports'] = str(value)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Filesystem', 'imports', str(value))
 
 
 def exports_location(path: str = None):
@@ -264,18 +446,10 @@ def exports_location(path: str = None):
     :param path: a str indicating the location of the database backups
     :return: a str indicating the location of the database backups
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if path is None:
-        v = p['Filesystem']['exports']
-        return abspath(v)
+        return settings.getpath('Filesystem', 'exports')
     elif exists(path) and isdir(path):
-        p['Filesystem']['exports'] = abspath(path)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Filesystem', 'exports', abspath(path))
     else:
         raise IOError('Not a valid path to a directory')
 
@@ -287,26 +461,19 @@ def databases(added: List[str] = None, removed: List[str] = None):
     :param removed: a list of str indicating databases to be removed
     :return: a dict of databases and their paths
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if not added and not removed:
-        v = {x: p['Databases'][x] for x in p.options('Databases')}
-        return v
+        return settings.options('Databases')
     else:
-        if added:
-            for a in added:
-                if exists(a):
-                    p.set('Databases', basename(a).replace('.sqlite', ''), a)
-                else:
-                    raise IOError('Not a valid path to a database')
-        if removed:
-            for r in removed:
-                p.remove_option('Databases', basename(r).replace('.sqlite', ''))
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        with settings.edit():
+            if added:
+                for a in added:
+                    if exists(a):
+                        settings.set('Databases', basename(a).replace('.sqlite', ''), a)
+                    else:
+                        raise IOError('Not a valid path to a database')
+            if removed:
+                for r in removed:
+                    settings.remove_option('Databases', basename(r).replace('.sqlite', ''))
 
 
 def pages(whole: List = None, added: str = None, removed: str = None):
@@ -318,11 +485,7 @@ def pages(whole: List = None, added: str = None, removed: str = None):
     :param added: a str representing a tempfile to be added to the Journal
     :param removed:  a str representing a tempfile to be removed from the Journal
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
-    v: List = literal_eval(p.get('Notebook', 'pages'))
+    v: List = settings.getliteral('Notebook', 'pages')
     if not added and not removed and not whole:
         return v
     else:
@@ -330,21 +493,16 @@ def pages(whole: List = None, added: str = None, removed: str = None):
             if exists(added):
                 if added not in v:
                     v.append(added)
-                    p.set('Notebook', 'pages', str(v))
             else:
                 raise IOError('Not a valid path to a database')
         if removed:
             try:
                 v.remove(removed)
-                p.set('Notebook', 'pages', str(v))
             except ValueError:
                 pass
         if whole:
             v = whole
-            p.set('Notebook', 'pages', str(v))
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Notebook', 'pages', str(v))
 
 
 def current_page(page: str = None):
@@ -353,50 +511,42 @@ def current_page(page: str = None):
     :param page: a str representing a page
     :return: a str representing the page that was most previously displayed
     """
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if not page:
-        return p.get('Notebook', 'current')
+        return settings.get('Notebook', 'current')
     else:
-        p.set('Notebook', 'current', page)
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Notebook', 'current', page)
+
+
+def prefetch_pages(value: bool = None):
+    """If value is supplied, edits whether saved pages are built in the background. Otherwise, returns the field
+
+    :param value: a bool indicating whether the pages that are not on show are built one at a time when the application
+    is idle
+    :return: a bool indicating whether the pages are built in the background, False if the field is missing
+    """
+    if value is None:
+        return settings.getboolean('Notebook', 'prefetch pages', fallback=False)
+    else:
+        settings.set('Notebook', 'prefetch pages', str(value))
 
 
 def dimensions(dims: tuple = None):
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if not dims:
         try:
-            d = literal_eval(p.get('Visual', 'dimensions'))
+            d = settings.getliteral('Visual', 'dimensions')
         except SyntaxError:
             d = ()
         return d
     else:
-        p.set('Visual', 'dimensions', str(dims))
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Visual', 'dimensions', str(dims))
 
 
 def color_scheme(colors: tuple = None):
-    if not exists('settings.config'):
-        create_file()
-    p = ConfigParser()
-    p.read('settings.config')
     if not colors:
         try:
-            d = literal_eval(p.get('Visual', 'theme'))
+            d = settings.getliteral('Visual', 'theme')
         except SyntaxError:
             d = ('dark', 'green')
         return d
     else:
-        p.set('Visual', 'dimensions', str(colors))
-        with open('settings.config', 'w') as f:
-            p.write(f)
-            f.close()
+        settings.set('Visual', 'theme', str(colors))
@@ -1,8 +1,12 @@
 """Functions for creating and manipulating the journal database"""
 from sqlite3 import connect
 
+from entry_metrics import backfill_metrics, create_table, SCHEMA
+
+# Stored in PRAGMA user_version once a database has been upgraded, so databases that are up to date are not scanned
+SCHEMA_VERSION = 1
+
 
-# TODO add "last_access" to dates
 def create_database(database: str) -> None:
     file = open(database, 'w+')
     file.close()
@@ -19,4 +23,50 @@ def create_database(database: str) -> None:
                    'FOREIGN KEY(parent) REFERENCES bodies(entry_id))')
     cursor.execute('CREATE TABLE tags(tag_id INTEGER PRIMARY KEY, entry_id INTEGER NOT NULL, tag TEXT '
                    'DEFAULT \'(UNTAGGED)\', FOREIGN KEY(entry_id) REFERENCES bodies(entry_id))')
+    cursor.execute('CREATE TABLE ' + SCHEMA)
+    cursor.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+    connection.close()
+    create_indexes(database)
+
+
+def upgrade_database(database: str) -> bool:
+    """Brings a database created by an older version up to date: adds the entry_metrics table, measures the entries
+    that have no metrics, and adds the indexes. Databases whose user_version shows they are up to date are left
+    untouched without being scanned. Called once when a database is opened at startup or selected, rather than each
+    time a filter is made
+
+    :param database: a str representing the location of the database
+    :return: True if the database was changed, or False if it was already up to date
+    """
+    connection = connect(database=database)
+    if connection.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        connection.close()
+        return False
+    create_table(connection)
+    backfill_metrics(connection)
+    connection.commit()
+    connection.close()
+    create_indexes(database)
+    # The version is recorded last, so an upgrade that is cut short is run again on the next start
+    connection = connect(database=database)
+    connection.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+    connection.close()
+    return True
+
+
+def create_indexes(database: str) -> None:
+    """Adds the indexes used by the filter queries. Safe to call on databases that already have them
+
+    :param database: a str representing the location of the database
+    """
+    connection = connect(database=database)
+    cursor = connection.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS dates_created ON dates(created, entry_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS dates_entry_id ON dates(entry_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag, entry_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS tags_entry_id ON tags(entry_id, tag)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS attachments_entry_id ON attachments(entry_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS relations_child ON relations(child)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS relations_parent ON relations(parent)')
+    connection.commit()
     connection.close()
@@ -14,10 +14,29 @@ def get_all_entry_ids(database: str = None):
     """
     db = connect(database) if database else connect(default_database())
     with closing(db) as d:
-        t = d.execute('SELECT entry_id FROM dates ORDER BY created').fetchall()
+        t = d.execute('SELECT entry_id FROM dates ORDER BY created, entry_id').fetchall()
         return [x[0] for x in t]
 
 
+def get_change_counter(database: str = None):
+    """Reads the file change counter from the header of the database. The counter is incremented by SQLite every time
+    a transaction modifies the file, so it can be compared against a previous value to detect changes
+
+    :rtype: int
+    :param database: a str representing the database that is being queried
+    :return: an int representing the state of the database file
+    """
+    path = database if database else default_database()
+    try:
+        with open(path, 'rb') as file:
+            file.seek(24)
+            header = file.read(4)
+            file.close()
+    except FileNotFoundError:
+        return 0
+    return int.from_bytes(header, 'big') if len(header) == 4 else 0
+
+
 def get_all_tags(database: str = None):
     """Gets all tags in the database
 
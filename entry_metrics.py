@@ -0,0 +1,126 @@
+"""Functions for the entry_metrics table, which holds statistics about the body of each entry so that sorting and the
+statistics views never have to read the bodies themselves"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count
+from sqlite3 import Connection, OperationalError, connect
+from typing import Tuple, List
+
+METRICS = ('chars', 'words', 'lines', 'avg_word_len', 'reading_time')
+SCHEMA = 'entry_metrics(entry_id INTEGER PRIMARY KEY, chars INTEGER NOT NULL, words INTEGER NOT NULL, ' \
+         'lines INTEGER NOT NULL, avg_word_len REAL NOT NULL, reading_time REAL NOT NULL, ' \
+         'FOREIGN KEY(entry_id) REFERENCES bodies(entry_id))'
+WORDS_PER_MINUTE = 200
+
+# Journals with fewer entries than this are measured in the calling process, where starting workers would cost more
+# than it saves
+_POOL_THRESHOLD = 20000
+_BATCH = 2000
+
+
+def measure(body: str):
+    """Computes the metrics of a body
+
+    :param body: a str representing the content of an entry
+    :return: a tuple of the number of characters, words, and lines, the average word length, and the reading time in
+    seconds
+    :rtype: Tuple[int, int, int, float, float]
+    """
+    words = body.split()
+    avg_word_len = sum(map(len, words)) / len(words) if words else 0.0
+    lines = body.count('\n') + 1 if body else 0
+    return len(body), len(words), lines, avg_word_len, 60 * len(words) / WORDS_PER_MINUTE
+
+
+def _measure_rows(rows: List[Tuple[int, str]]):
+    return [(entry_id, *measure(body or '')) for entry_id, body in rows]
+
+
+def create_table(connection: Connection):
+    """Adds the entry_metrics table if the database does not have an up to date one. An outdated table is dropped, as
+    the metrics are derived from the bodies and are measured again by backfill_metrics
+
+    :param connection: a Connection to the database that is being modified
+    """
+    columns = [x[1] for x in connection.execute('PRAGMA table_info(entry_metrics)').fetchall()]
+    if columns and not set(METRICS).issubset(columns):
+        connection.execute('DROP TABLE entry_metrics')
+    connection.execute('CREATE TABLE IF NOT EXISTS ' + SCHEMA)
+
+
+def store_metrics(connection: Connection, entry_id: int, body: str):
+    """Writes the metrics of an entry using an open connection, so they are committed along with the body. Databases
+    that have not been upgraded yet are given the table here, and the other entries are measured by the upgrade
+
+    :param connection: a Connection to the database that is being modified
+    :param entry_id: an int representing the entry
+    :param body: a str representing the content of the entry, as it was stored
+    """
+    insert = 'INSERT OR REPLACE INTO entry_metrics(entry_id, {}) VALUES(?,?,?,?,?,?)'.format(', '.join(METRICS))
+    try:
+        connection.execute(insert, (entry_id, *measure(body)))
+    except OperationalError:
+        create_table(connection)
+        connection.execute(insert, (entry_id, *measure(body)))
+
+
+def delete_metrics(connection: Connection, entry_id: int):
+    """Removes the metrics of an entry using an open connection, so they are committed along with the deletion
+
+    :param connection: a Connection to the database that is being modified
+    :param entry_id: an int representing the entry
+    """
+    try:
+        connection.execute('DELETE FROM entry_metrics WHERE entry_id=?', (entry_id,))
+    except OperationalError:
+        # Databases that have not been upgraded yet have no metrics to remove
+        pass
+
+
+def backfill_metrics(connection: Connection, workers: int = None):
+    """Computes the metrics of every entry that does not have them yet. Bodies are read and written in batches, and
+    large journals are measured in a pool of worker processes
+
+    :param connection: a Connection to the database that is being modified
+    :param workers: an int representing the number of worker processes, or None for one per CPU
+    :return: an int representing the number of entries that were measured
+    """
+    missing = 'FROM bodies WHERE entry_id NOT IN (SELECT entry_id FROM entry_metrics)'
+    count = connection.execute('SELECT COUNT(*) ' + missing).fetchone()[0]
+    if not count:
+        return 0
+    # Entries that are saved while the bodies are measured keep the metrics they were saved with
+    insert = 'INSERT OR IGNORE INTO entry_metrics(entry_id, {}) VALUES(?,?,?,?,?,?)'.format(', '.join(METRICS))
+    # Every batch is measured before any row is written, as the query reading the bodies also reads entry_metrics
+    cursor = connection.execute('SELECT entry_id, body ' + missing)
+    batches = iter(lambda: cursor.fetchmany(_BATCH), [])
+    workers = workers if workers else cpu_count() or 1
+    if count < _POOL_THRESHOLD or workers < 2:
+        results = list(map(_measure_rows, batches))
+    else:
+        # Spawned workers do not inherit the application's Tk state, as forked ones would
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            results = list(pool.map(_measure_rows, batches))
+    for rows in results:
+        connection.executemany(insert, rows)
+    return count
+
+
+def _backfill(database: str, workers: int = None):
+    """Measures the entries of a journal from the command line, e.g. python entry_metrics.py journal.sqlite"""
+    from time import perf_counter
+
+    from database import upgrade_database
+
+    upgrade_database(database)
+    start = perf_counter()
+    with connect(database) as d:
+        d.execute('DELETE FROM entry_metrics')
+        count = backfill_metrics(d, workers)
+    print('Measured {} entries in {:.2f} s'.format(count, perf_counter() - start))
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    _backfill(argv[1], int(argv[2]) if len(argv) > 2 else None)
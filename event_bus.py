@@ -0,0 +1,386 @@
+"""Coalesces the virtual events of a page. One user action often fires several events in a row, e.g. a filter change
+fires <<Filter Attributes Changed>> and <<Tempfile Updated>>, and the selected entry may be reset along the way. The
+bus marks the topics those events affect and calls each subscriber once on the next idle tick, passing a snapshot
+whose values are read from the database at most once however many subscribers use them. Given a WorkerPool, the bus
+reads the snapshot on a worker thread and delivers it when it is ready"""
+from contextlib import contextmanager
+from datetime import datetime
+from tkinter import Misc
+from typing import Callable, Dict, Tuple, Set, Any, List
+
+from database_info import get_change_counter
+from modules import ReaderModule, WriterModule
+from reader_functions import get_body, get_tags, get_metrics, get_attachment_ids, get_parent, get_children
+from workers import WorkerPool, worker_filter
+
+READER_EVENTS = {'<<Filter Attributes Changed>>': ('ids',),
+                 '<<Tempfile Updated>>': ('ids', 'entry'),
+                 '<<Id Selected>>': ('entry',)}
+WRITER_EVENTS = {'<<Writer Changed>>': ('body',)}
+# The number of rows of the list of dates read at a time
+PAGE = 100
+
+
+class _Snapshot:
+    """Reads each value the first time a subscriber asks for it and keeps it for the rest of the flush"""
+
+    # The values each topic's subscribers read, so they can all be loaded on a worker thread
+    VALUES: Dict[str, Tuple[str, ...]] = {}
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+
+    def _get(self, name: str, getter: Callable[[], Any]):
+        if name not in self._values:
+            self._values[name] = getter()
+        return self._values[name]
+
+    def prepare(self, topics: Set[str]):
+        """Settles the snapshot before anything is read, possibly adding topics"""
+        pass
+
+    def load(self, topics: Set[str]):
+        """Prepares the snapshot and reads every value the topics need. Called on a worker thread"""
+        self.prepare(topics)
+        for topic in topics:
+            for name in self.VALUES.get(topic, ()):
+                getattr(self, name)
+        return self
+
+    def apply(self):
+        """Carries out any change the snapshot made while it was prepared. Called on the Tk thread before delivery"""
+        pass
+
+    def values(self):
+        """A dict of every value read so far"""
+        return dict(self._values)
+
+
+class ReaderSnapshot(_Snapshot):
+    VALUES = {'ids': ('position', 'first', 'rows', 'count', 'total', 'words', 'reading_time'),
+              'entry': ('body', 'tags', 'metrics', 'has_attachments', 'has_parent', 'has_children')}
+
+    def __init__(self, reader: ReaderModule):
+        super(ReaderSnapshot, self).__init__()
+
+        self._reader = reader
+        self._filter = reader.filter
+        # The settings and selection are captured on the Tk thread, so a worker never reads the tempfile
+        self._settings = reader.filter_settings
+        self._database = reader.database
+        self._id = reader.id_
+        self._deselected = False
+
+    @classmethod
+    def restored(cls, reader: ReaderModule, values: Dict[str, Any]):
+        """Makes a snapshot of values that were saved earlier, e.g. when the application last closed"""
+        snapshot = cls(reader)
+        snapshot._values.update(values)
+        return snapshot
+
+    def prepare(self, topics: Set[str]):
+        """Deselects the entry if it has been filtered out"""
+        # Read before anything else, so a change made while the snapshot loads makes it out of date
+        self.version
+        if 'ids' in topics and self._id and self.position is None:
+            self._id = 0
+            self._deselected = True
+            topics.add('entry')
+
+    def load(self, topics: Set[str]):
+        # Read with the worker's own Filter, which is left out of the snapshot once it is loaded
+        self._filter = worker_filter(self._database, self._settings)
+        try:
+            return super(ReaderSnapshot, self).load(topics)
+        finally:
+            self._filter = self._reader.filter
+
+    def _get(self, name: str, getter: Callable[[], Any]):
+        # The change counter is read once for the snapshot and every value is read against that version
+        if name == 'version' or name in self._values:
+            return super(ReaderSnapshot, self)._get(name, getter)
+        with self._filter.pinned(self.version):
+            return super(ReaderSnapshot, self)._get(name, getter)
+
+    def apply(self):
+        if self._deselected:
+            self._reader.id_ = 0
+
+    @contextmanager
+    def _reading(self):
+        """Gives the calling thread's Filter, set to the snapshot's settings and pinned to its version"""
+        f = worker_filter(self._database, self._settings)
+        with f.pinned(self.version):
+            yield f
+
+    def page(self, after: Tuple[datetime, int] = None, before: Tuple[datetime, int] = None, limit: int = PAGE):
+        """Reads the rows next to rows that are already shown, as in Filter.page. Called on a worker thread"""
+        with self._reading() as f:
+            return f.page(after, before, limit)
+
+    def seek(self, position: int, limit: int = PAGE):
+        """Reads the rows starting at a position, as in Filter.seek. Called on a worker thread"""
+        with self._reading() as f:
+            return f.seek(position, limit)
+
+    def count_dates(self, dates: Dict[str, int], date_filter: int):
+        """Counts the entries a date filter would let through alongside the other filters, as in Filter.count_dates.
+        Called on a worker thread"""
+        with self._reading() as f:
+            return f.count_dates(dates, date_filter)
+
+    def date_histograms(self, parts: Tuple[str, ...]):
+        """Counts the entries let through by the filters other than the dates by each value of some date parts, as in
+        Filter.date_histogram. Called on a worker thread
+
+        :rtype: Dict[str, Dict[int, int]]
+        """
+        with self._reading() as f:
+            return {part: f.date_histogram(part) for part in parts}
+
+    @property
+    def reader(self):
+        return self._reader
+
+    @property
+    def database(self):
+        return self._database
+
+    @property
+    def settings(self):
+        return self._settings
+
+    @property
+    def version(self):
+        """The change counter of the database when the snapshot was read"""
+        return self._get('version', lambda: get_change_counter(self._database))
+
+    @property
+    def position(self):
+        """Where the selected entry is among the filtered entries, or None if it is filtered out or none is selected"""
+        return self._get('position', lambda: self._filter.position(self._id) if self._id else None)
+
+    @property
+    def first(self):
+        """The position of the first of the rows read with the snapshot, chosen so the selected entry is among them"""
+        return self._get('first', lambda: max((self.position or 0) - PAGE // 2, 0))
+
+    @property
+    def rows(self):
+        """The creation date and id of a page of the filtered entries, starting at first. The rest are read as they
+        come into view
+
+        :rtype: Tuple[Tuple[datetime, int]]
+        """
+        return self._get('rows', lambda: self._filter.seek(self.first, PAGE))
+
+    @property
+    def count(self):
+        return self._get('count', lambda: self._filter.count())
+
+    @property
+    def total(self):
+        return self._get('total', lambda: self._filter.total())
+
+    @property
+    def words(self):
+        return self._get('words', lambda: self._filter.metric_sum('words'))
+
+    @property
+    def reading_time(self):
+        return self._get('reading_time', lambda: self._filter.metric_sum('reading_time'))
+
+    @property
+    def id_(self):
+        return self._id
+
+    @property
+    def body(self):
+        return self._get('body', lambda: get_body(self._id, self._database) if self._id else '')
+
+    @property
+    def tags(self):
+        return self._get('tags', lambda: get_tags(self._id, self._database) if self._id else ())
+
+    @property
+    def metrics(self):
+        return self._get('metrics', lambda: get_metrics(self._id, self._database) if self._id else None)
+
+    @property
+    def has_attachments(self):
+        return self._get('has_attachments', lambda: bool(self._id and get_attachment_ids(self._id, self._database)))
+
+    @property
+    def has_parent(self):
+        return self._get('has_parent', lambda: bool(self._id and get_parent(self._id, self._database)))
+
+    @property
+    def has_children(self):
+        return self._get('has_children', lambda: bool(self._id and get_children(self._id, self._database)))
+
+
+class WriterSnapshot(_Snapshot):
+    def __init__(self, writer: WriterModule):
+        super(WriterSnapshot, self).__init__()
+
+        self._writer = writer
+
+    @property
+    def writer(self):
+        return self._writer
+
+    @property
+    def body(self):
+        return self._get('body', lambda: self._writer.body)
+
+
+class PageBus:
+    """Collects the topics invalidated by a page's events and delivers them together on the next idle tick. Topics are
+    delivered in the order they first appear in the events, so e.g. the ids of a Reader are updated before its entry"""
+
+    def __init__(self, master: Misc, bind_tag: str, events: Dict[str, Tuple[str, ...]],
+                 snapshot: Callable[[], _Snapshot], pool: WorkerPool = None):
+        """
+
+        :param master: the widget whose event loop runs the flushes, usually the page
+        :param bind_tag: the bind tag of the page, whose events are coalesced along with those of its popups
+        :param events: a dict of each event name and the topics it invalidates
+        :param snapshot: a callable that returns the snapshot passed to subscribers. It is called on the Tk thread
+        :param pool: a WorkerPool that loads the snapshots, or None to load them on the Tk thread
+        """
+        self._master = master
+        self._key = ('bus', bind_tag)
+        self._snapshot = snapshot
+        self._pool = pool
+        self._subscribers: Dict[str, List[Callable[[_Snapshot], Any]]] = {t: [] for ts in events.values() for t in ts}
+        self._busy_listeners: Dict[str, List[Callable[[bool], Any]]] = {t: [] for t in self._subscribers}
+        self._progress_listeners: Dict[str, List[Callable[[Any], Any]]] = {t: [] for t in self._subscribers}
+        self._dirty: Set[str] = set()
+        self._loading: Set[str] = set()
+        self._latest: Dict[str, _Snapshot] = {}
+        self._scheduled = None
+
+        for tag in bind_tag, 'Child.{}'.format(bind_tag):
+            for event, topics in events.items():
+                master.bind_class(tag, event, lambda e, t=topics: self.invalidate(*t), add=True)
+
+    def subscribe(self, topic: str, callback: Callable[[_Snapshot], Any]):
+        """Calls a callable with a snapshot whenever a topic is invalidated, starting with the next flush"""
+        self._subscribers[topic].append(callback)
+        self.invalidate(topic)
+
+    def add_busy_listener(self, topic: str, callback: Callable[[bool], Any]):
+        """Calls a callable with True when a topic starts loading on a worker and with False when it is delivered"""
+        self._busy_listeners[topic].append(callback)
+
+    def add_progress_listener(self, topic: str, callback: Callable[[Any], Any]):
+        """Calls a callable with the partial results reported while a topic loads, e.g. the matches found so far"""
+        self._progress_listeners[topic].append(callback)
+
+    def latest(self, topic: str):
+        """Gets the snapshot a topic was last delivered with, or None"""
+        return self._latest.get(topic)
+
+    def current(self, topics: Tuple[str, ...], version: int):
+        """Checks whether the topics were last delivered with a snapshot read at a version of the database, e.g. so a
+        page that was restored is not loaded again when nothing has changed since. Topics waiting to load are not"""
+        if self._dirty.intersection(topics) or self._loading.intersection(topics):
+            return False
+        return all(getattr(self._latest.get(t), 'version', None) == version for t in topics)
+
+    def restore(self, topics: Tuple[str, ...], snapshot: _Snapshot):
+        """Delivers a snapshot that was saved earlier straight away, in place of loading the topics"""
+        if self._loading:
+            self._pool.cancel(self._key)
+            self._set_busy(self._loading, False)
+            self._loading = set()
+        self._dirty.difference_update(topics)
+        self._publish(set(topics), snapshot)
+
+    def fetch(self, name: str, function: Callable, *args, callback: Callable[[Any], Any]):
+        """Reads something a subscriber needs besides the snapshot, e.g. the rows coming into view, on a worker thread.
+        A newer fetch with the same name supersedes an older one
+
+        :param name: a str naming what is read
+        :param function: the callable to run, usually a method of a snapshot. It must not touch any widget
+        :param callback: a callable that is given the result on the Tk thread
+        """
+        if self._pool is None:
+            self._master.after_idle(lambda: callback(function(*args)))
+        else:
+            self._pool.submit(self._key + (name,), function, *args, callback=callback)
+
+    def cancel(self, name: str):
+        """Stops a fetch that is in flight, e.g. when the widget that asked for it is closed"""
+        if self._pool is not None:
+            self._pool.cancel(self._key + (name,))
+
+    def invalidate(self, *topics: str):
+        # A load in flight is stopped straight away, even in the middle of a query, and is redone by the next flush
+        if self._loading:
+            self._pool.cancel(self._key)
+        self._dirty.update(topics)
+        if self._scheduled is None:
+            self._scheduled = self._master.after_idle(self.flush)
+
+    def flush(self):
+        """Delivers the invalidated topics now rather than on the next idle tick"""
+        if self._scheduled is not None:
+            self._master.after_cancel(self._scheduled)
+            self._scheduled = None
+        if not self._dirty:
+            return
+        if self._pool is None:
+            topics, self._dirty = self._dirty, set()
+            snapshot = self._snapshot()
+            snapshot.prepare(topics)
+            self._deliver(topics, snapshot)
+            return
+        # A load still in flight is superseded, so its topics are loaded again along with the new ones
+        topics = self._dirty | self._loading
+        self._dirty = set()
+        self._set_busy(topics.difference(self._loading), True)
+        self._loading = set(topics)
+        self._pool.submit(self._key, self._snapshot().load, topics,
+                          callback=lambda s: self._deliver(topics, s),
+                          errback=lambda e: self._fail(topics, e),
+                          on_partial=self._report)
+
+    def _deliver(self, topics: Set[str], snapshot: _Snapshot):
+        self._set_busy(self._loading, False)
+        self._loading = set()
+        snapshot.apply()
+        self._publish(topics, snapshot)
+
+    def _publish(self, topics: Set[str], snapshot: _Snapshot):
+        for topic, callbacks in self._subscribers.items():
+            if topic in topics:
+                self._latest[topic] = snapshot
+                for callback in callbacks:
+                    callback(snapshot)
+
+    def _fail(self, topics: Set[str], error: Exception):
+        self._set_busy(self._loading, False)
+        self._loading = set()
+        # The pool reports it through report_callback_exception and goes on delivering the results of other requests
+        raise error
+
+    def _report(self, partial: Any):
+        for topic in self._loading:
+            for callback in self._progress_listeners.get(topic, ()):
+                callback(partial)
+
+    def _set_busy(self, topics: Set[str], busy: bool):
+        for topic in topics:
+            for callback in self._busy_listeners.get(topic, ()):
+                callback(busy)
+
+
+def reader_bus(master: Misc, reader: ReaderModule, bind_tag: str, pool: WorkerPool = None):
+    """Makes the bus of a Reader page. When the filter changes and the selected entry is no longer in it, the selection
+    is cleared before anything is delivered"""
+    return PageBus(master, bind_tag, READER_EVENTS, lambda: ReaderSnapshot(reader), pool)
+
+
+def writer_bus(master: Misc, writer: WriterModule, bind_tag: str):
+    return PageBus(master, bind_tag, WRITER_EVENTS, lambda: WriterSnapshot(writer))
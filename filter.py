@@ -1,14 +1,24 @@
 """Contains the classes and functions that allow for switch-type manipulation of filters"""
-from contextlib import closing
+from contextlib import closing, contextmanager
 from datetime import datetime
 from os.path import abspath
 from sqlite3 import connect
-from typing import Union, Tuple, Dict
+from typing import Union, Tuple, Dict, List
 
+from bitmap_index import BitmapIndex, get_index, popcount, SORT_KEYS
 from configurations import default_database
-from database_info import get_all_entry_ids, get_oldest_date, get_newest_date, get_all_tags, \
-    get_all_children, get_all_parents
-from reader_functions import get_tags, get_date
+from query_runner import execute
+from result_cache import results
+from session import access_version
+from filter_query import parse, optimize, evaluate, to_clause
+from database_info import get_oldest_date, get_newest_date, get_all_tags, get_change_counter
+from tag_query import tag_clause, tagged_ids, any_of_clause, UNTAGGED
+
+CRITERIA = ('tags', 'attachments', 'body', 'dates', 'child', 'parent', 'query')
+# The properties that can be passed to Filter.update, in the order they are applied. The date filter type comes before
+# the dates because the dates setter checks the days against the months for continuous ranges
+SETTINGS = ('date_filter', 'dates', 'tag_filter', 'tags', 'is_untagged', 'has_attachments', 'has_parent',
+            'has_children', 'body', 'query', 'sort')
 
 
 def _leap_year(year: int):
@@ -28,6 +38,116 @@ def check_day_against_month(day: int, month: int, year: int = None):
     return day
 
 
+def _year_bounds(intervals: Dict[str, int], database: str = None):
+    """Gets the year bounds of a date filter, falling back on the range of the database when they are missing"""
+    l_year = intervals['low year'] if 'low year' in intervals else get_oldest_date(database).year
+    h_year = intervals['high year'] if 'high year' in intervals else get_newest_date(database).year
+    return l_year, h_year
+
+
+def continuous_range_bounds(intervals: Dict[str, int], database: str = None):
+    """Gets the first and last moments of a continuous date filter
+
+    :param intervals: a dict of the 'low' and 'high' values for the year, month, day, hour, and minute of the range
+    :param database: a str representing the location of the database that is being queried
+    :return: a tuple of the datetimes bounding the range
+    :rtype: Tuple[datetime, datetime]
+    """
+    l_year, h_year = _year_bounds(intervals, database)
+    lower = datetime(int(l_year), int(intervals.get('low month', 1)), int(intervals.get('low day', 1)),
+                     int(intervals.get('low hour', 0)), int(intervals.get('low minute', 0)), 0, 0)
+    upper = datetime(int(h_year), int(intervals.get('high month', 12)), int(intervals.get('high day', 31)),
+                     int(intervals.get('high hour', 23)), int(intervals.get('high minute', 59)), 59, 999999)
+    return lower, upper
+
+
+def interval_bounds(intervals: Dict[str, int], database: str = None):
+    """Gets the low and high values of each date part of an interval filter
+
+    :param intervals: a dict of the 'low' and 'high' values for the year, month, day, hour, minute, and weekday
+    :param database: a str representing the location of the database that is being queried
+    :return: a dict of the date parts and their bounds
+    :rtype: Dict[str, Tuple[int, int]]
+    """
+    bounds = {'year': _year_bounds(intervals, database)}
+    for part, low, high in [('month', 1, 12), ('day', 1, 31), ('hour', 0, 23), ('minute', 0, 59), ('weekday', 0, 6)]:
+        bounds[part] = int(intervals.get('low ' + part, low)), int(intervals.get('high ' + part, high))
+    return bounds
+
+
+def continuous_range_clause(intervals: Dict[str, int], database: str = None):
+    """Builds the WHERE clause matching entries that were created over a given range of time
+
+    :param intervals: a dict of the 'low' and 'high' values for the year, month, day, hour, and minute of the range
+    :param database: a str representing the location of the database that is being queried
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    return 'created BETWEEN ? AND ?', list(continuous_range_bounds(intervals, database))
+
+
+def intervals_clause(intervals: Dict[str, int], database: str = None):
+    """Builds the WHERE clause matching entries whose date parts each fall within a given interval
+
+    :param intervals: a dict of the 'low' and 'high' values for the year, month, day, hour, minute, and weekday
+    :param database: a str representing the location of the database that is being queried
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    bounds = interval_bounds(intervals, database)
+    t = '{:02d}'
+    params = [str(bounds['year'][0]), str(bounds['year'][1])]
+    for part in ['month', 'day', 'hour', 'minute']:
+        params += [t.format(bounds[part][0]), t.format(bounds[part][1])]
+    params += [str(bounds['weekday'][0]), str(bounds['weekday'][1])]
+    sql = '(strftime(\'%Y\', created) BETWEEN ? AND ?) AND (strftime(\'%m\', created) BETWEEN ? AND ?) AND ' \
+          '(strftime(\'%d\', created) BETWEEN ? AND ?) AND (strftime(\'%H\', created) BETWEEN ? AND ?) AND ' \
+          '(strftime(\'%M\', created) BETWEEN ? AND ?) AND (strftime(\'%w\', created) BETWEEN ? AND ?)'
+    return sql, params
+
+
+def tags_clause(tags: tuple, op_type: int = 0):
+    """Builds the WHERE clause matching entries that satisfy a tag filter
+
+    :param tags: a tuple of strings representing the tags to be used for filtering entries from the database
+    :param op_type: an int: '0' for 'Contains One Of', '1' for 'Contains At Least, '2' for 'Contains Only'
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    if op_type == 'Untagged':
+        return any_of_clause((UNTAGGED,))
+    return tag_clause(tags, op_type)
+
+
+def body_clause(search_string: str):
+    """Builds the WHERE clause matching entries that contain a given search string
+
+    :param search_string: a str which the body of the entry must contain
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    return 'entry_id IN (SELECT entry_id FROM bodies WHERE body LIKE ?)', ['%' + search_string.lower() + '%']
+
+
+def compile_query(clauses: List[Tuple[str, list]], order: str = 'created, entry_id'):
+    """Joins a collection of WHERE clauses into a single SELECT over the dates table
+
+    :param clauses: a list of tuples, each holding the SQL of a clause and its parameters
+    :param order: a str representing the ORDER BY expression of the query
+    :return: a tuple of the SQL query and its parameters
+    :rtype: Tuple[str, list]
+    """
+    sql = 'SELECT entry_id FROM dates'
+    params = []
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join('({})'.format(c[0]) for c in clauses)
+        for clause in clauses:
+            params += clause[1]
+    if order:
+        sql += ' ORDER BY ' + order
+    return sql, params
+
+
 def from_continuous_range(intervals: Dict[str, int], database: str = None):
     """Filters the database for entries that were created over a given range of time
 
@@ -38,52 +158,14 @@ def from_continuous_range(intervals: Dict[str, int], database: str = None):
     """
     db = connect(database) if database else connect(default_database())
     with closing(db) as d:
-        l_year = intervals.get('low year', get_oldest_date(database))
-        h_year = intervals.get('high year', get_newest_date(database))
-        l_month = intervals.get('low month', 1)
-        h_month = intervals.get('high month', 12)
-        l_day = intervals.get('low day', 1)
-        h_day = intervals.get('high day', 31)
-        l_hour = intervals.get('low hour', 0)
-        h_hour = intervals.get('high hour', 23)
-        l_minute = intervals.get('low minute', 0)
-        h_minute = intervals.get('high minute', 59)
-        l_second = 0
-        h_second = 59
-        l_microsecond = 0
-        h_microsecond = 999999
-        lower = datetime(l_year, l_month, l_day, l_hour, l_minute, l_second, l_microsecond)
-        upper = datetime(h_year, h_month, h_day, h_hour, h_minute, h_second, h_microsecond)
-        c = d.execute('SELECT entry_id FROM dates WHERE created BETWEEN ? AND ?', (lower, upper)).fetchall()
+        c = d.execute(*compile_query([continuous_range_clause(intervals, database)], '')).fetchall()
         return [x[0] for x in c]
 
 
 def from_intervals(intervals: Dict[str, int], database: str = None):
     db = connect(database) if database else connect(default_database())
     with closing(db) as d:
-        l_year = intervals.get('low year', get_oldest_date(database).year)
-        h_year = intervals.get('high year', get_newest_date(database).year)
-        l_month = intervals.get('low month', 1)
-        h_month = intervals.get('high month', 12)
-        l_day = intervals.get('low day', 1)
-        h_day = intervals.get('high day', 31)
-        l_hour = intervals.get('low hour', 0)
-        h_hour = intervals.get('high hour', 23)
-        l_minute = intervals.get('low minute', 0)
-        h_minute = intervals.get('high minute', 59)
-        l_weekday = intervals.get('low weekday', 0)
-        h_weekday = intervals.get('high weekday', 6)
-        t = '{:02d}'
-        f = '{:09.6f}'
-        c = d.execute('SELECT entry_id FROM dates WHERE (strftime("%Y", created) BETWEEN ? AND ?) AND '
-                      '(strftime("%m", created) BETWEEN ? AND ?) AND (strftime("%d", created) BETWEEN ? AND ?) AND '
-                      '(strftime("%H", created) BETWEEN ? AND ?) AND (strftime("%M", created) BETWEEN ? AND ?) AND '
-                      '(strftime("%w", created) BETWEEN ? AND ?)',
-                      (str(l_year), str(h_year), t.format(l_month), t.format(h_month), t.format(l_day), t.format(h_day),
-                       t.format(l_hour), t.format(h_hour), f.format(l_minute), f.format(h_minute), str(l_weekday),
-                       str(h_weekday)
-                       )
-                      )
+        c = d.execute(*compile_query([intervals_clause(intervals, database)], '')).fetchall()
         return [x[0] for x in c]
 
 
@@ -96,30 +178,9 @@ def from_tags(tags: tuple, database: str = None, op_type: int = 0):
     :param op_type: an int: '0' for 'Contains One Of', '1' for 'Contains At Least, '2' for 'Contains Only'
     :return: a tuple of ints representing the filtered entries
     """
-    db = connect(database) if database else connect(default_database())
-    with closing(db) as d:
-        ids = []
-        if op_type == 1:
-            if tags:
-                tags = list(tags)
-                tag = tags.pop(0)
-                sql = 'SELECT entry_id FROM tags WHERE tag=?'
-                temp = set(d.execute(sql, (tag,)).fetchall())
-                for tag in tags:
-                    temp = temp.intersection(d.execute(sql, (tag,)).fetchall())
-                ids = [i[0] for i in temp]
-        if op_type == 2:
-            for entry in get_all_entry_ids(database):
-                if len(get_tags(entry, database)) == len(tags):
-                    if set(get_tags(entry, database)).intersection(tags) == set(tags):
-                        ids.append(entry)
-        if op_type == 0:
-            sql = 'SELECT entry_id FROM tags WHERE tag IN ({})'.format(','.join(['?'] * len(tags)))
-            ids = list({x[0] for x in d.execute(sql, tags).fetchall()})
-        if op_type == 'Untagged':
-            cmd = 'SELECT entry_id FROM tags WHERE tag=\'(UNTAGGED)\''
-            ids = [x[0] for x in d.execute(cmd).fetchall()]
-        return tuple(ids)
+    if op_type == 'Untagged':
+        return tagged_ids((UNTAGGED,), database=database)
+    return tagged_ids(tags, op_type, database=database)
 
 
 def from_attachments(database: str = None):
@@ -146,25 +207,52 @@ def from_body(search_string: str, database: str = None):
     # TODO allow regex for more useful searches
     db = connect(database) if database else connect(default_database())
     with closing(db) as d:
-        c = d.execute('SELECT entry_id FROM bodies WHERE body LIKE ?', ('%' + search_string.lower() + '%',)).fetchall()
+        # Scans every body, so it can be stopped by the token of the request it runs for
+        c = execute(d, 'SELECT entry_id FROM bodies WHERE body LIKE ?', ('%' + search_string.lower() + '%',))
         return [x[0] for x in c]
 
 
 class Filter:
-    """Provides methods for filtering entries in based on their attributes"""
+    """Provides methods for filtering entries in based on their attributes. Each criterion is evaluated against the
+    bitmap index of the database and its bitmap is cached separately, so changing one criterion only requires that
+    criterion to be recomputed and the criteria are combined with bitwise operations. Only body searches go to SQLite.
+    Bitmaps and ids are also kept in the shared result cache, keyed on the normalized criteria and the database's change
+    counter, so Readers with the same filters reuse each other's results. The cache is discarded whenever the database's
+    change counter moves"""
+
+    def __init__(self, path_to_db: str = None, lazy: bool = False):
+        """
 
-    def __init__(self, path_to_db: str = None):
+        :param path_to_db: a str representing the location of the database
+        :param lazy: a bool indicating whether changing a criterion only marks the filter as out of date, leaving the
+        work to whichever read comes next. The Reader pages use this so the UI thread never runs a body search that a
+        worker will run anyway
+        """
         self._path = abspath(path_to_db) if path_to_db else default_database()
+        self._lazy = lazy
         self._by_attachments = 0
         self._by_child = 0
         self._by_parent = 0
         self._by_body = ''
+        self._by_query = ''
+        self._query = None
         self._by_date = None
         self._date_type = 0  # 0 for Continuous, 1 for Intervals
         self._by_tags = tuple()
         self._by_is_untagged = False
         self._tags_type = 0
         self._filtered = tuple()
+        self._bits = 0
+        self._sort: Tuple[Tuple[str, bool]] = ()
+        self._sorted: Union[List[int], None] = None
+        self._sorted_accesses = 0
+        self._positions: Union[Dict[int, int], None] = None
+        self._cache: Dict[str, Union[int, None]] = {}
+        self._state: tuple = ()
+        self._index: Union[BitmapIndex, None] = None
+        self._batch_depth = 0
+        self._pending = False
+        self._pinned: Union[int, None] = None
         self._filter()
 
     @property
@@ -172,15 +260,201 @@ class Filter:
         return self._path
 
     @property
-    def filtered_ids(self):
+    def settings(self):
+        """A copy of every setting of the filter, which can be passed to update() on another Filter, e.g. one owned by
+        a worker thread
+
+        :rtype: Dict[str, Any]
         """
+        settings = {name: getattr(self, name) for name in SETTINGS}
+        settings['dates'] = dict(settings['dates']) if settings['dates'] else None
+        return settings
+
+    @property
+    def filtered_ids(self):
+        """Returns the result of the last filter run, only recomputing it if the database has changed since then
 
         :rtype: Tuple[int]
         :return: a tuple of int representing the entry ids which have been filtered in
         """
-        self._filter()
+        self._check_current()
+        if self._filtered is None:
+            key = (self.database_location, self._index.version, 'ids', self._state, self._sort, self._accesses())
+            self._filtered = results.get(key)
+            if self._filtered is None:
+                if self._sort:
+                    ids = self._index.ids
+                    self._filtered = tuple(ids[o] for o in self._sorted_ordinals())
+                else:
+                    self._filtered = self._index.decode(self._bits)
+                results.put(key, self._filtered)
         return self._filtered
 
+    @property
+    def sort(self):
+        return self._sort
+
+    @sort.setter
+    def sort(self, v: Tuple[Tuple[str, bool]]):
+        """Sets the order of the filtered entries
+
+        :param v: a tuple of tuples of a str in SORT_KEYS and a bool indicating whether that key is descending, most
+        significant first; ties are broken by date and then id. An empty tuple sorts by date
+        """
+        v = tuple((key, bool(descending)) for key, descending in v)
+        for key, _ in v:
+            if key not in SORT_KEYS:
+                raise KeyError('Allowed sort keys include {}.'.format(', '.join(SORT_KEYS)))
+        self._sort = v
+        self._sorted = None
+        self._positions = None
+        self._filtered = None
+
+    def _accesses(self):
+        """The access version the sorted order depends on, which is 0 unless it is sorted by last access"""
+        return access_version() if any(key == 'last_access' for key, _ in self._sort) else 0
+
+    def _sorted_ordinals(self):
+        if self._sorted is None:
+            index = self._index
+            self._sorted_accesses = self._accesses()
+            self._sorted = index.sort(index.select(self._bits), self._sort)
+            self._positions = None
+        return self._sorted
+
+    def _sorted_positions(self):
+        if self._positions is None:
+            self._positions = {o: i for i, o in enumerate(self._sorted_ordinals())}
+        return self._positions
+
+    def _sorted_position(self, row: Tuple[datetime, int], after: bool):
+        """Finds where an entry falls in the sorted order, treating entries that have been filtered out since the row
+        was shown as the start of the order"""
+        positions = self._sorted_positions()
+        o = self._index.position(row, False)
+        if o not in positions or self._index.ids[o] != row[1]:
+            return 0
+        return positions[o] + (1 if after else 0)
+
+    def _check_current(self):
+        if self._pending and not self._batch_depth or self._stale():
+            self._run()
+        elif self._sorted is not None and self._sorted_accesses != self._accesses():
+            # An entry has been opened since the order by last access was worked out
+            self._sorted = None
+            self._positions = None
+            self._filtered = None
+
+    def _stale(self):
+        """Checks whether the database has changed since the index was built. While the filter is pinned, the change
+        counter that was read when it was pinned is used instead of reading it again. Any difference counts, since a
+        database restored from a backup has a counter lower than before"""
+        if self._pinned is not None:
+            return self._index.version != self._pinned
+        return get_change_counter(self.database_location) != self._index.version
+
+    @contextmanager
+    def pinned(self, version: int = None):
+        """Reads the database's change counter once for every read made inside the block, e.g. all the values of a
+        snapshot, rather than once per read
+
+        :param version: an int representing the change counter, or None to read it now. Nested blocks keep the
+        version of the outermost one
+        """
+        outer = self._pinned
+        if outer is None:
+            self._pinned = version if version is not None else get_change_counter(self.database_location)
+        try:
+            yield self
+        finally:
+            self._pinned = outer
+
+    def count(self):
+        """Counts the filtered entries without decoding their ids
+
+        :return: an int representing the number of entries which have been filtered in
+        """
+        self._check_current()
+        return popcount(self._bits)
+
+    def total(self):
+        """Counts every entry in the database
+
+        :return: an int representing the number of entries
+        """
+        self._check_current()
+        return len(self._index.ids)
+
+    def metric_sum(self, key: str):
+        """Adds up a per-entry value over the filtered entries, reading the precomputed columns rather than the bodies
+
+        :param key: a str in SORT_KEYS other than the dates, or 'lines' or 'reading_time'
+        :return: the sum of the values
+        """
+        self._check_current()
+        column = self._index.column(key)
+        return sum(column[o] for o in self._index.select(self._bits))
+
+    def page(self, after: Tuple[datetime, int] = None, before: Tuple[datetime, int] = None, limit: int = 100):
+        """Gets one page of the filtered entries, using the (created, entry_id) key of an entry as the cursor. In date
+        order only the entries on the page are decoded, so the cost is bounded by the page size
+
+        :param after: a tuple of the creation date and id of the entry the page starts after, or None for the start
+        :param before: a tuple of the creation date and id of the entry the page ends before, or None for the end. When
+        it is given without after, the page holds the entries closest to it
+        :param limit: an int representing the most entries on the page
+        :return: a tuple of tuples of the creation date and id of each entry on the page
+        :rtype: Tuple[Tuple[datetime, int]]
+        """
+        self._check_current()
+        index = self._index
+        if self._sort:
+            # With any other order the page is sliced out of the sorted ordinals, which are kept until the filter
+            # changes
+            ordinals = self._sorted_ordinals()
+            start = self._sorted_position(after, True) if after else 0
+            end = self._sorted_position(before, False) if before else len(ordinals)
+            if before and not after:
+                start = max(end - limit, 0)
+            return tuple(index.rows(ordinals[start:min(end, start + limit)]))
+        start = index.position(after, True) if after else 0
+        end = index.position(before, False) if before else None
+        ordinals = index.select(self._bits, start, end, limit, reverse=bool(before and not after))
+        return tuple(index.rows(ordinals))
+
+    def position(self, id_: int):
+        """Finds where an entry is among the filtered entries without decoding their ids
+
+        :param id_: an int representing the entry
+        :return: an int representing the number of filtered entries before it, or None if it has been filtered out
+        """
+        self._check_current()
+        o = self._index.ordinal(id_)
+        if o is None or not self._bits >> o & 1:
+            return None
+        if self._sort:
+            return self._sorted_positions()[o]
+        return popcount(self._bits & ((1 << o) - 1))
+
+    def seek(self, position: int, limit: int = 100):
+        """Gets one page of the filtered entries starting at a position rather than after a cursor, e.g. where the
+        scrollbar was dragged to. In date order only the chunk of the bitmap holding the position and the entries on
+        the page are decoded
+
+        :param position: an int representing the number of filtered entries before the page
+        :param limit: an int representing the most entries on the page
+        :return: a tuple of tuples of the creation date and id of each entry on the page
+        :rtype: Tuple[Tuple[datetime, int]]
+        """
+        self._check_current()
+        index = self._index
+        if self._sort:
+            return tuple(index.rows(self._sorted_ordinals()[position:position + limit]))
+        start = index.nth(self._bits, position)
+        if start is None:
+            return ()
+        return tuple(index.rows(index.select(self._bits, start, limit=limit)))
+
     @property
     def has_attachments(self):
         return self._by_attachments
@@ -193,7 +467,7 @@ class Filter:
         """
         if type(v) == int:
             self._by_attachments = v
-            self._filter()
+            self._invalidate('attachments')
 
     @property
     def has_parent(self):
@@ -207,7 +481,7 @@ class Filter:
         """
         if type(v) == int:
             self._by_parent = v
-            self._filter()
+            self._invalidate('parent')
 
     @property
     def has_children(self):
@@ -217,7 +491,7 @@ class Filter:
     def has_children(self, v: int):
         if type(v) == int:
             self._by_child = v
-            self._filter()
+            self._invalidate('child')
 
     @property
     def dates(self):
@@ -232,7 +506,7 @@ class Filter:
             self._by_date = t
         elif not t:
             self._by_date = None
-        self._filter()
+        self._invalidate('dates')
 
     @property
     def date_filter(self):
@@ -242,6 +516,7 @@ class Filter:
     def date_filter(self, v: str):
         if v in [1, 0]:
             self._date_type = v
+            self._cache.pop('dates', None)
             if self.dates:
                 self._filter()
 
@@ -253,7 +528,23 @@ class Filter:
     def body(self, v: str):
         if type(v) == str:
             self._by_body = v
-            self._filter()
+            self._invalidate('body')
+
+    @property
+    def query(self):
+        return self._by_query
+
+    @query.setter
+    def query(self, v: str):
+        """Sets a query in the language of filter_query, which is combined with the other criteria
+
+        :param v: a str representing the query, or an empty str to stop filtering by query
+        :raises ValueError: if the query is not valid, in which case the filter is left unchanged
+        """
+        if type(v) == str:
+            self._query = parse(v) if v.strip() else None
+            self._by_query = v
+            self._invalidate('query')
 
     @property
     def tags(self):
@@ -263,21 +554,21 @@ class Filter:
     def tags(self, v: Union[Tuple[str], str]):
         if type(v) == tuple and all(isinstance(x, str) for x in v):
             self._by_tags = v
-            self._filter()
+            self._invalidate('tags')
         elif type(v) == str:
             if v == 'all':
                 self._by_tags = tuple(get_all_tags(self.database_location))
                 self._by_is_untagged = True
-                self._filter()
+                self._invalidate('tags')
             elif v == 'none':
                 self._by_tags = ()
                 self._by_is_untagged = False
-                self._filter()
+                self._invalidate('tags')
             elif v == 'invert':
                 a = set(get_all_tags(self.database_location))
                 self._by_tags = tuple(a.difference(self._by_tags))
                 self._by_is_untagged = False if True else True
-                self._filter()
+                self._invalidate('tags')
 
     @property
     def is_untagged(self):
@@ -287,7 +578,7 @@ class Filter:
     def is_untagged(self, v: bool):
         if type(v) == bool:
             self._by_is_untagged = v
-            self._filter()
+            self._invalidate('tags')
 
     @property
     def tag_filter(self):
@@ -301,53 +592,294 @@ class Filter:
         """
         if v in [0, 1, 2]:
             self._tags_type = v
-            self._filter()
+            self._invalidate('tags')
 
-    def _filter(self):
-        filtered = set(get_all_entry_ids(self.database_location))
-        l_ = ()
+    def _invalidate(self, criterion: str):
+        """Discards the cached ids for a single criterion and calls the filter
+
+        :param criterion: a str naming one of the criteria in CRITERIA
+        """
+        self._cache.pop(criterion, None)
+        self._filter()
+
+    def _check_version(self):
+        """Discards every cached criterion if the database has been modified since the cache was built
 
-        if self._by_tags:
+        :rtype: bool
+        :return: a bool indicating whether the database has changed
+        """
+        index = get_index(self.database_location, self._pinned)
+        if self._pinned is not None:
+            # The database may have changed since the counter was pinned, in which case the index read it again and the
+            # rest of the block uses the version the index was built for
+            self._pinned = index.version
+        if index is not self._index:
+            self._index = index
+            self._cache.clear()
+            return True
+        return False
+
+    def _criterion_state(self, criterion: str):
+        """Normalizes the settings of a single criterion, so that equivalent filters share their cached results
+
+        :param criterion: a str naming one of the criteria in CRITERIA
+        :return: a hashable representing the criterion's settings or None if it is not in use
+        """
+        if criterion == 'tags':
+            tags = frozenset(self._by_tags + ((UNTAGGED,) if self._by_is_untagged else ()))
+            return criterion, self._tags_type, tags
+        if criterion == 'dates' and self._by_date:
+            if self._date_type == 0:
+                return criterion, 0, continuous_range_bounds(self._by_date, self.database_location)
+            return criterion, 1, tuple(sorted(interval_bounds(self._by_date, self.database_location).items()))
+        if criterion == 'body' and self._by_body:
+            return criterion, self._by_body
+        if criterion == 'query' and self._query:
+            return criterion, str(self._query)
+        if (criterion == 'attachments' and self._by_attachments) or (criterion == 'child' and self._by_child) or \
+                (criterion == 'parent' and self._by_parent):
+            return criterion,
+        return None
+
+    def _lookup(self, criterion: str, state: tuple):
+        """Gets the bitmap for a single criterion from the shared result cache, evaluating it on a miss
+
+        :param criterion: a str naming one of the criteria in CRITERIA
+        :param state: the normalized settings of the criterion
+        :return: an int representing the bitmap of the entries that satisfy the criterion or None if it is not in use
+        """
+        if state is None:
+            return None
+        key = (self.database_location, self._index.version, state)
+        bits = results.get(key)
+        if bits is None:
+            bits = self._evaluate(criterion)
+            results.put(key, bits)
+        return bits
+
+    def _evaluate(self, criterion: str):
+        """Evaluates a single criterion against the bitmap index
+
+        :param criterion: a str naming one of the criteria in CRITERIA
+        :return: an int representing the bitmap of the entries that satisfy the criterion or None if it is not in use
+        """
+        index = self._index
+        bits = None
+        if criterion == 'tags':
             l_ = list(self._by_tags)
-        if self._by_is_untagged:
-            l_ += ['(UNTAGGED)']
-        filtered = filtered.intersection(from_tags(tuple(l_), self.database_location, self._tags_type))
+            if self._by_is_untagged:
+                l_ += [UNTAGGED]
+            if self._tags_type == 1:
+                bits = index.all_of(l_)
+            elif self._tags_type == 2:
+                bits = index.only(l_)
+            else:
+                bits = index.any_of(l_)
+        elif criterion == 'attachments' and self._by_attachments:
+            bits = index.has_attachments
+        elif criterion == 'body' and self._by_body:
+            bits = index.bits(from_body(self._by_body, self.database_location))
+        elif criterion == 'query' and self._query:
+            bits = evaluate(optimize(self._query, self.database_location, index), index, self.database_location)
+        elif criterion == 'dates' and self._by_date:
+            bits = self._date_bits(self._by_date, self._date_type)
+        elif criterion == 'child' and self._by_child:
+            bits = index.has_children
+        elif criterion == 'parent' and self._by_parent:
+            bits = index.has_parent
+        return bits
+
+    def _date_bits(self, dates: Dict[str, int], date_type: int):
+        """Evaluates a date filter against the bitmap index
+
+        :param dates: a dict of the 'low' and 'high' values of the date parts
+        :param date_type: an int: 0 for a continuous range, 1 for intervals
+        :return: an int representing the bitmap of the entries that satisfy the filter
+        """
+        index = self._index
+        if date_type == 0:
+            return index.created_range(*continuous_range_bounds(dates, self.database_location))
+        bits = index.all
+        for part, bounds in interval_bounds(dates, self.database_location).items():
+            bits &= index.date_part(part, *bounds)
+        return bits
+
+    def _without(self, criterion: str):
+        """Combines the cached bitmaps of every criterion except one
+
+        :param criterion: a str naming the criterion in CRITERIA to leave out
+        :return: an int representing the bitmap of the entries that satisfy the other criteria
+        """
+        self._check_current()
+        bits = self._index.all
+        for c in CRITERIA:
+            if c != criterion and self._cache.get(c) is not None:
+                bits &= self._cache[c]
+        return bits
+
+    def count_dates(self, dates: Dict[str, int], date_filter: int = None):
+        """Counts the entries a date filter would let through alongside the other criteria, without applying it. Used
+        to preview the effect of the date scales while they are being dragged
+
+        :param dates: a dict of the 'low' and 'high' values of the date parts
+        :param date_filter: an int: 0 for a continuous range, 1 for intervals; defaults to the current type
+        :return: an int representing the number of entries
+        """
+        date_filter = self._date_type if date_filter is None else date_filter
+        bits = self._without('dates')
+        if dates:
+            if date_filter == 0:
+                dates = dict(dates)
+                for e in ['low', 'high']:
+                    dates[e + ' day'] = check_day_against_month(dates[e + ' day'], dates[e + ' month'],
+                                                                dates[e + ' year'])
+            bits &= self._date_bits(dates, date_filter)
+        return popcount(bits)
+
+    def date_histogram(self, part: str):
+        """Counts the entries that satisfy every criterion but the date filter for each value of a date part
+
+        :param part: a str in DATE_PARTS
+        :return: a dict of the values of the part and the number of entries with each value
+        :rtype: Dict[int, int]
+        """
+        bits = self._without('dates')
+        return self._index.histogram(part, bits)
 
-        if self._by_attachments:
-            filtered = filtered.intersection(from_attachments(self.database_location))
-        if self._by_body:
-            filtered = filtered.intersection(from_body(self._by_body, self.database_location))
+    def _clause(self, criterion: str):
+        """Builds the WHERE clause for a single criterion
 
-        if self._by_date:
+        :param criterion: a str naming one of the criteria in CRITERIA
+        :return: a tuple of the SQL clause and its parameters or None if the criterion is not in use
+        """
+        clause = None
+        if criterion == 'tags':
+            l_ = list(self._by_tags)
+            if self._by_is_untagged:
+                l_ += ['(UNTAGGED)']
+            clause = tags_clause(tuple(l_), self._tags_type)
+        elif criterion == 'attachments' and self._by_attachments:
+            clause = 'entry_id IN (SELECT entry_id FROM attachments)', []
+        elif criterion == 'body' and self._by_body:
+            clause = body_clause(self._by_body)
+        elif criterion == 'query' and self._query:
+            clause = to_clause(optimize(self._query, self.database_location, self._index))
+        elif criterion == 'dates' and self._by_date:
             if self._date_type == 0:
-                l_ = tuple(from_continuous_range(self._by_date, self.database_location))
+                clause = continuous_range_clause(self._by_date, self.database_location)
             else:
-                l_ = tuple(from_intervals(self._by_date, self.database_location))
-            filtered = filtered.intersection(l_)
+                clause = intervals_clause(self._by_date, self.database_location)
+        elif criterion == 'child' and self._by_child:
+            clause = 'entry_id IN (SELECT parent FROM relations)', []
+        elif criterion == 'parent' and self._by_parent:
+            clause = 'entry_id IN (SELECT child FROM relations)', []
+        return clause
+
+    def compile(self, after: Tuple[datetime, int] = None, limit: int = None):
+        """Compiles the current state of the filter into a single parameterized query, sorted by date
+
+        :param after: a tuple of the creation date and id of the entry the results start after, for keyset pagination
+        :param limit: an int representing the most entries to return, or None for all of them
+        :return: a tuple of the SQL query and its parameters
+        :rtype: Tuple[str, list]
+        """
+        clauses = [self._clause(c) for c in CRITERIA]
+        clauses = [c for c in clauses if c]
+        if after:
+            clauses.append(('(created, entry_id) > (?, ?)', list(after)))
+        sql, params = compile_query(clauses)
+        if limit is not None:
+            sql, params = sql + ' LIMIT ?', params + [limit]
+        return sql, params
+
+    def explain(self):
+        """Describes the query that the current state of the filter compiles to and how SQLite plans to run it
+
+        :rtype: str
+        :return: a str containing the query, its parameters, and its query plan
+        """
+        sql, params = self.compile()
+        db = connect(self.database_location)
+        with closing(db) as d:
+            plan = d.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        depth = {0: 0}
+        lines = [sql, 'Parameters: {}'.format(params), 'Query plan:']
+        for id_, parent, _, detail in plan:
+            depth[id_] = depth.get(parent, 0) + 1
+            lines.append('{}{}'.format('  ' * depth[id_], detail))
+        return '\n'.join(lines)
+
+    @contextmanager
+    def batch(self):
+        """Defers running the filter until the outermost batch closes, so several criteria can be changed with a single
+        evaluation. Reading filtered_ids inside a batch gives the result from before it opened, and the change counter is
+        only read once for the whole batch"""
+        self._batch_depth += 1
+        try:
+            with self.pinned():
+                yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._pending:
+                self._filter()
 
-        if self._by_child:
-            filtered = filtered.intersection(get_all_parents(self.database_location))
+    def update(self, **criteria):
+        """Sets several criteria at once and runs the filter a single time
 
-        if self._by_parent:
-            filtered = filtered.intersection(get_all_children(self.database_location))
+        :param criteria: the new values, keyed by the names of the properties in SETTINGS
+        """
+        unknown = set(criteria).difference(SETTINGS)
+        if unknown:
+            raise TypeError('Unknown filter criteria: {}'.format(', '.join(sorted(unknown))))
+        with self.batch():
+            for name in SETTINGS:
+                if name in criteria:
+                    setattr(self, name, criteria[name])
 
-        filtered = list(filtered)
-        filtered.sort(key=lambda i: get_date(entry_id=i, database=self.database_location))
-        self._filtered = tuple(filtered)
+    def _filter(self):
+        self._pending = True
+        if self._batch_depth or self._lazy and self._index is not None:
+            return
+        self._run()
+
+    def _run(self):
+        self._check_version()
+        bits = self._index.all
+        states = []
+        for criterion in CRITERIA:
+            state = self._criterion_state(criterion)
+            if criterion not in self._cache:
+                self._cache[criterion] = self._lookup(criterion, state)
+            if self._cache[criterion] is not None:
+                bits &= self._cache[criterion]
+            states.append(state)
+        # Only cleared once every criterion has been evaluated, so a run stopped by a token is repeated by the next read
+        self._pending = False
+        self._bits = bits
+        self._state = tuple(states)
+        self._sorted = None
+        self._positions = None
+        # The ids are only decoded when they are asked for
+        self._filtered = None
 
     def reset_filters(self):
         self._by_attachments = False
         self._by_child = False
         self._by_parent = False
         self._by_body = ''
+        self._by_query = ''
+        self._query = None
         self._by_date = ()
         self._date_type = 0
         self._by_tags = tuple()
         self._by_is_untagged = False
         self._tags_type = 0
         self._filtered = tuple()
+        self._bits = 0
+        self._cache.clear()
 
     def refresh_ids(self):
+        self._cache.clear()
         self._filter()
 
 
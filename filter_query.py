@@ -0,0 +1,504 @@
+"""A small boolean query language for filtering entries, such as
+
+    tag:work AND (body:"deadline" OR tag:urgent) AND NOT has:attachments
+        AND created:2020-01..2020-06 AND weekday:sat,sun
+
+Queries are parsed into a tree of Term, And, Or, and Not nodes, reordered by how selective and how costly each predicate
+is estimated to be, and then either evaluated against the bitmap index or compiled to a single SQL statement.
+
+Terms:
+    tag:a,b             has at least one of the tags (quote a tag containing spaces or commas: tag:"a, b")
+    body:text           the body contains the text; a bare word or quoted string is also a body search
+    has:attachments     also has:parent, has:children, and has:tags
+    is:untagged         was saved without any tags
+    created:a..b        created between two dates, given as YYYY, YYYY-MM, YYYY-MM-DD, or YYYY-MM-DDTHH:MM; either end
+                        can be left open and a single date matches the whole year, month, or day
+    year:, month:, day:, hour:, minute:, weekday:
+                        the date part is one of a list of values or ranges, e.g. month:jan..mar,dec or hour:22..2;
+                        months and weekdays can be given by name and weekdays are numbered from 0 for Sunday
+Terms next to each other without an operator are joined with AND"""
+import re
+from calendar import monthrange
+from contextlib import closing
+from datetime import datetime
+from sqlite3 import connect
+from typing import Dict, Tuple, Union
+from weakref import WeakKeyDictionary
+
+from bitmap_index import BitmapIndex, get_index, popcount
+from configurations import default_database
+from query_runner import execute
+from tag_query import any_of_clause, UNTAGGED
+
+PARTS = ('year', 'month', 'day', 'hour', 'minute', 'weekday')
+FLAGS = {'attachments': 'entry_id IN (SELECT entry_id FROM attachments)',
+         'children': 'entry_id IN (SELECT parent FROM relations)',
+         'parent': 'entry_id IN (SELECT child FROM relations)'}
+
+_LIMITS = {'year': (1, 9999), 'month': (1, 12), 'day': (1, 31), 'hour': (0, 23), 'minute': (0, 59), 'weekday': (0, 6)}
+_NAMES = {'month': ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'],
+          'weekday': ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']}
+_FORMATS = {'year': ('%Y', '{:04d}'), 'month': ('%m', '{:02d}'), 'day': ('%d', '{:02d}'), 'hour': ('%H', '{:02d}'),
+            'minute': ('%M', '{:02d}'), 'weekday': ('%w', '{:d}')}
+_TOKENS = re.compile(r'\s*(?:(?P<open>\()|(?P<close>\))|(?P<field>[A-Za-z]+):(?P<value>"(?:[^"\\]|\\.)*"|[^\s()"]*)|'
+                     r'(?P<quoted>"(?:[^"\\]|\\.)*")|(?P<word>[^\s()"]+))')
+_KEYWORDS = ('AND', 'OR', 'NOT')
+
+# Body searches scan every body, so they are run last unless they are the only way to rule entries out
+_BODY_COST = 50
+_BODY_SELECTIVITY = 0.1
+
+# The bitmap of each term other than body searches and the number of entries in it, kept per index, so a query that is
+# optimized and then evaluated, or run again with other criteria, builds each bitmap once. Dropped along with the index
+_terms: 'WeakKeyDictionary[BitmapIndex, Dict[str, Tuple[int, int]]]' = WeakKeyDictionary()
+
+
+class Term:
+    """A single predicate, such as tag:work"""
+
+    def __init__(self, field: str, value):
+        self.field = field
+        self.value = value
+
+    def __str__(self):
+        if self.field == 'tag':
+            return 'tag:' + ','.join(_quote(x) if re.search(r'[\s,()"]', x) or not x else x for x in self.value)
+        if self.field == 'body':
+            return 'body:' + _quote(self.value)
+        if self.field == 'created':
+            return 'created:{}..{}'.format(*[x.isoformat() if x else '' for x in self.value])
+        if self.field in PARTS:
+            return '{}:{}'.format(self.field, ','.join('{}..{}'.format(*x) for x in self.value))
+        return '{}:{}'.format(self.field, self.value)
+
+
+class Not:
+    def __init__(self, operand):
+        self.operand = operand
+
+    def __str__(self):
+        return 'NOT ' + _group(self.operand)
+
+
+class And:
+    def __init__(self, operands: list):
+        self.operands = operands
+
+    def __str__(self):
+        return ' AND '.join(_group(x) for x in self.operands)
+
+
+class Or:
+    def __init__(self, operands: list):
+        self.operands = operands
+
+    def __str__(self):
+        return ' OR '.join(_group(x) for x in self.operands)
+
+
+Node = Union[Term, Not, And, Or]
+
+
+def _quote(s: str):
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _unquote(s: str):
+    if s.startswith('"'):
+        return re.sub(r'\\(.)', r'\1', s[1:-1])
+    return s
+
+
+def _group(node: Node):
+    return '({})'.format(node) if isinstance(node, (And, Or)) else str(node)
+
+
+def _tokenize(text: str):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKENS.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError('Unexpected character at position {}: {!r}'.format(position, text[position:].strip()[0]))
+        start = match.end() - len(match.group().lstrip())
+        if match.group('open'):
+            tokens.append(('(', None, start))
+        elif match.group('close'):
+            tokens.append((')', None, start))
+        elif match.group('field'):
+            tokens.append(('term', _term(match.group('field').lower(), match.group('value'), start), start))
+        elif match.group('quoted'):
+            tokens.append(('term', Term('body', _unquote(match.group('quoted'))), start))
+        elif match.group('word') in _KEYWORDS:
+            tokens.append((match.group('word'), None, start))
+        else:
+            tokens.append(('term', Term('body', match.group('word')), start))
+        position = match.end()
+    return tokens
+
+
+def _part_value(part: str, s: str, position: int):
+    s = s.strip().lower()
+    if part in _NAMES and s[:3] in _NAMES[part] and s.isalpha():
+        value = _NAMES[part].index(s[:3]) + (1 if part == 'month' else 0)
+    elif s.isdigit():
+        value = int(s)
+    else:
+        raise ValueError('Invalid {} at position {}: {!r}'.format(part, position, s))
+    low, high = _LIMITS[part]
+    if not low <= value <= high:
+        raise ValueError('The {} at position {} must be between {} and {}'.format(part, position, low, high))
+    return value
+
+
+def _part_ranges(part: str, value: str, position: int):
+    ranges = []
+    for item in value.split(','):
+        if '..' in item:
+            low, high = [_part_value(part, x, position) for x in item.split('..', 1)]
+        else:
+            low = high = _part_value(part, item, position)
+        if low <= high:
+            ranges.append((low, high))
+        elif part == 'year':
+            raise ValueError('The range of years at position {} is reversed'.format(position))
+        else:
+            # Every other part is cyclical, so a reversed range wraps around, e.g. hour:22..2 or weekday:fri..mon
+            ranges += [(low, _LIMITS[part][1]), (_LIMITS[part][0], high)]
+    return tuple(ranges)
+
+
+def _date_bound(s: str, upper: bool, position: int):
+    """Parses one end of a created range, rounding the upper bound out to the end of the year, month, day, or minute"""
+    if not s:
+        return None
+    try:
+        if re.fullmatch(r'\d{4}', s):
+            s = s + ('-12' if upper else '-01')
+        if re.fullmatch(r'\d{4}-\d{1,2}', s):
+            year, month = int(s[:4]), int(s[5:])
+            if upper:
+                return datetime(year, month, monthrange(year, month)[1], 23, 59, 59, 999999)
+            return datetime(year, month, 1)
+        date = datetime.fromisoformat(s)
+    except ValueError:
+        raise ValueError('Invalid date at position {}: {!r}'.format(position, s))
+    if upper and len(s) <= 10:
+        return date.replace(hour=23, minute=59, second=59, microsecond=999999)
+    if upper and len(s) <= 16:
+        return date.replace(second=59, microsecond=999999)
+    return date
+
+
+def _term(field: str, value: str, position: int):
+    if not value:
+        raise ValueError('Missing value for {} at position {}'.format(field, position))
+    if field == 'tag':
+        if value.startswith('"'):
+            return Term('tag', (_unquote(value),))
+        return Term('tag', tuple(x for x in value.split(',') if x))
+    if field == 'body':
+        return Term('body', _unquote(value))
+    value = _unquote(value)
+    if field == 'has':
+        if value.lower() == 'tags':
+            return Not(Term('is', 'untagged'))
+        if value.lower() in FLAGS:
+            return Term('has', value.lower())
+        raise ValueError('Unknown attribute at position {}: has:{}'.format(position, value))
+    if field == 'is':
+        if value.lower() == 'untagged':
+            return Term('is', 'untagged')
+        raise ValueError('Unknown attribute at position {}: is:{}'.format(position, value))
+    if field == 'created':
+        low, _, high = value.partition('..')
+        high = high if '..' in value else low
+        bounds = _date_bound(low, False, position), _date_bound(high, True, position)
+        if bounds[0] and bounds[1] and bounds[0] > bounds[1]:
+            raise ValueError('The range of dates at position {} is reversed'.format(position))
+        return Term('created', bounds)
+    if field in PARTS:
+        return Term(field, _part_ranges(field, value, position))
+    raise ValueError('Unknown field at position {}: {}'.format(position, field))
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self._text = text
+        self._tokens = _tokenize(text)
+        self._i = 0
+
+    def _peek(self):
+        return self._tokens[self._i][0] if self._i < len(self._tokens) else None
+
+    def _next(self):
+        token = self._tokens[self._i]
+        self._i += 1
+        return token
+
+    def _position(self):
+        return self._tokens[self._i][2] if self._i < len(self._tokens) else len(self._text)
+
+    def parse(self):
+        if not self._tokens:
+            raise ValueError('The query is empty')
+        node = self._or()
+        if self._i < len(self._tokens):
+            raise ValueError('Unexpected {!r} at position {}'.format(self._peek(), self._position()))
+        return node
+
+    def _or(self):
+        operands = [self._and()]
+        while self._peek() == 'OR':
+            self._next()
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def _and(self):
+        operands = [self._unary()]
+        while self._peek() in ('AND', 'NOT', '(', 'term'):
+            if self._peek() == 'AND':
+                self._next()
+            operands.append(self._unary())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def _unary(self):
+        kind = self._peek()
+        if kind == 'NOT':
+            self._next()
+            return Not(self._unary())
+        if kind == '(':
+            self._next()
+            node = self._or()
+            if self._peek() != ')':
+                raise ValueError('Missing closing parenthesis at position {}'.format(self._position()))
+            self._next()
+            return node
+        if kind == 'term':
+            return self._next()[1]
+        if kind is None:
+            raise ValueError('The query ends unexpectedly')
+        raise ValueError('Unexpected {!r} at position {}'.format(kind, self._position()))
+
+
+def parse(text: str):
+    """Parses a query into a tree of nodes
+
+    :param text: a str representing the query
+    :return: the root node of the query
+    :rtype: Node
+    :raises ValueError: if the query is not valid
+    """
+    return _Parser(text).parse()
+
+
+def _body_ids(search_string: str, database: str):
+    with closing(connect(database)) as d:
+        c = execute(d, 'SELECT entry_id FROM bodies WHERE body LIKE ?', ('%' + search_string.lower() + '%',))
+        return [x[0] for x in c]
+
+
+def _term_bits(term: Term, index: BitmapIndex, database: str):
+    if term.field == 'tag':
+        return index.any_of(term.value)
+    if term.field == 'is':
+        return index.tag(UNTAGGED)
+    if term.field == 'has':
+        return getattr(index, 'has_' + term.value)
+    if term.field == 'body':
+        return index.bits(_body_ids(term.value, database))
+    if term.field == 'created':
+        return index.created_range(term.value[0] or datetime.min, term.value[1] or datetime.max)
+    bits = 0
+    for low, high in term.value:
+        bits |= index.date_part(term.field, low, high)
+    return bits
+
+
+def _cached_term(term: Term, index: BitmapIndex, database: str):
+    """Gets the bitmap of a term and the number of entries in it, building them the first time they are asked for"""
+    terms = _terms.get(index)
+    if terms is None:
+        terms = _terms.setdefault(index, {})
+    key = str(term)
+    found = terms.get(key)
+    if found is None:
+        bits = _term_bits(term, index, database)
+        found = terms[key] = bits, popcount(bits)
+    return found
+
+
+def _simplify(node: Node):
+    """Removes double negatives and flattens nested operators of the same kind, e.g. (a AND b) AND c to a AND b AND c,
+    so that every operand can be reordered"""
+    if isinstance(node, Not):
+        operand = _simplify(node.operand)
+        return operand.operand if isinstance(operand, Not) else Not(operand)
+    if isinstance(node, (And, Or)):
+        operands = []
+        for operand in map(_simplify, node.operands):
+            operands += operand.operands if isinstance(operand, type(node)) else [operand]
+        return type(node)(operands)
+    return node
+
+
+def _optimize(node: Node, index: BitmapIndex, database: str):
+    """Returns the node with the operands of its operators reordered, along with its estimated selectivity (the share of
+    entries it lets through) and cost"""
+    if isinstance(node, Term):
+        if node.field == 'body':
+            return node, _BODY_SELECTIVITY, _BODY_COST
+        return node, _cached_term(node, index, database)[1] / max(len(index.ids), 1), 1
+    if isinstance(node, Not):
+        operand, selectivity, cost = _optimize(node.operand, index, database)
+        return Not(operand), 1 - selectivity, cost
+    operands = [_optimize(x, index, database) for x in node.operands]
+    # Running the operands in order of their cost over their chance of settling the result minimizes the expected cost
+    if isinstance(node, And):
+        operands.sort(key=lambda x: x[2] / max(1 - x[1], 1e-9))
+        selectivity = 1
+        for _, s, _ in operands:
+            selectivity *= s
+    else:
+        operands.sort(key=lambda x: x[2] / max(x[1], 1e-9))
+        selectivity = 1
+        for _, s, _ in operands:
+            selectivity *= 1 - s
+        selectivity = 1 - selectivity
+    return type(node)([x[0] for x in operands]), selectivity, sum(x[2] for x in operands)
+
+
+def optimize(node: Node, database: str = None, index: BitmapIndex = None):
+    """Flattens nested operators, removes double negatives, and orders the operands of each operator by how selective
+    and how costly they are estimated to be, using the bitmap index for the estimates
+
+    :param node: the root node of a parsed query
+    :param database: a str representing the location of the database that is being queried
+    :param index: the BitmapIndex of the database, or None to get the current one
+    :return: the root node of the optimized query
+    :rtype: Node
+    """
+    database = database if database else default_database()
+    return _optimize(_simplify(node), index if index else get_index(database), database)[0]
+
+
+def evaluate(node: Node, index: BitmapIndex, database: str = None):
+    """Evaluates a query against the bitmap index. The operands of AND and OR stop being evaluated as soon as the result
+    is settled, so an optimized query can skip its body searches altogether. The bitmaps built while optimizing are
+    reused rather than built again
+
+    :param node: the root node of a query
+    :param index: the BitmapIndex of the database
+    :param database: a str representing the location of the database that is being queried
+    :return: an int representing the bitmap of the entries that satisfy the query
+    """
+    database = database if database else default_database()
+    if isinstance(node, And):
+        bits = index.all
+        for operand in node.operands:
+            if not bits:
+                break
+            bits &= evaluate(operand, index, database)
+        return bits
+    if isinstance(node, Or):
+        bits = 0
+        for operand in node.operands:
+            if bits == index.all:
+                break
+            bits |= evaluate(operand, index, database)
+        return bits
+    if isinstance(node, Not):
+        return index.negate(evaluate(node.operand, index, database))
+    if node.field == 'body':
+        return _term_bits(node, index, database)
+    return _cached_term(node, index, database)[0]
+
+
+def to_clause(node: Node):
+    """Compiles a query to a WHERE clause over the dates table
+
+    :param node: the root node of a query
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    if isinstance(node, (And, Or)):
+        clauses = [to_clause(x) for x in node.operands]
+        sql = (' AND ' if isinstance(node, And) else ' OR ').join('({})'.format(x[0]) for x in clauses)
+        return sql, [p for x in clauses for p in x[1]]
+    if isinstance(node, Not):
+        sql, params = to_clause(node.operand)
+        return 'NOT ({})'.format(sql), params
+    if node.field == 'tag':
+        return any_of_clause(node.value)
+    if node.field == 'is':
+        return any_of_clause((UNTAGGED,))
+    if node.field == 'has':
+        return FLAGS[node.value], []
+    if node.field == 'body':
+        return 'entry_id IN (SELECT entry_id FROM bodies WHERE body LIKE ?)', ['%' + node.value.lower() + '%']
+    if node.field == 'created':
+        lower, upper = node.value
+        if lower and upper:
+            return 'created BETWEEN ? AND ?', [lower, upper]
+        if lower or upper:
+            return 'created {} ?'.format('>=' if lower else '<='), [lower or upper]
+        return '1', []
+    code, fmt = _FORMATS[node.field]
+    sql = ' OR '.join('strftime(\'{}\', created) BETWEEN ? AND ?'.format(code) for _ in node.value)
+    return sql, [fmt.format(x) for r in node.value for x in r]
+
+
+def compile_sql(node: Node):
+    """Compiles a query to a single SELECT of the matching entry ids, in date order
+
+    :param node: the root node of a query
+    :return: a tuple of the SQL query and its parameters
+    :rtype: Tuple[str, list]
+    """
+    sql, params = to_clause(node)
+    return 'SELECT entry_id FROM dates WHERE {} ORDER BY created, entry_id'.format(sql), params
+
+
+def query_ids(text: str, database: str = None, plan: str = 'bitmap'):
+    """Gets the ids of the entries that satisfy a query, without a Reader
+
+    :param text: a str representing the query
+    :param database: a str representing the location of the database that is being queried
+    :param plan: a str: 'bitmap' to evaluate the query against the bitmap index or 'sql' to run it as a single statement
+    :return: a tuple of int representing the entries, in date order
+    :rtype: Tuple[int]
+    """
+    if plan not in ('bitmap', 'sql'):
+        raise ValueError('Allowed plans include \'bitmap\' and \'sql\'.')
+    database = database if database else default_database()
+    index = get_index(database)
+    node = _optimize(_simplify(parse(text)), index, database)[0]
+    if plan == 'sql':
+        with closing(connect(database)) as d:
+            return tuple(x[0] for x in execute(d, *compile_sql(node)))
+    return index.decode(evaluate(node, index, database))
+
+
+def explain(text: str, database: str = None):
+    """Describes how a query is run: the optimized query, the SQL it compiles to, and SQLite's plan for that SQL
+
+    :param text: a str representing the query
+    :param database: a str representing the location of the database that is being queried
+    :return: a str representing the description
+    """
+    database = database if database else default_database()
+    node = optimize(parse(text), database)
+    sql, params = compile_sql(node)
+    lines = ['Optimized: {}'.format(node), 'SQL: ' + sql, 'Parameters: {}'.format(params), 'Query plan:']
+    with closing(connect(database)) as d:
+        for row in d.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall():
+            lines.append('    ' + row[-1])
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    print(explain(' '.join(argv[1:])))
+    print(query_ids(' '.join(argv[1:])))
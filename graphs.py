@@ -2,15 +2,16 @@ from math import floor, ceil
 from tkinter import Toplevel, Canvas
 from tkinter.ttk import Button
 
-from matplotlib.pyplot import show
-from networkx import DiGraph, draw_networkx, draw_planar, draw_circular
-
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-
+from lazy_imports import lazy_import
 from modules import ReaderModule
 from reader_functions import get_parent, get_children
 
+# matplotlib and networkx are only imported when a graph is drawn
+networkx = lazy_import('networkx')
+pyplot = lazy_import('matplotlib.pyplot')
+figure = lazy_import('matplotlib.figure')
+backend_tkagg = lazy_import('matplotlib.backends.backend_tkagg')
+
 
 class RelativesGraph(Toplevel):
     def __init__(self, reader: ReaderModule, bind_tag: str = None, **kwargs):
@@ -54,26 +55,26 @@ class RelativesGraph(Toplevel):
                             lvl += 1
             print(visited, level, adjacency)
 
-            digraph = DiGraph()
+            digraph = networkx.DiGraph()
             digraph.add_nodes_from(visited)
             for u in adjacency:
                 for v in adjacency[u]:
                     digraph.add_edge(u, v)
             print(digraph.edges, digraph.nodes)
-            fig = Figure(figsize=(8, 6))
+            fig = figure.Figure(figsize=(8, 6))
             plt = fig.add_subplot(111)
             plt.plot()
             # plt.draw_planar(digraph, with_labels=True)
 
-            draw_planar(digraph, with_labels=True)
+            networkx.draw_planar(digraph, with_labels=True)
             # plt.tick_params(axis='x', which='both', bottom=False, top=False, labelbottom=False)
             # plt.tick_params(axis='y', which='both', right=False, left=False, labelleft=False)
             # for pos in ['right', 'top', 'bottom', 'left']:
             #     plt.gca().spines[pos].set_visible(False)
 
-            show()
-            canvas = FigureCanvasTkAgg(fig, master=self)
-            toolbar = NavigationToolbar2Tk(canvas, self)
+            pyplot.show()
+            canvas = backend_tkagg.FigureCanvasTkAgg(fig, master=self)
+            toolbar = backend_tkagg.NavigationToolbar2Tk(canvas, self)
             toolbar.update()
             canvas.get_tk_widget().pack()
 
@@ -81,7 +82,7 @@ class RelativesGraph(Toplevel):
 def test():
     from tkinter import Tk
 
-    reader = ReaderModule('.tempfiles/Reader/001')
+    reader = ReaderModule('Reader/001')
 
     def popup():
         p = RelativesGraph(reader)
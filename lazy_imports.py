@@ -0,0 +1,38 @@
+"""Defers importing heavy modules until they are first used. PIL, matplotlib, networkx and dateutil take longer to
+import than the rest of the application put together, and most sessions never need them, so the modules that use them
+hold a LazyModule in their place"""
+from importlib import import_module
+from sys import modules
+
+
+class LazyModule:
+    """Stands in for a module and imports it the first time one of its attributes is read"""
+
+    def __init__(self, name: str):
+        """
+
+        :param name: a str representing the full name of the module, e.g. 'matplotlib.pyplot'
+        """
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self):
+        return self._name in modules
+
+    def __getattr__(self, item: str):
+        if self._module is None:
+            self._module = import_module(self._name)
+        return getattr(self._module, item)
+
+    def __repr__(self):
+        return '<LazyModule {} ({})>'.format(self._name, 'loaded' if self.loaded else 'not loaded')
+
+
+def lazy_import(name: str):
+    """Gets a stand-in for a module that imports it on first use
+
+    :param name: a str representing the full name of the module
+    :rtype: LazyModule
+    """
+    return LazyModule(name)
@@ -1,30 +1,58 @@
+from contextlib import contextmanager
 from datetime import datetime
 from tkinter import Event
 from typing import Dict, Tuple, List, Any
 
 from database_info import get_oldest_date, get_all_dates, get_all_tags, get_newest_date, get_all_entry_ids
-from filter import Filter
-from reader_functions import get_date, get_body, get_parent, get_children, get_attachment_ids, get_tags, \
+from filter import Filter, SETTINGS
+from reader_functions import get_metrics, get_date, get_body, get_parent, get_children, get_attachment_ids, get_tags, \
     get_attachment_name, get_attachment_file
+from session import get_session
 from tempfiles import ReaderFileManager, WriterFileManager
-from writer import create_entry, set_body, modify_body, modify_date, set_tags, set_attachments
+from writer import create_entry, set_body, modify_body, modify_date, set_tags, set_attachments, modify_last_edit
 
 
 class ReaderModule:
-    def __init__(self, path_to_tempfile: str = None):
+    def __init__(self, path_to_tempfile: str = None, lazy: bool = False):
         self._temp = ReaderFileManager(path_to_tempfile)
-        self._filter = Filter(self._temp.database)
+        self._filter = Filter(self._temp.database, lazy=lazy)
 
         self._temp.tags = self.all_tags
 
-        self._filter.dates = self._temp.dates
-        self._filter.tags = self._temp.tags
-        self._filter.tag_filter = self._temp.tag_filter
-        self._filter.date_filter = self._temp.date_filter
-        self._filter.has_parent = self._temp.has_parent
-        self._filter.has_attachments = self._temp.has_attachments
-        self._filter.has_children = self._temp.has_children
-        self._filter.body = self._temp.body
+        self._filter.update(dates=self._temp.dates,
+                            tags=self._temp.tags,
+                            tag_filter=self._temp.tag_filter,
+                            date_filter=self._temp.date_filter,
+                            has_parent=self._temp.has_parent,
+                            has_attachments=self._temp.has_attachments,
+                            has_children=self._temp.has_children,
+                            body=self._temp.body,
+                            query=self._temp.query,
+                            sort=self._temp.sort)
+
+    @contextmanager
+    def batch(self):
+        """Groups changes to the filter attributes, so the filter runs and the tempfile is written once at the end"""
+        with self._temp.batch(), self._filter.batch():
+            yield self
+
+    def update(self, **criteria):
+        """Sets several filter attributes at once
+
+        :param criteria: the new values, keyed by the names of the properties in filter.SETTINGS
+        """
+        with self.batch():
+            for name in SETTINGS:
+                if name in criteria:
+                    setattr(self, 'untagged' if name == 'is_untagged' else name, criteria[name])
+
+    @property
+    def filter(self):
+        return self._filter
+
+    @property
+    def filter_settings(self):
+        return self._filter.settings
 
     @property
     def id_(self):
@@ -45,6 +73,13 @@ class ReaderModule:
         else:
             return ''
 
+    @property
+    def entry_metrics(self):
+        if self.id_:
+            return get_metrics(self.id_, self.database)
+        else:
+            return None
+
     @property
     def entry_date(self):
         if self.id_:
@@ -128,6 +163,16 @@ class ReaderModule:
         self._temp.dates = d
         self._filter.dates = d
 
+    @property
+    def query(self):
+        return self._temp.query
+
+    @query.setter
+    def query(self, q: str):
+        # The filter is set first, as it rejects queries that are not valid
+        self._filter.query = q
+        self._temp.query = q
+
     @property
     def has_parent(self):
         return self._temp.has_parent
@@ -164,6 +209,15 @@ class ReaderModule:
         self._filter.date_filter = v
         self._temp.date_filter = v
 
+    @property
+    def sort(self):
+        return self._temp.sort
+
+    @sort.setter
+    def sort(self, v: Tuple[Tuple[str, bool]]):
+        self._filter.sort = v
+        self._temp.sort = v
+
     @property
     def tag_filter(self):
         return self._temp.tag_filter
@@ -222,6 +276,30 @@ class ReaderModule:
     def all_ids(self):
         return get_all_entry_ids(self.database)
 
+    def count(self):
+        return self._filter.count()
+
+    def total(self):
+        return self._filter.total()
+
+    def metric_sum(self, key: str):
+        return self._filter.metric_sum(key)
+
+    def page(self, after: Tuple[datetime, int] = None, before: Tuple[datetime, int] = None, limit: int = 100):
+        return self._filter.page(after, before, limit)
+
+    def position(self, id_: int):
+        return self._filter.position(id_)
+
+    def seek(self, position: int, limit: int = 100):
+        return self._filter.seek(position, limit)
+
+    def count_dates(self, dates: Dict[str, int], date_filter: int = None):
+        return self._filter.count_dates(dates, date_filter)
+
+    def date_histogram(self, part: str):
+        return self._filter.date_histogram(part)
+
     @property
     def path(self):
         return self._temp.path
@@ -314,6 +392,7 @@ class WriterModule(WriterFileManager):
             modify_date(**kwargs)
             set_tags(**kwargs)
             set_attachments(**kwargs)
+            modify_last_edit(self.id_, self.database)
         self.attachments = get_attachment_ids(self.id_, self.database)
 
     def set_body(self, v: str):
@@ -330,6 +409,7 @@ class WriterModule(WriterFileManager):
         self.tags = get_tags(entry_id, self. database)
         self.attachments = get_attachment_ids(entry_id, self.database)
         self.date = get_date(entry_id, self.database)
+        get_session().record_access(self.database, entry_id)
 
     def link_entry(self, entry_id: int):
         self.parent = entry_id
@@ -1,18 +1,24 @@
-from os import scandir, remove, makedirs
-from os.path import exists
 from tkinter import Event, Menu
 from tkinter.ttk import Notebook, Style
 from typing import Union
 
-from PIL import Image, ImageTk
-
-from configurations import pages, current_page
-from pages import ReaderPage, WriterPage
+from pages import ReaderPage, WriterPage, PagePlaceholder
+from session import get_session
 from themes import get_icon
+from warm_start import discard_state
+
+# The milliseconds between pages built in the background when prefetching
+PREFETCH_INTERVAL = 200
 
 
 class Journal(Notebook):
-    def __init__(self, **kwargs):
+    def __init__(self, prefetch: bool = False, **kwargs):
+        """Saved pages are added as placeholders and only built when they are first selected, so opening the journal
+        costs the same however many tabs were left open
+
+        :param prefetch: a bool representing whether the placeholders are built one at a time whenever the application
+        is idle
+        """
         super(Journal, self).__init__(**kwargs)
 
         self._book_image = get_icon('ic_library_books')
@@ -24,24 +30,14 @@ class Journal(Notebook):
 
         self._pages = []
 
-        tempfiles = pages()
+        session = get_session()
+        tempfiles = session.tabs()
+        current = session.current
 
-        for d in '.tempfiles/Reader', '.tempfiles/Writer':
-            if not exists(d):
-                makedirs(d)
-
-        files = [x.path for x in scandir('.tempfiles/Reader')] + [x.path for x in scandir('.tempfiles/Writer')]
-
-        for path in files:
-            if path not in tempfiles:
-                tempfiles.append(path)
-
-        r_len = len([x for x in tempfiles if 'Reader' in x])
-        w_len = len([x for x in tempfiles if 'Writer' in x])
         r_count = 1
         w_count = 1
 
-        for i in range(r_len + w_len):
+        for i in range(len(tempfiles)):
             if 'Reader' in tempfiles[i]:
                 bind_tag = 'Reader{}'.format(r_count)
                 r_count += 1
@@ -50,26 +46,26 @@ class Journal(Notebook):
                 w_count += 1
             tempfiles[i] = (tempfiles[i], bind_tag)
 
-        pgs = [
-            ReaderPage(tempfile=x[0], bind_tag=x[1]) if 'Reader' in x[0] else WriterPage(tempfile=x[0], bind_tag=x[1])
-            for x in tempfiles]
-
-        for page in pgs:
+        for path, bind_tag in tempfiles:
+            page = PagePlaceholder(tempfile=path, bind_tag=bind_tag)
             page.id_ = page.bind_tag[-1]
-            self.add(child=page,
-                     image=self._book_image if page.class_ == 'Reader' else self._pencil_image,
-                     text='{} {}'.format(page.class_, page.id_),
-                     compound='left')
-            pages(added=page.path)
+            self.add(child=page, **self._tab_options(page))
             self._pages.append(page)
-            if page.path == current_page():
+            if page.path == current:
                 self.select(str(page))
 
+        # Only the page on show is built now
+        if self._pages:
+            self._build(self.index('current'))
+
         self.bind('<<NotebookTabChanged>>', self.update_settings)
         self.bind('<Button-3>', self.launch_tab_menu)
 
         self.enable_traversal()
 
+        if prefetch:
+            self.after_idle(self._prefetch)
+
     @property
     def id_(self):
         if self._current_page():
@@ -85,18 +81,18 @@ class Journal(Notebook):
             return None
 
     def _current_page(self) -> Union[ReaderPage, WriterPage, None]:
-        """Returns the currently selected page object
+        """Returns the currently selected page object, building it if it has not been shown yet
 
         """
         if self.tabs():
-            c = current_page()
+            c = get_session().current
             if c:
-                for page in self._pages:
+                for i, page in enumerate(self._pages):
                     if page.path == c:
-                        return page
+                        return self._build(i)
             else:
-                p = self._pages[0]
-                current_page(p.path)
+                p = self._build(0)
+                get_session().current = p.path
                 return p
         else:
             return None
@@ -110,33 +106,70 @@ class Journal(Notebook):
         if 'entry_id' in kwargs.keys():
             page.edit_entry(entry_id=kwargs['entry_id'])
         page.id_ = id_
-        self.add(child=page,
-                 image=self._book_image if mode == 'Reader' else self._pencil_image,
-                 text='{} {}'.format(mode, id_),
-                 compound='left')
-        pages(added=page.path)
+        self.add(child=page, **self._tab_options(page))
         self._pages.append(page)
         self.select(str(page))
 
     def remove_page(self, tab_id: int = 'current'):
         tab_id = self.index(tab_id)
         file = self._pages[tab_id].path
-        remove(file)
-        pages(removed=file)
+        get_session().remove_tab(file)
+        discard_state(file)
         self.forget(tab_id=tab_id)
         self._pages.pop(tab_id)
 
     def update_settings(self, event: Event):
         # TODO rewrite to use tab_id instead
-        """Updates the currently selected tempfile in settings.config
+        """Updates the tab on show in the session store
 
         :param event:
         """
-        for page in self._pages:
+        for i, page in enumerate(self._pages):
             if str(page) == self.select():
-                current_page(page.path)
+                self._build(i)
+                get_session().current = page.path
                 break
 
+    def _tab_options(self, page: Union[ReaderPage, WriterPage, PagePlaceholder]):
+        return dict(image=self._book_image if page.class_ == 'Reader' else self._pencil_image,
+                    text='{} {}'.format(page.class_, page.id_),
+                    compound='left')
+
+    def _build(self, index: int) -> Union[ReaderPage, WriterPage]:
+        """Replaces the placeholder at an index with the page it stands for, leaving built pages as they are
+
+        :param index: an int representing the index of the tab
+        :return: the page at the index
+        """
+        placeholder = self._pages[index]
+        if not isinstance(placeholder, PagePlaceholder):
+            return placeholder
+        page = placeholder.build()
+        selected = self.select() == str(placeholder)
+        self.insert(index, page, **self._tab_options(page))
+        self._pages[index] = page
+        # The page is selected before the placeholder goes, so the notebook never shows a neighbouring tab
+        if selected:
+            self.select(str(page))
+        self.forget(str(placeholder))
+        placeholder.destroy()
+        return page
+
+    def _prefetch(self):
+        """Builds the next placeholder and, while any are left, schedules the one after for the next idle moment"""
+        for i, page in enumerate(self._pages):
+            if isinstance(page, PagePlaceholder):
+                self._build(i)
+                self.after(PREFETCH_INTERVAL, self.after_idle, self._prefetch)
+                return
+
+    def save_state(self):
+        """Saves the state of every Reader page that has been built. Pages that were never shown keep the state they
+        were saved with last time"""
+        for page in self._pages:
+            if isinstance(page, ReaderPage):
+                page.save_state()
+
     def save(self):
         try:
             self._current_page().save()
@@ -2,6 +2,10 @@ from tkinter import Event
 from tkinter.ttk import Frame, PanedWindow
 
 from base_widgets import add_bind_tag_to_bindtags
+from database_info import get_change_counter
+from event_bus import reader_bus, writer_bus
+from warm_start import warm_start, save_state, TOPICS
+from workers import get_pool
 from reader_attributes import AttributesFrame
 from reader_body import BodyFrame as ReaderBodyFrame
 from reader_dates import DatesFrame as ReaderDatesFrame
@@ -25,15 +29,22 @@ class ReaderPage(Frame):
 
         self._id = None
 
-        self._reader = ReaderModule(tempfile)
+        # The filter only runs when it is read, which is on the workers
+        self._reader = ReaderModule(tempfile, lazy=True)
 
-        left = ReaderDatesFrame(reader=self._reader, bind_tag=bind_tag, relief='ridge', borderwidth=1, padding=3)
+        # The frames share one bus, so each recomputes once per user action, and it is loaded off the Tk thread
+        self._bus = reader_bus(self, self._reader, self._bind_tag, get_pool(self))
 
-        middle = ReaderBodyFrame(reader=self._reader, relief='ridge', borderwidth=1, padding=3, bind_tag=bind_tag)
+        left = ReaderDatesFrame(reader=self._reader, bind_tag=bind_tag, bus=self._bus, relief='ridge', borderwidth=1,
+                                padding=3)
+
+        middle = ReaderBodyFrame(reader=self._reader, relief='ridge', borderwidth=1, padding=3, bind_tag=bind_tag,
+                                 bus=self._bus)
 
         right = Frame(relief='ridge', borderwidth=1, padding=3)
-        AttributesFrame(master=right, reader=self._reader, bind_tag=bind_tag).pack(fill='x')
-        ReaderTagsFrame(master=right, reader=self._reader, bind_tag=bind_tag).pack(fill='both', expand=True)
+        AttributesFrame(master=right, reader=self._reader, bind_tag=bind_tag, bus=self._bus).pack(fill='x')
+        ReaderTagsFrame(master=right, reader=self._reader, bind_tag=bind_tag, bus=self._bus).pack(fill='both',
+                                                                                                 expand=True)
 
         window = PanedWindow(master=self, orient='horizontal')
         window.add(left, weight=2)
@@ -44,6 +55,7 @@ class ReaderPage(Frame):
         stats = ReaderStatsFrame(master=self,
                                  reader=self._reader,
                                  bind_tag=bind_tag,
+                                 bus=self._bus,
                                  padding=5,
                                  relief='sunken',
                                  borderwidth=1)
@@ -51,6 +63,9 @@ class ReaderPage(Frame):
 
         add_bind_tag_to_bindtags(self)
 
+        # What the page showed when the application last closed is shown again without running the filter
+        warm_start(self._bus, self._reader)
+
         self.bind_class('TNotebook', '<<Refresh ReaderPages>>', self.refresh_from_tempfile)
 
     @property
@@ -98,7 +113,14 @@ class ReaderPage(Frame):
         self.event_generate('<<Tempfile Updated>>')
 
     def refresh_from_tempfile(self, event: Event = None):
-        self.event_generate('<<Tempfile Updated>>')
+        # Readers are refreshed after the database may have changed, and one that already shows it as it is, like one
+        # restored at startup, keeps what it shows rather than running its filter again
+        if not self._bus.current(TOPICS, get_change_counter(self._reader.database)):
+            self.event_generate('<<Tempfile Updated>>')
+
+    def save_state(self):
+        """Saves what the page is showing, so it can be shown straight away when the application is next opened"""
+        return save_state(self._bus, self._reader)
 
 
 class WriterPage(Frame):
@@ -113,6 +135,8 @@ class WriterPage(Frame):
 
         self._writer = WriterModule(tempfile)
 
+        self._bus = writer_bus(self, self._writer, self._bind_tag)
+
         top_left = Frame(relief='ridge', borderwidth=1, padding=3)
         top_left.pack(fill='both', expand=True)
 
@@ -145,6 +169,7 @@ class WriterPage(Frame):
         stats = WriterStatsFrame(master=self,
                                  writer=self._writer,
                                  bind_tag=bind_tag,
+                                 bus=self._bus,
                                  padding=5,
                                  relief='sunken',
                                  borderwidth=1)
@@ -208,8 +233,51 @@ class WriterPage(Frame):
         self.event_generate('<<Refresh Widgets>>')
 
 
+class PagePlaceholder(Frame):
+    """Stands in for a saved page in the notebook until it is first shown. It knows enough about the page to label its
+    tab, but opens no tempfile and builds no widgets"""
+
+    def __init__(self, tempfile: str, bind_tag: str, **kwargs):
+        super(PagePlaceholder, self).__init__(**kwargs)
+
+        self._path = tempfile
+        self._bind_tag = bind_tag
+        self._class_ = 'Reader' if 'Reader' in bind_tag else 'Writer'
+        self._id = None
+
+    @property
+    def bind_tag(self):
+        return self._bind_tag
+
+    @property
+    def class_(self):
+        return self._class_
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def id_(self):
+        return self._id
+
+    @id_.setter
+    def id_(self, v: int):
+        self._id = v
+
+    def build(self, **kwargs):
+        """Builds the page this placeholder stands for
+
+        :return: a ReaderPage or WriterPage
+        """
+        page_type = ReaderPage if self._class_ == 'Reader' else WriterPage
+        page = page_type(tempfile=self._path, bind_tag=self._bind_tag, **kwargs)
+        page.id_ = self._id
+        return page
+
+
 def _test_reader():
-    r = '.tempfiles/Reader/000'
+    r = 'Reader/000'
     from tkinter import Tk
 
     root = Tk()
@@ -218,7 +286,7 @@ def _test_reader():
 
 
 def _test_writer():
-    r = '.tempfiles/Writer/000'
+    r = 'Writer/000'
     from tkinter import Tk
 
     root = Tk()
@@ -0,0 +1,111 @@
+"""Runs SQLite queries that can be stopped part way through. A CancelToken is cancelled from another thread or runs
+out of time, and a progress handler installed for the length of the query makes SQLite abandon it. Tokens are made
+active for a thread, so the body searches and column loads deep inside a Filter find the token of the request they
+are running for without it being passed down"""
+from contextlib import contextmanager
+from sqlite3 import Connection, OperationalError
+from threading import Event, local
+from time import monotonic
+from typing import Callable, Any, List, Iterable
+
+# The number of SQLite virtual machine instructions between checks of the token
+CHECK_INTERVAL = 1000
+_BATCH = 500
+
+_local = local()
+
+
+class Cancelled(Exception):
+    """Raised when a query is stopped by its token"""
+    pass
+
+
+class CancelToken:
+    """Stops the queries it is active for when it is cancelled or its time budget is spent"""
+
+    def __init__(self, budget: float = None, on_partial: Callable[[Any], Any] = None):
+        """
+
+        :param budget: a float representing the seconds the token allows, or None for no limit
+        :param on_partial: a callable that is given partial results as they are found. It is called on the thread
+        running the query
+        """
+        self._event = Event()
+        self._deadline = monotonic() + budget if budget is not None else None
+        self._on_partial = on_partial
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    @property
+    def expired(self):
+        return self._deadline is not None and monotonic() > self._deadline
+
+    @property
+    def stopped(self):
+        return self.cancelled or self.expired
+
+    def cancel(self):
+        self._event.set()
+
+    def check(self):
+        """Raises Cancelled if the token has been cancelled or has expired, for work done between queries"""
+        if self.stopped:
+            raise Cancelled('Cancelled' if self.cancelled else 'Time budget spent')
+
+    def report(self, partial: Any):
+        if self._on_partial:
+            self._on_partial(partial)
+
+    @contextmanager
+    def active(self):
+        """Makes this the token of the calling thread's queries for the length of the block"""
+        previous = getattr(_local, 'token', None)
+        _local.token = self
+        try:
+            yield self
+        finally:
+            _local.token = previous
+
+
+def current_token():
+    """Gets the token active for the calling thread, or None"""
+    return getattr(_local, 'token', None)
+
+
+def execute(connection: Connection, sql: str, parameters: Iterable = (), token: CancelToken = None,
+            on_rows: Callable[[List[tuple]], Any] = None):
+    """Runs a query and fetches its rows in batches, stopping when the token is cancelled or expires
+
+    :param connection: a Connection to the database being queried
+    :param sql: a str representing the query
+    :param parameters: the parameters of the query
+    :param token: a CancelToken, or None for the token active for the calling thread
+    :param on_rows: a callable that is given each batch of rows as it is fetched. Without one, the token is given the
+    number of rows fetched so far
+    :return: a list of the rows
+    :raises Cancelled: if the token stops the query
+    """
+    token = token if token else current_token()
+    if token is None:
+        return connection.execute(sql, parameters).fetchall()
+    token.check()
+    connection.set_progress_handler(lambda: token.stopped, CHECK_INTERVAL)
+    rows = []
+    try:
+        cursor = connection.execute(sql, parameters)
+        for batch in iter(lambda: cursor.fetchmany(_BATCH), []):
+            rows.extend(batch)
+            if on_rows:
+                on_rows(batch)
+            else:
+                token.report(len(rows))
+    except OperationalError:
+        # SQLite reports an interrupted query as an OperationalError
+        if token.stopped:
+            token.check()
+        raise
+    finally:
+        connection.set_progress_handler(None, CHECK_INTERVAL)
+    return rows
@@ -1,12 +1,16 @@
 from os import makedirs
 from os.path import exists, join
-from tkinter import IntVar, Toplevel, Event, Menubutton, Menu
+from tkinter import IntVar, Toplevel, Menubutton, Menu
+from tkinter.messagebox import showerror
 from tkinter.ttk import Frame, Button, Label
 
 from base_widgets import add_bind_tag_to_bindtags
+from event_bus import PageBus, ReaderSnapshot, reader_bus
 from modules import ReaderModule
+from reader_functions import get_attachment_name, get_attachment_file
 from scrolled_frame import VScrolledFrame
 from themes import get_icon
+from workers import get_pool
 
 
 class AttributesButton(Menubutton):
@@ -65,7 +69,7 @@ class AttributesButton(Menubutton):
 
 
 class AttributesFrame(Frame):
-    def __init__(self, reader: ReaderModule, bind_tag: str = None, **kwargs):
+    def __init__(self, reader: ReaderModule, bind_tag: str = None, bus: PageBus = None, **kwargs):
         super(AttributesFrame, self).__init__(**kwargs)
 
         self.attachments_icon = get_icon('ic_attach_file')
@@ -103,21 +107,19 @@ class AttributesFrame(Frame):
                                    image=self.children_icon)
         self.children_btn.pack(side='left', expand=True, fill='x')
 
-        self.set_buttons()
-
         add_bind_tag_to_bindtags(self)
 
-        self.bind_class('{}'.format(self._bind_tag), '<<Id Selected>>', self.set_buttons, add=True)
-        self.bind_class(self._bind_tag, '<<Tempfile Updated>>', self.set_buttons, add=True)
+        self._bus = bus if bus else reader_bus(self, self.reader, self._bind_tag)
+        self._bus.subscribe('entry', self.set_buttons)
 
     @property
     def bind_tag(self):
         return self._bind_tag
 
-    def set_buttons(self, event: Event = None):
-        self.attachments_btn.state(['!disabled' if self.reader.entry_has_attachments else 'disabled'])
-        self.parent_btn.state(['!disabled' if self.reader.entry_has_parent else 'disabled'])
-        self.children_btn.state(['!disabled' if self.reader.entry_has_children else 'disabled'])
+    def set_buttons(self, snapshot: ReaderSnapshot):
+        self.attachments_btn.state(['!disabled' if snapshot.has_attachments else 'disabled'])
+        self.parent_btn.state(['!disabled' if snapshot.has_parent else 'disabled'])
+        self.children_btn.state(['!disabled' if snapshot.has_children else 'disabled'])
 
     def attachments_popup(self):
         t = Toplevel()
@@ -125,12 +127,14 @@ class AttributesFrame(Frame):
         t.bind('<Escape>', lambda x: t.destroy())
 
         def export_file(id_: int):
-            out = 'Exports'
-            if not exists(out):
-                makedirs(out)
-            with open(join(out, self.reader.get_attachment_name(id_)), 'wb') as file:
-                file.write(self.reader.get_attachment_file(id_))
-                file.close()
+            # Attachments can be large, so they are read and written on a worker
+            get_pool(self).submit(('export', id_), _export_attachment, id_, self.reader.database,
+                                  errback=lambda e: export_failed(id_, e))
+
+        def export_failed(id_: int, error: Exception):
+            showerror(title='Export failed', parent=t if t.winfo_exists() else self,
+                      message='The attachment {} could not be exported:\n\n{}'.format(
+                          self.reader.get_attachment_name(id_), error))
 
         e = self.reader.id_
         f = VScrolledFrame(master=t)
@@ -171,10 +175,19 @@ class AttributesFrame(Frame):
         t.focus()
 
 
+def _export_attachment(id_: int, database: str):
+    """Writes an attachment to the Exports folder"""
+    out = 'Exports'
+    if not exists(out):
+        makedirs(out)
+    with open(join(out, get_attachment_name(id_, database)), 'wb') as file:
+        file.write(get_attachment_file(id_, database))
+
+
 def _test():
     from tkinter import Tk
     root = Tk()
-    reader = ReaderModule('.tempfiles/Reader/000')
+    reader = ReaderModule('Reader/000')
     a = AttributesFrame(master=root, reader=reader)
     a.pack()
     root.mainloop()
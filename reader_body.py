@@ -2,9 +2,8 @@ from math import floor
 from tkinter import Toplevel, StringVar, END, Text, Event
 from tkinter.ttk import Entry, Button, Frame, Scrollbar, Label
 
-from PIL import Image, ImageTk
-
-from base_widgets import add_child_class_to_bindtags
+from base_widgets import add_child_class_to_bindtags, BusyIndicator
+from event_bus import PageBus, ReaderSnapshot, reader_bus
 from modules import ReaderModule
 from themes import get_icon
 
@@ -97,7 +96,7 @@ class BodyPopup(Toplevel):
 
 
 class BodyText(Frame):
-    def __init__(self, reader: ReaderModule, bind_tag: str, **kwargs):
+    def __init__(self, reader: ReaderModule, bind_tag: str, bus: PageBus = None, **kwargs):
         super(BodyText, self).__init__(**kwargs)
 
         self._bind_tag = bind_tag
@@ -110,30 +109,33 @@ class BodyText(Frame):
         self.text.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='left', fill='y')
 
-        self.update_text()
-
-        self.bind_class(self._bind_tag, '<<Id Selected>>', self.update_text, add=True)
-        self.bind_class(self._bind_tag, '<<Tempfile Updated>>', self.update_text, add=True)
+        self._bus = bus if bus else reader_bus(self, self.reader, self._bind_tag)
+        self._bus.subscribe('entry', self.update_text)
 
-    def update_text(self, *args):
+    def update_text(self, snapshot: ReaderSnapshot):
         self.text.configure(state='normal')
-        self.text.replace('0.0', 'end', self.reader.entry_body)
+        self.text.replace('0.0', 'end', snapshot.body)
         self.text.configure(state='disabled')
 
 
 class BodyFrame(Frame):
-    def __init__(self, reader: ReaderModule, bind_tag: str, **kwargs):
+    def __init__(self, reader: ReaderModule, bind_tag: str, bus: PageBus = None, **kwargs):
         super(BodyFrame, self).__init__(**kwargs)
 
+        bus = bus if bus else reader_bus(self, reader, bind_tag)
+
         header = Frame(master=self, relief='ridge', borderwidth=1, padding=5)
         header.pack(side='top', fill='x')
         Label(master=header, text='CONTENTS').pack(side='left')
+        busy = BusyIndicator(master=header)
+        busy.pack(side='left', padx=5)
+        bus.add_busy_listener('entry', busy.set_busy)
         BodyButton(master=header, reader=reader, bind_tag=bind_tag).pack(side='right')
-        BodyText(master=self, reader=reader, bind_tag=bind_tag).pack(side='top', fill='both', expand=True)
+        BodyText(master=self, reader=reader, bind_tag=bind_tag, bus=bus).pack(side='top', fill='both', expand=True)
 
 
 def _test():
-    reader = ReaderModule('.tempfiles/Reader/000')
+    reader = ReaderModule('Reader/000')
 
     from tkinter import Tk
     root = Tk()
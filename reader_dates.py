@@ -1,16 +1,16 @@
 from datetime import datetime
 from math import floor
-from tkinter import Toplevel, StringVar, IntVar, Event
+from tkinter import Toplevel, StringVar, IntVar, Event, Menu
 from tkinter.font import Font
-from tkinter.ttk import Frame, Checkbutton, Button, Scale, Label, Style, Radiobutton, Separator, Labelframe
-from typing import Tuple
+from tkinter.ttk import Frame, Checkbutton, Button, Scale, Label, Style, Radiobutton, Separator, Labelframe, Menubutton
+from typing import Tuple, Dict, List, Union, Callable, Any
 
-from PIL import Image, ImageTk
-
-from base_widgets import add_bind_tag_to_bindtags
+from base_widgets import add_bind_tag_to_bindtags, VirtualList, BusyIndicator
+from bitmap_index import DATE_PARTS
+from event_bus import PageBus, ReaderSnapshot, reader_bus, PAGE
 from filter import check_day_against_month
 from modules import ReaderModule
-from scrolled_frame import VScrolledFrame
+from reader_query import QueryButton
 from themes import get_icon
 
 
@@ -24,10 +24,26 @@ class DateRadiobutton(Radiobutton):
     def id_(self):
         return self._id
 
+    @id_.setter
+    def id_(self, v: int):
+        self._id = v
+
+
+SORT_LABELS = {
+    'created': 'Date Created',
+    'last_edit': 'Last Edited',
+    'last_access': 'Last Opened',
+    'length': 'Length',
+    'words': 'Word Count',
+    'avg_word_len': 'Characters Per Word',
+    'tags': 'Tag Count',
+    'attachments': 'Attachment Count',
+    'thread': 'Thread Size'
+}
+
 
-# TODO add "sort by" methods (e.g. sort by recently accessed, most tags, length, cpw, other?)
 class DatesFrame(Frame):
-    def __init__(self, reader: ReaderModule, bind_tag: str = None, **kwargs):
+    def __init__(self, reader: ReaderModule, bind_tag: str = None, bus: PageBus = None, **kwargs):
         super(DatesFrame, self).__init__(**kwargs)
 
         self.filters_icon = get_icon('ic_filter_list')
@@ -36,7 +52,15 @@ class DatesFrame(Frame):
 
         self._reader = reader
 
-        self._ids: Tuple = ()
+        # Only a window of the filtered entries is held, starting at the position first, and more rows are read as
+        # they come into view
+        self._snapshot: Union[ReaderSnapshot, None] = None
+        self._count = 0
+        self._first = 0
+        self._rows: List[Tuple[datetime, int]] = []
+        self._fetching = False
+        self._missed: Union[Tuple[int, int], None] = None
+        self._target: Union[int, None] = None
 
         font = Font(font='TkDefaultFont')
         font.configure(slant='italic')
@@ -50,20 +74,38 @@ class DatesFrame(Frame):
 
         self.label = Label(master=header, text='DATES')
         self.popup = Button(master=header, text='Filters', image=self.filters_icon, command=self.call_popup)
+        self.query = QueryButton(master=header, reader=self._reader, bind_tag=self._bind_tag)
+
+        sort = self._reader.sort
+        self.sort_key = StringVar(value=sort[0][0] if sort else 'created')
+        self.sort_descending = IntVar(value=int(sort[0][1]) if sort else 0)
+        self.sort_button = Menubutton(master=header, text='Sort')
+        sort_menu = Menu(master=self.sort_button, tearoff=0)
+        for key, label in SORT_LABELS.items():
+            sort_menu.add_radiobutton(label=label, value=key, variable=self.sort_key, command=self.set_sort)
+        sort_menu.add_separator()
+        sort_menu.add_checkbutton(label='Descending', variable=self.sort_descending, command=self.set_sort)
+        self.sort_button['menu'] = sort_menu
+
+        self.busy = BusyIndicator(master=header)
+
         self.label.pack(side='left')
+        self.busy.pack(side='left', padx=5)
         self.popup.pack(side='right')
+        self.query.pack(side='right')
+        self.sort_button.pack(side='right')
 
-        self._buttons = VScrolledFrame(master=self, relief='ridge', borderwidth=1)
+        self._buttons = VirtualList(master=self, make_row=self._make_row, fill_row=self._fill_row,
+                                    prefetch=self._fetch_rows, relief='ridge', borderwidth=1)
         self._buttons.pack(fill='both', expand=True)
 
-        self.ids = self.reader.filtered_ids
-        self.current.set(self._reader.id_)
-
         add_bind_tag_to_bindtags(self)
 
-        self.bind_class(self._bind_tag, '<<Filter Attributes Changed>>', self.update_ids, add=True)
-        self.bind_class(self._bind_tag, '<<Id Selected>>', self.update_from_tempfile, add=True)
-        self.bind_class(self._bind_tag, '<<Tempfile Updated>>', self.update_ids, add=True)
+        self._bus = bus if bus else reader_bus(self, self._reader, self._bind_tag)
+        self._bus.subscribe('ids', self.update_ids)
+        self._bus.add_busy_listener('ids', self.busy.set_busy)
+        self._bus.add_progress_listener('ids', self.show_progress)
+        self._bus.subscribe('entry', self.update_from_tempfile)
 
     @property
     def bind_tag(self):
@@ -78,30 +120,136 @@ class DatesFrame(Frame):
         return self._reader.all_dates
 
     @property
-    def ids(self):
-        return self._ids
-
-    @ids.setter
-    def ids(self, v: Tuple[int]):
-        self._ids = v
-        self.repack()
+    def count(self):
+        """The number of filtered entries"""
+        return self._count
 
     def repack(self):
-        temp = self._buttons
-        new = VScrolledFrame(master=self, relief='ridge', borderwidth=1)
-        for i in self._ids:
-            button = DateRadiobutton(master=new, id_=i,
-                                     text=self._reader.get_date(i).strftime('%a, %b %d, %Y %H:%M') + ' ({})'.format(i),
-                                     value=i, variable=self.current, command=self.set_id)
-            button.pack(fill='x', anchor='e', expand=True)
-        new.pack(fill='both', expand=True)
-        self._buttons = new
-        self._buttons.pack(fill='both', expand=True)
-        temp.destroy()
+        """Shows the current entries. Only the rows in view have widgets, so this costs the same for any number of
+        entries"""
+        self._buttons.count = self._count
+        self.see_current()
+
+    def _make_row(self, master: Frame):
+        button = DateRadiobutton(master=master, id_=0, value=0, variable=self.current, command=self.set_id)
+        for sequence, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', -10), ('<Next>', 10)):
+            button.bind(sequence, lambda e, s=step: self.move(s))
+        button.bind('<Home>', lambda e: self.move(-self._count))
+        button.bind('<End>', lambda e: self.move(self._count))
+        return button
+
+    def _row(self, position: int):
+        """Gets the creation date and id of the entry at a position, or None if it has not been read yet"""
+        if self._first <= position < self._first + len(self._rows):
+            return self._rows[position - self._first]
+        return None
+
+    def _fill_row(self, button: DateRadiobutton, index: int):
+        row = self._row(index)
+        if row is None:
+            # The row is shown blank until it has been read
+            button.id_ = 0
+            button.configure(text='', value=-1)
+            button.state(['disabled', '!selected'])
+            return
+        created, id_ = row
+        button.id_ = id_
+        button.configure(text='{} ({})'.format(created.strftime('%a, %b %d, %Y %H:%M'), id_), value=id_)
+        button.state(['!disabled', 'selected' if id_ == self.current.get() else '!selected'])
+
+    def _fetch_rows(self, start: int, stop: int):
+        """Reads the rows coming into view on a worker, unless they have been read already. Rows next to the window
+        are read with the cursor of its first or last row, and rows further away from the position they start at"""
+        snapshot = self._snapshot
+        end = self._first + len(self._rows)
+        if snapshot is None or self._fetching or self._first <= start and stop <= end or (start, stop) == self._missed:
+            return
+        if self._rows and end <= start < end + PAGE:
+            mode, function, args = 'after', snapshot.page, (self._rows[-1], None, max(PAGE, stop - end))
+        elif self._rows and self._first - PAGE < stop <= self._first:
+            mode, function, args = 'before', snapshot.page, (None, self._rows[0], max(PAGE, self._first - start))
+        else:
+            limit = max(PAGE, stop - start)
+            position = max(start - (limit - (stop - start)) // 2, 0)
+            mode, function, args = position, snapshot.seek, (position, limit)
+        self._fetching = True
+        self._bus.fetch('rows', function, *args,
+                        callback=lambda rows: self._receive_rows(snapshot, mode, rows, (start, stop)))
+
+    def _receive_rows(self, snapshot: ReaderSnapshot, mode: Union[str, int], rows: Tuple[Tuple[datetime, int], ...],
+                      wanted: Tuple[int, int]):
+        """Adds rows that were read to the window
+
+        :param mode: 'after' or 'before' for rows read next to the window, or an int representing the position rows
+        read further away start at, which replace the window
+        """
+        # Rows read for entries that have since been filtered again are dropped
+        if snapshot is not self._snapshot:
+            return
+        self._fetching = False
+        if mode == 'after':
+            self._rows.extend(rows)
+        elif mode == 'before':
+            self._first -= len(rows)
+            self._rows[:0] = rows
+        else:
+            self._first, self._rows = mode, list(rows)
+        # The window is kept to a few pages around the rows in view
+        keep = 3 * PAGE
+        if len(self._rows) > keep:
+            first = max(min(self._buttons.first - PAGE, self._first + len(self._rows) - keep), self._first)
+            self._rows = self._rows[first - self._first:first - self._first + keep]
+            self._first = first
+        # A range that could not be read is not asked for again, e.g. if the database changed in the meantime
+        start, stop = wanted
+        if not (self._first <= start and stop <= self._first + len(self._rows)):
+            self._missed = wanted
+        if self._target is not None and self._row(self._target):
+            target, self._target = self._target, None
+            self._select(target)
+        else:
+            self._buttons.refresh()
+
+    def position(self, id_: int):
+        """Gets where an id is in the list, or None if it has been filtered out or is not among the rows read"""
+        for i, (_, row_id) in enumerate(self._rows):
+            if row_id == id_:
+                return self._first + i
+        return None
+
+    def see_current(self):
+        """Scrolls the selected entry into view"""
+        position = self.position(self.current.get())
+        if position is not None:
+            self._buttons.see(position)
+
+    def move(self, step: int):
+        """Selects the entry a number of rows away from the selected one, e.g. from the arrow keys. If that row has not
+        been read yet, it is selected once it has"""
+        if not self._count:
+            return 'break'
+        position = self.position(self.current.get())
+        position = 0 if position is None else max(min(position + step, self._count - 1), 0)
+        if self._row(position) is None:
+            self._target = position
+            self._buttons.see(position)
+            self._buttons.refresh()
+        else:
+            self._select(position)
+        return 'break'
+
+    def _select(self, position: int):
+        self.current.set(self._row(position)[1])
+        self._buttons.see(position)
+        self._buttons.refresh()
+        row = self._buttons.row(position)
+        if row:
+            row.focus_set()
+        self.set_id()
 
     def call_popup(self):
         p = DatesPopup(self.current,
-                       DateVars(self.reader),
+                       DateVars(self.reader, self._bus),
                        old=self.reader.oldest_year,
                        new=self.reader.newest_year,
                        bind_tag=self._bind_tag,
@@ -109,20 +257,35 @@ class DatesFrame(Frame):
         p.grab_set()
         p.focus()
 
+    def set_sort(self):
+        key, descending = self.sort_key.get(), bool(self.sort_descending.get())
+        self.reader.sort = ((key, descending),) if key != 'created' or descending else ()
+        self.event_generate('<<Filter Attributes Changed>>')
+
     def set_id(self, *args):
         self.reader.id_ = self.current.get()
         self.event_generate('<<Id Selected>>')
 
-    def update_from_tempfile(self, event: Event = None):
-        if event:
-            self.current.set(self.reader.id_ if self.reader.id_ else 0)
+    def update_from_tempfile(self, snapshot: ReaderSnapshot):
+        self.current.set(snapshot.id_ if snapshot.id_ else 0)
+        self.see_current()
+
+    def update_ids(self, snapshot: ReaderSnapshot):
+        # An entry that has been filtered out is deselected by the bus, which then delivers the entry as well
+        self.label.configure(text='DATES')
+        # The snapshot holds the count and a page of rows around the selected entry, and the rest are read from it
+        self._snapshot = snapshot
+        self._count = snapshot.count
+        self._first = snapshot.first
+        self._rows = list(snapshot.rows)
+        self._fetching = False
+        self._missed = None
+        self._target = None
+        self.repack()
 
-    def update_ids(self, event: Event = None):
-        self.ids = self.reader.filtered_ids
-        if self.reader.id_ not in self._ids:
-            self.current.set(0)
-            self.reader.id_ = 0
-            self.event_generate('<<Id Selected>>')
+    def show_progress(self, found: int):
+        """Shows how many entries a search has matched while it is still running"""
+        self.label.configure(text='DATES ({} found...)'.format(found))
 
 
 def month_str(value: int, fmt: str = 'long'):
@@ -141,8 +304,15 @@ def weekday_str(value: int, fmt: str = 'long'):
 
 
 class DateVars:
-    def __init__(self, reader: ReaderModule):
+    def __init__(self, reader: ReaderModule, bus: PageBus):
+        """
+
+        :param reader: the ReaderModule of the page
+        :param bus: the PageBus of the page, whose worker counts the entries the scales let through
+        """
         self._reader = reader
+        self._bus = bus
+        self._histograms: Dict[str, Dict[int, int]] = {}
 
         self.sort_var = IntVar()
 
@@ -232,16 +402,62 @@ class DateVars:
                 ).strftime('%a, %b %d, %Y, %H:%M')
             )
 
-    def set_filters(self):
-        keys_ = []
+    @property
+    def dates(self):
+        """The date filter currently set on the scales
+
+        :rtype: Dict[str, int]
+        """
+        dates = self._reader.dates
         for e in ['high', 'low']:
             for t in ['year', 'month', 'day', 'hour', 'minute', 'weekday']:
-                keys_.append(('{} {}'.format(e, t), '{}_{}_int'.format(e, t)))
-        dates = self._reader.dates
-        for key in keys_:
-            dates[key[0]] = getattr(self, key[1]).get()
-        self._reader.date_filter = self.sort_var.get()
-        self._reader.dates = dates
+                dates['{} {}'.format(e, t)] = getattr(self, '{}_{}_int'.format(e, t)).get()
+        return dates
+
+    def set_filters(self):
+        self._reader.update(date_filter=self.sort_var.get(), dates=self.dates)
+
+    def count_matches(self, callback: Callable[[int], Any]):
+        """Counts the entries the scales would let through alongside the reader's other filters on a worker
+
+        :param callback: a callable that is given the count on the Tk thread
+        """
+        snapshot = ReaderSnapshot(self._reader)
+        self._bus.fetch('date matches', snapshot.count_dates, self.dates, self.sort_var.get(), callback=callback)
+
+    def load_histograms(self, callback: Callable[[], Any]):
+        """Reads the histograms count_part needs on a worker. They are read once, as dragging the scales does not
+        change them
+
+        :param callback: a callable that is called on the Tk thread once they are ready
+        """
+        if self._histograms:
+            callback()
+            return
+
+        def _loaded(histograms: Dict[str, Dict[int, int]]):
+            self._histograms = histograms
+            callback()
+
+        snapshot = ReaderSnapshot(self._reader)
+        self._bus.fetch('date histograms', snapshot.date_histograms, DATE_PARTS, callback=_loaded)
+
+    def count_part(self, part: str):
+        """Counts the entries, among those let through by the reader's other filters, whose date part lies within the
+        range set on its scales
+
+        :return: an int, or None if the histograms have not been loaded
+        """
+        if part not in self._histograms:
+            return None
+        low = getattr(self, 'low_{}_int'.format(part)).get()
+        high = getattr(self, 'high_{}_int'.format(part)).get()
+        return sum(n for v, n in self._histograms[part].items() if low <= v <= high)
+
+    def cancel(self):
+        """Stops the counts that are in flight, e.g. when the popup closes"""
+        self._bus.cancel('date matches')
+        self._bus.cancel('date histograms')
 
     def set_date_int_vars(self):
         dates = self._reader.dates
@@ -312,9 +528,14 @@ class DatesPopup(Toplevel):
                              height=10)
 
         self._current = current_var
+        self._date_vars = date_vars
         self.sort_var = date_vars.sort_var
         self._initial = date_vars.sort_var.get()
 
+        self._match_str = StringVar()
+        self._part_strs = {t: StringVar() for t in ['year', 'month', 'day', 'hour', 'minute', 'weekday']}
+        self._pending = None
+
         self._sort_button_holder = Frame(master=self)
         left_frame = Frame(master=self._sort_button_holder, height=30, width=200)
         left_frame.pack_propagate(False)
@@ -328,6 +549,7 @@ class DatesPopup(Toplevel):
         right_frame.pack_propagate(False)
         reset_button = Button(master=right_frame, text='Reset', command=date_vars.reset_int_vars)
         reset_button.pack(side='right', anchor='e')
+        Label(master=right_frame, textvariable=self._match_str).pack(side='left', anchor='w')
         self._sort_button.pack(side='left', anchor='w')
         right_frame.pack(side='left', fill='x', expand=True)
         self._sort_button_holder.pack(side='top', fill='x')
@@ -387,7 +609,7 @@ class DatesPopup(Toplevel):
         self._labels_i = Frame(master=self._i_frame)
         for a in ['year', 'month', 'day', 'hour', 'minute', 'weekday']:
             outer = Frame(master=self._labels_i, borderwidth=1, relief='sunken')
-            inner = Frame(master=outer, width=118, height=70)
+            inner = Frame(master=outer, width=118, height=90)
             inner.pack_propagate(False)
             low = Label(master=inner, textvariable=getattr(date_vars, 'low_{}_str'.format(a)))
             low.pack(anchor='w', fill='x', expand=True)
@@ -395,10 +617,19 @@ class DatesPopup(Toplevel):
             to.pack(anchor='w')
             high = Label(master=inner, textvariable=getattr(date_vars, 'high_{}_str'.format(a)))
             high.pack(anchor='w', fill='x', expand=True)
+            count = Label(master=inner, textvariable=self._part_strs[a])
+            count.pack(anchor='w', fill='x', expand=True)
             inner.pack(side='left')
             outer.pack(side='left', fill='both', expand=True)
         self._labels_i.pack(fill='x')
 
+        # The counts are refreshed once per burst of scale movements rather than on every variable write
+        self._traces = []
+        for e in ['low', 'high']:
+            for t in ['year', 'month', 'day', 'hour', 'minute', 'weekday']:
+                var = getattr(date_vars, '{}_{}_int'.format(e, t))
+                self._traces.append((var, var.trace_add('write', self._schedule_counts)))
+
         # self.bind('<Configure>', self.reconfigure)
         self.set_scales_frame()
 
@@ -426,8 +657,33 @@ class DatesPopup(Toplevel):
         else:
             self._i_frame.pack(fill='both', expand=True)
             self._c_frame.pack_forget()
+        self._schedule_counts()
+
+    def _schedule_counts(self, *args):
+        if self._pending is None:
+            self._pending = self.after_idle(self._update_counts)
+
+    def _update_counts(self):
+        # The counts are read on the page's worker, so dragging the scales never waits on the database
+        self._pending = None
+        self._date_vars.count_matches(self._show_matches)
+        if self.sort_var.get() == 1:
+            self._date_vars.load_histograms(self._show_parts)
+
+    def _show_matches(self, n: int):
+        self._match_str.set('{} {} match'.format(n, 'entry' if n == 1 else 'entries'))
+
+    def _show_parts(self):
+        for part, var in self._part_strs.items():
+            var.set('{} in range'.format(self._date_vars.count_part(part)))
 
     def save_and_close(self):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
+        for var, trace in self._traces:
+            var.trace_remove('write', trace)
+        self._date_vars.cancel()
         if self._initial != self.sort_var.get():
             self._current.set(0)
         self.set_filters()
@@ -460,7 +716,8 @@ def _test_date_vars():
 
     from tkinter import Tk
     root = Tk()
-    a = DateVars(ReaderModule(path_to_tempfile='.tempfiles/Reader/000'))
+    reader = ReaderModule(path_to_tempfile='Reader/000')
+    a = DateVars(reader, reader_bus(root, reader, 'Reader1'))
     print_vars()
     a.sort_var.set(0)
     a.high_month_int.set(10)
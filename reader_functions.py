@@ -1,11 +1,12 @@
 """Classes and functions for reading entries and other information from the database"""
 from contextlib import closing
 from datetime import datetime
-from sqlite3 import connect, PARSE_DECLTYPES, PARSE_COLNAMES
+from sqlite3 import connect, OperationalError, PARSE_DECLTYPES, PARSE_COLNAMES
 from typing import Union, Tuple
 
 from configurations import default_database
 from database_info import get_all_entry_ids
+from entry_metrics import METRICS
 
 
 # TODO move Reader class to new module
@@ -184,6 +185,25 @@ def get_body(entry_id: int, database: str = None):
         return d.execute('SELECT body FROM bodies WHERE entry_id=?', (entry_id,)).fetchone()[0]
 
 
+def get_metrics(entry_id: int, database: str = None):
+    """Gets the precomputed metrics of a given entry's body
+
+    :rtype: dict
+    :param entry_id: an int representing the given entry
+    :param database: a Connection or str representing the database that is being queried
+    :return: a dict of the metrics in entry_metrics.METRICS, or None if the entry has not been measured
+    """
+    db = connect(database) if database else connect(default_database())
+    with closing(db) as d:
+        try:
+            row = d.execute('SELECT {} FROM entry_metrics WHERE entry_id=?'.format(', '.join(METRICS)),
+                            (entry_id,)).fetchone()
+        except OperationalError:
+            # The database has not been upgraded yet
+            row = None
+    return dict(zip(METRICS, row)) if row else None
+
+
 """---------------------------------Tags Methods----------------------------------"""
 
 
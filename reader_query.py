@@ -0,0 +1,101 @@
+from tkinter import Toplevel, StringVar, END, Event
+from tkinter.ttk import Entry, Button, Frame, Label
+
+from base_widgets import add_child_class_to_bindtags
+from modules import ReaderModule
+
+
+class QueryButton(Button):
+    def __init__(self, reader: ReaderModule, bind_tag: str, **kwargs):
+        super(QueryButton, self).__init__(**kwargs)
+
+        self._bind_tag = bind_tag
+
+        self.reader = reader
+
+        self.configure(text='Query', command=self.popup)
+
+    def popup(self):
+        popup = QueryPopup(reader=self.reader,
+                           bind_tag=self._bind_tag,
+                           location=(self.winfo_rootx(), self.winfo_rooty()))
+        popup.grab_set()
+        popup.focus()
+
+
+class QueryPopup(Toplevel):
+    """Takes a query such as 'tag:work AND NOT has:attachments', which is combined with the Reader's other filters. See
+    filter_query for the language"""
+
+    def __init__(self, reader: ReaderModule, bind_tag: str, **kwargs):
+        location = kwargs.pop('location') if 'location' in kwargs.keys() else ()
+        dims = [50, 27, location[0], location[1]] if location else [50, 27]
+        super(QueryPopup, self).__init__(**kwargs)
+
+        self.protocol('WM_DELETE_WINDOW', self.save_and_close)
+
+        self._bind_tag = bind_tag
+
+        add_child_class_to_bindtags(self)
+
+        self.withdraw()
+
+        self.title('Filter By Query')
+        self.bind('<Escape>', lambda e: self.destroy())
+
+        self.reader = reader
+
+        self.query_var = StringVar(value=self.reader.query)
+        self.error_var = StringVar()
+
+        top = Frame(master=self)
+        self.query_field = Entry(master=top, width=60, textvariable=self.query_var)
+        self.query_field.pack(side='left', fill='x', expand=True)
+
+        self.query_field.bind('<Return>', self.save_and_close)
+        self.query_field.bind('<KP_Enter>', self.save_and_close)
+
+        clear = Button(master=top, text='Clear', command=self.clear)
+        clear.pack(side='right')
+        top.pack(fill='x')
+        Label(master=self, textvariable=self.error_var, foreground='red').pack(fill='x')
+
+        self.query_field.focus()
+        self.query_field.select_range(0, END)
+        self.query_field.icursor(END)
+
+        self.update_idletasks()
+
+        dims[0], dims[1] = self.winfo_reqwidth(), self.winfo_reqheight()
+        dims[3] = dims[3] + 27
+        dims_str = '{}x{}+{}+{}'.format(*dims)
+
+        self.geometry(dims_str)
+
+        self.after(50, self.deiconify)
+
+        self.bind('<Button-1>', self._check_click)
+
+    @property
+    def bind_tag(self):
+        return self._bind_tag
+
+    def save_and_close(self, *args):
+        try:
+            self.reader.query = self.query_var.get()
+        except ValueError as e:
+            # The popup stays open until the query is fixed or cleared
+            self.error_var.set(str(e))
+            self.query_field.focus()
+            return
+        self.event_generate('<<Filter Attributes Changed>>')
+        self.destroy()
+
+    def clear(self, *args):
+        self.query_var.set('')
+        self.error_var.set('')
+        self.reader.query = ''
+
+    def _check_click(self, event: Event):
+        if str(self) not in str(self.focus_get()):
+            self.save_and_close()
@@ -1,11 +1,12 @@
 from tkinter import StringVar, Event, Menubutton, Menu
 from tkinter.ttk import Button, Label, Frame
 
+from event_bus import PageBus, ReaderSnapshot, reader_bus
 from modules import ReaderModule
 
 
 class ReaderStatsFrame(Frame):
-    def __init__(self, reader: ReaderModule, bind_tag: str = None, **kwargs):
+    def __init__(self, reader: ReaderModule, bind_tag: str = None, bus: PageBus = None, **kwargs):
         super(ReaderStatsFrame, self).__init__(**kwargs)
 
         self._bind_tag = bind_tag if bind_tag is not None else ''
@@ -26,6 +27,11 @@ class ReaderStatsFrame(Frame):
         self._status_label = Label(master=self, textvariable=self.status_label_var)
 
         self.counter_label_var = StringVar(name='counter_var.{}'.format(self._bind_tag), value='0 | 0')
+        self.words_label_var = StringVar(name='words_var.{}'.format(self._bind_tag))
+        self.entry_label_var = StringVar(name='entry_var.{}'.format(self._bind_tag))
+
+        entry_label = Label(master=self, textvariable=self.entry_label_var)
+        entry_label.pack(side='left', padx=5)
 
         counter_label = Label(master=self, textvariable=self.counter_label_var)
         counter_label.pack(side='right', padx=5)
@@ -33,21 +39,36 @@ class ReaderStatsFrame(Frame):
         count_descriptor = Label(master=self, text='Proportion: ')
         count_descriptor.pack(side='right', padx=(5, 0))
 
-        self.update_counter()
+        words_label = Label(master=self, textvariable=self.words_label_var)
+        words_label.pack(side='right', padx=5)
 
-        self.bind_class(self._bind_tag, '<<Filter Attributes Changed>>', self.update_counter, add=True)
         self.bind_class(self._bind_tag, '<<Status Updated>>', self.update_status, add=True)
-        self.bind_class(self._bind_tag, '<<Tempfile Updated>>', self.update_counter, add=True)
 
-    def update_counter(self, event: Event = None):
-        num = len(self._reader.filtered_ids)
-        den = len(self._reader.all_ids)
+        self._bus = bus if bus else reader_bus(self, self._reader, self._bind_tag)
+        self._bus.subscribe('ids', self.update_counter)
+        self._bus.subscribe('entry', self.update_entry)
+
+    def update_counter(self, snapshot: ReaderSnapshot):
+        num = snapshot.count
+        den = snapshot.total
         try:
             prop = round(100 * num / den)
             text = '{} | {} ({}%)'.format(num, den, prop)
         except ZeroDivisionError:
             text = '{} | {} (N/A)'.format(num, den)
         self.counter_label_var.set(text)
+        words = snapshot.words
+        minutes = snapshot.reading_time / 60
+        self.words_label_var.set('{} words (~{:.0f} min)'.format(words, minutes))
+
+    def update_entry(self, snapshot: ReaderSnapshot):
+        metrics = snapshot.metrics
+        if metrics:
+            text = 'Entry: {} words, {} lines, ~{:.0f} min'.format(metrics['words'], metrics['lines'],
+                                                                 metrics['reading_time'] / 60)
+        else:
+            text = ''
+        self.entry_label_var.set(text)
 
     def update_status(self, event: Event = None):
         # TODO implement events
@@ -1,28 +1,16 @@
 from math import floor
 from tkinter import StringVar, IntVar, Menu, Toplevel, Event
 from tkinter.ttk import Frame, Button, Entry, Checkbutton, Label, Menubutton
-from typing import List, TypeVar, Tuple
+from typing import TypeVar, Tuple
 
-from PIL import Image, ImageTk
-
-from base_widgets import ScrollingFrame, add_bind_tag_to_bindtags
+from base_widgets import ScrollingFrame, TagChecklist, add_bind_tag_to_bindtags
+from event_bus import PageBus, ReaderSnapshot, reader_bus
 from modules import ReaderModule
 from themes import get_icon
 
 T = TypeVar('T')
 
 
-class TagIntVar(IntVar):
-    def __init__(self, tag, **kwargs):
-        super(TagIntVar, self).__init__(**kwargs)
-
-        self._tag = tag
-
-    @property
-    def tag(self):
-        return self._tag
-
-
 class TagsPopup(Toplevel):
     def __init__(self, reader: ReaderModule, bind_tag: str = None, **kwargs):
         location = kwargs.pop('location') if 'location' in kwargs.keys() else ()
@@ -42,10 +30,7 @@ class TagsPopup(Toplevel):
 
         self._reader = reader
 
-        self._all_tags = []
-        self._selected_tags = []
-        self._unselected_tags = []
-        self._tag_vars: List[TagIntVar] = []
+        self._reader_tags = self._reader.all_tags
 
         self._filter_var = StringVar(master=self,
                                      value='',
@@ -78,10 +63,9 @@ class TagsPopup(Toplevel):
         filter_clear_button.pack(side='right')
         filter_holder.pack(fill='x', ipady=1)
 
-        buttons_frame = ScrollingFrame(master=self, width=self.winfo_width() - 15, height=self.winfo_height() - 47)
-        buttons_frame.pack(fill='both', expand=True)
-
-        self._inner = buttons_frame.inner
+        # Each click filters the page straight away, and the page's bus coalesces clicks made in quick succession
+        self._checklist = TagChecklist(master=self, command=self.apply)
+        self._checklist.pack(fill='both', expand=True)
 
         options_holder = Frame(master=self)
         options_holder.pack(side='bottom', fill='x')
@@ -110,10 +94,11 @@ class TagsPopup(Toplevel):
 
         add_bind_tag_to_bindtags(self)
 
+        # The tags are selected before the mode is set, so setting the mode finds nothing to apply
+        self.selected_tags = self._reader.tags
         self._type_int.set(self._reader.tag_filter)
         self._sort_var.set(self._reader.tags_autosort)
-
-        self.selected_tags = self._reader.tags
+        self._checklist.autosort = self._sort_var.get() == 1
 
         dims[2] = dims[2] - dims[0] + 27
         dims[3] = dims[3] + 27
@@ -131,85 +116,73 @@ class TagsPopup(Toplevel):
 
     @property
     def all_tags(self):
-        return self._all_tags
+        return self._checklist.tags
 
     @property
     def selected_tags(self):
-        return self._selected_tags
+        return self._checklist.selected
 
     @selected_tags.setter
     def selected_tags(self, tags: Tuple[str]):
-        self._all_tags = list(set(self._all_tags).union(tags).union(self._reader.all_tags))
-        self._tag_vars = [TagIntVar(tag=tag, value=1 if tag in tags else 0) for tag in self._all_tags]
-        self._tag_vars.sort(key=lambda x: x.tag)
-        self._selected_tags = tags
-        self._unselected_tags = tuple(set(self._all_tags).difference(self._selected_tags))
-        self._reader.tags = tuple(tags)
-        self.repack()
+        # The journal's tags are read once when the popup opens; selected tags that are no longer in it still get a row
+        self._checklist.tags = set(self._reader_tags).union(tags)
+        self._checklist.selected = tags
 
     @property
     def unselected_tags(self):
-        return self._unselected_tags
+        return self._checklist.unselected
 
     def repack(self, *args):
-        if self._sort_var.get() == 1:
-            selected = [x for x in self._tag_vars if all([self._filter_var.get().lower() in x.tag.lower(),
-                                                          x.get() == 1])]
-            unselected = [x for x in self._tag_vars if all([self._filter_var.get().lower() in x.tag.lower(),
-                                                            x.get() == 0])]
-            all_ = selected + unselected
-        else:
-            all_ = [var for var in self._tag_vars if self._filter_var.get().lower() in var.tag.lower()]
-
-        for b in self._inner.pack_slaves():
-            b.pack_forget()
-
-        for var in all_:
-            button = Checkbutton(master=self._inner, text=var.tag, variable=var, command=self.swap)
-            button.pack(fill='x', expand=True)
+        self._checklist.pattern = self._filter_var.get()
 
     def add(self, *args):
         tag = self._filter_var.get()
-        if tag and tag in self._reader.all_tags:
-            tags = list(self._selected_tags)
+        if tag and tag in self._reader_tags:
+            tags = list(self.selected_tags)
             tags.append(tag)
             self.selected_tags = tuple(tags)
+            self.apply()
         self._filter_var.set('')
 
-    def swap(self):
-        tags = tuple([x.tag for x in self._tag_vars if x.get() == 1])
-        self.selected_tags = tags
-
     def select_all(self):
         self._filter_var.set('')
         self.selected_tags = self.all_tags
+        self.apply()
 
     def select_none(self):
         self._filter_var.set('')
         self.selected_tags = []
+        self.apply()
 
     def select_invert(self):
-        temp = self._unselected_tags
-        self._unselected_tags = self._selected_tags
         self._filter_var.set('')
-        self.selected_tags = temp
+        self.selected_tags = self.unselected_tags
+        self.apply()
 
     def toggle_autosort(self):
         setting = self._sort_var.get()
         self._reader.tags_autosort = setting
-        self.repack()
+        self._checklist.autosort = setting == 1
 
     def set_filter_type(self, *args):
         num = self.getvar(args[0])
-        self._reader.tag_filter = num
         type_ = ['Contains Any Of...', 'Contains At Least...', 'Contains Only...'][num]
         self._type_str.set(type_)
+        self.apply()
+
+    def apply(self):
+        """Filters the page by the selected tags and mode, if either has changed. The filter is lazy, so this only
+        records them, and the page is refreshed by its bus on the next idle tick"""
+        tags, mode = tuple(self.selected_tags), self._type_int.get()
+        if set(tags) == set(self._reader.tags) and mode == self._reader.tag_filter:
+            return
+        self._reader.update(tags=tags, tag_filter=mode)
+        self.event_generate('<<Filter Attributes Changed>>')
 
     def save_and_close(self, *args):
         self._filter_var.trace_remove('write', self._filter_var_trace)
         self._type_int.trace_remove('write', self._type_int_trace)
-        self._reader.tags = self.selected_tags
-        self.event_generate('<<Tempfile Updated>>')
+        self.apply()
         self.destroy()
 
     def _on_enter(self, event: Event):
@@ -251,7 +224,7 @@ class TagsButton(Button):
 
 
 class TagsFrame(Frame):
-    def __init__(self, reader: ReaderModule, bind_tag: str = None, **kwargs):
+    def __init__(self, reader: ReaderModule, bind_tag: str = None, bus: PageBus = None, **kwargs):
         super(TagsFrame, self).__init__(**kwargs)
 
         self._bind_tag = bind_tag if bind_tag else ''
@@ -270,14 +243,13 @@ class TagsFrame(Frame):
         self._tags_frame = ScrollingFrame(master=self, relief='ridge', borderwidth=1, padding=5)
         self._tags_frame.pack(fill='both', expand=True)
 
-        self._update_tags()
-
-        self.bind_class(self._bind_tag, '<<Id Selected>>', self._update_tags, add=True)
+        self._bus = bus if bus else reader_bus(self, self._reader, self._bind_tag)
+        self._bus.subscribe('entry', self._update_tags)
 
-    def _update_tags(self, *args):
+    def _update_tags(self, snapshot: ReaderSnapshot):
         for label in self._tags_frame.inner.pack_slaves():
-            label.pack_forget()
-        for tag in self._reader.entry_tags:
+            label.destroy()
+        for tag in snapshot.tags:
             label = Label(master=self._tags_frame.inner, text=tag)
             label.pack(fill='x', expand=True, anchor='center')
 
@@ -287,7 +259,7 @@ def _test():
     root = Tk()
     root.geometry('400x500')
     root.grid_rowconfigure(index=0, weight=1)
-    reader = ReaderModule('.tempfiles/Reader/000')
+    reader = ReaderModule('Reader/000')
     tags = TagsFrame(master=root, reader=reader)
     tags.pack(fill='both', expand=True)
     # tags.selected_tags = ['Purple', 'Green', 'Blue', '1', '2', '3']
@@ -0,0 +1,67 @@
+"""A size-bounded cache of filter results shared by every Filter, so Readers with the same or overlapping filters only
+compute each result once for a given version of the database"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+
+class ResultCache:
+    """Keeps the most recently used results up to a maximum number, counting hits and misses. It may be shared with
+    worker threads"""
+
+    def __init__(self, maxsize: int = 256):
+        self._maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = Lock()
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def stats(self):
+        """The number of hits, misses, and stored results
+
+        :rtype: Dict[str, int]
+        """
+        return {'hits': self._hits, 'misses': self._misses, 'size': len(self._items), 'maxsize': self._maxsize}
+
+    def get(self, key: Hashable, default: Any = None):
+        """Gets a result, marking it as the most recently used
+
+        :param key: the key the result was stored under
+        :param default: the value returned when there is no result for the key
+        :return: the result or the default
+        """
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self._misses += 1
+                return default
+            self._items.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Stores a result, dropping the least recently used one when the cache is full
+
+        :param key: the key to store the result under
+        :param value: the result
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+results = ResultCache()
@@ -0,0 +1,341 @@
+"""Keeps the state of the journal's tabs in a single SQLite database: which tabs are open and in what order, the filter
+of each Reader, the draft of each Writer, the tab on show, and when each entry was last opened for editing. Each tab is
+known by a key such as 'Reader/000', and its fields are kept in typed columns, with tuples and dicts as JSON. Tempfiles
+written by earlier versions are moved into the store the first time it is opened"""
+from ast import literal_eval
+from configparser import ConfigParser, Error as ConfigError
+from contextlib import closing
+from datetime import datetime
+from json import dumps, loads
+from logging import getLogger
+from os import makedirs, scandir, remove
+from os.path import join, exists, dirname, abspath
+from sqlite3 import connect, Connection
+from typing import Dict, Any, Union
+
+SESSION_DATABASE = join('.tempfiles', 'session.sqlite')
+TAB_TYPES = ('Reader', 'Writer')
+
+_log = getLogger(__name__)
+
+# The columns of each type of tab, and how each field is kept
+_JSON = 'json'
+_DATE = 'date'
+COLUMNS = {
+    'Reader': {'database': 'TEXT', 'id': 'INTEGER', 'date_filter': 'INTEGER', 'tag_filter': 'INTEGER',
+               'tags_sort': 'INTEGER', 'sort': _JSON, 'has_attachments': 'INTEGER', 'has_parent': 'INTEGER',
+               'has_children': 'INTEGER', 'tags': _JSON, 'body': 'TEXT', 'query': 'TEXT', 'dates': _JSON},
+    'Writer': {'database': 'TEXT', 'id': 'INTEGER', 'body': 'TEXT', 'date': _DATE, 'tags': _JSON,
+               'attachments': _JSON, 'parent': 'INTEGER'}
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tabs (
+    key TEXT PRIMARY KEY,
+    type TEXT NOT NULL CHECK (type IN ('Reader', 'Writer')),
+    number INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    UNIQUE (type, number)
+);
+CREATE TABLE IF NOT EXISTS session (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS last_access (
+    database TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    accessed TEXT NOT NULL,
+    PRIMARY KEY (database, entry_id)
+);
+"""
+
+# Counts the entries opened by this process, so orders sorted by last access are only redone after one is opened
+_accesses = 0
+
+
+def _table(type_: str):
+    return type_.lower() + 's'
+
+
+def _generation_name(key: str):
+    return 'generation:' + key
+
+
+def _create_table(type_: str):
+    columns = ', '.join('{} {}'.format(name, 'TEXT' if kind in (_JSON, _DATE) else kind)
+                        for name, kind in COLUMNS[type_].items())
+    return 'CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY REFERENCES tabs (key), {})'.format(_table(type_),
+                                                                                                  columns)
+
+
+def to_column(kind: str, value: Any):
+    if value is None:
+        return None
+    if kind == _JSON:
+        return dumps(value)
+    if kind == _DATE:
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+    return value
+
+
+def from_column(kind: str, value: Any):
+    if value is None:
+        return None
+    if kind == _JSON:
+        value = loads(value)
+        # JSON has no tuples
+        return value if isinstance(value, dict) else tuple(tuple(x) if isinstance(x, list) else x for x in value)
+    if kind == _DATE:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+    return value
+
+
+class SessionStore:
+    """The tabs of the journal and their fields. Every change is made in a transaction"""
+
+    def __init__(self, path: str = SESSION_DATABASE):
+        """
+
+        :param path: a str representing the location of the session database
+        """
+        new = not exists(path)
+        if dirname(path):
+            makedirs(dirname(path), exist_ok=True)
+        self._path = path
+        self._skipped = []
+        self._connection = connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._connection as c:
+            c.executescript(_SCHEMA)
+            for type_ in TAB_TYPES:
+                c.execute(_create_table(type_))
+        if new:
+            self._import_tempfiles()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def skipped(self):
+        """A list of str representing the legacy tempfiles that could not be imported"""
+        return list(self._skipped)
+
+    def tabs(self):
+        """Lists the keys of the open tabs in the order they are shown
+
+        :rtype: List[str]
+        """
+        return [x[0] for x in self._connection.execute('SELECT key FROM tabs ORDER BY position')]
+
+    def has_tab(self, key: str):
+        return self._connection.execute('SELECT 1 FROM tabs WHERE key = ?', (key,)).fetchone() is not None
+
+    def tab_type(self, key: str):
+        row = self._connection.execute('SELECT type FROM tabs WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def add_tab(self, type_: str, fields: Dict[str, Any]):
+        """Opens a new tab after the others, taking the lowest number not in use by a tab of its type
+
+        :param type_: a str, either 'Reader' or 'Writer'
+        :param fields: a dict of the fields of the tab
+        :return: a str representing the key of the tab
+        """
+        if type_ not in TAB_TYPES:
+            raise KeyError('Allowed arguments include \'Reader\' and \'Writer\'.')
+        with self._connection as c:
+            number = c.execute('SELECT MIN(n) FROM (SELECT 0 AS n UNION SELECT number + 1 FROM tabs WHERE type = ?) '
+                               'WHERE n NOT IN (SELECT number FROM tabs WHERE type = ?)', (type_, type_)).fetchone()[0]
+            position = c.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM tabs').fetchone()[0]
+            key = '{}/{:03d}'.format(type_, number)
+            c.execute('INSERT INTO tabs (key, type, number, position) VALUES (?, ?, ?, ?)',
+                      (key, type_, number, position))
+            self._write(c, key, type_, fields, insert=True)
+        return key
+
+    def remove_tab(self, key: str):
+        with self._connection as c:
+            type_ = self.tab_type(key)
+            if type_:
+                c.execute('DELETE FROM {} WHERE key = ?'.format(_table(type_)), (key,))
+                c.execute('DELETE FROM tabs WHERE key = ?', (key,))
+                c.execute('DELETE FROM session WHERE name = ?', (_generation_name(key),))
+                if self.current == key:
+                    c.execute('DELETE FROM session WHERE name = ?', ('current',))
+
+    def load(self, key: str) -> Union[Dict[str, Any], None]:
+        """Reads the fields of a tab
+
+        :return: a dict of the fields, or None if there is no such tab
+        """
+        type_ = self.tab_type(key)
+        if not type_:
+            return None
+        columns = COLUMNS[type_]
+        row = self._connection.execute('SELECT {} FROM {} WHERE key = ?'.format(', '.join(columns), _table(type_)),
+                                       (key,)).fetchone()
+        return {name: from_column(kind, v) for (name, kind), v in zip(columns.items(), row)} if row else {}
+
+    def save(self, key: str, fields: Dict[str, Any], generation: int = None):
+        """Writes the fields of a tab in one transaction
+
+        :param generation: an int recorded in the same transaction, e.g. the number of the flush of the tab's log
+        :return: False if the tab has been closed in the meantime
+        """
+        type_ = self.tab_type(key)
+        if not type_:
+            return False
+        with self._connection as c:
+            self._write(c, key, type_, fields)
+            if generation is not None:
+                c.execute('INSERT OR REPLACE INTO session (name, value) VALUES (?, ?)',
+                          (_generation_name(key), str(generation)))
+        return True
+
+    def generation(self, key: str):
+        """The generation last saved with the fields of a tab
+
+        :return: an int, or 0 if none has been saved
+        """
+        row = self._connection.execute('SELECT value FROM session WHERE name = ?', (_generation_name(key),)).fetchone()
+        return int(row[0]) if row else 0
+
+    @property
+    def current(self):
+        """The key of the tab on show"""
+        row = self._connection.execute('SELECT value FROM session WHERE name = ?', ('current',)).fetchone()
+        return row[0] if row else ''
+
+    @current.setter
+    def current(self, key: str):
+        with self._connection as c:
+            c.execute('INSERT OR REPLACE INTO session (name, value) VALUES (?, ?)', ('current', key))
+
+    def record_access(self, database: str, entry_id: int):
+        """Records that an entry was opened for editing. The times are kept here rather than in the journal, so opening
+        an entry does not count as a change to the database and its cached filters stay valid
+
+        :param database: a str representing the location of the database the entry belongs to
+        :param entry_id: an int representing the entry
+        """
+        global _accesses
+        with self._connection as c:
+            c.execute('INSERT OR REPLACE INTO last_access (database, entry_id, accessed) VALUES (?, ?, ?)',
+                      (abspath(database), entry_id, to_column(_DATE, datetime.now())))
+        _accesses += 1
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def _write(c: Connection, key: str, type_: str, fields: Dict[str, Any], insert: bool = False):
+        columns = COLUMNS[type_]
+        names = [x for x in fields if x in columns]
+        values = [to_column(columns[x], fields[x]) for x in names]
+        table = _table(type_)
+        if insert:
+            c.execute('INSERT INTO {} ({}) VALUES ({})'.format(table, ', '.join(['key'] + names),
+                                                               ', '.join('?' * (len(names) + 1))), [key] + values)
+        elif names:
+            c.execute('UPDATE {} SET {} WHERE key = ?'.format(table, ', '.join('{} = ?'.format(x) for x in names)),
+                      values + [key])
+
+    def _import_tempfiles(self):
+        """Moves the tabs kept in INI tempfiles by earlier versions into the store, in the order the notebook showed
+        them"""
+        paths = []
+        for type_ in TAB_TYPES:
+            directory = join('.tempfiles', type_)
+            if exists(directory):
+                paths += [(x.path, type_) for x in scandir(directory) if x.is_file()]
+        if not paths:
+            return
+        order, current = _legacy_notebook()
+        paths.sort(key=lambda x: order.index(x[0]) if x[0] in order else len(order))
+        for path, type_ in paths:
+            try:
+                fields = _read_legacy_tempfile(path, type_)
+            except (ValueError, SyntaxError, ConfigError) as e:
+                # A tempfile that cannot be read is left where it is
+                _log.warning('Could not import the tempfile %s, so its tab was not reopened: %s', path, e)
+                self._skipped.append(path)
+                continue
+            key = self.add_tab(type_, fields)
+            if path == current:
+                self.current = key
+            remove(path)
+
+
+def _legacy_notebook():
+    """Reads the order of the tabs and the tab on show from settings.config, as earlier versions kept them"""
+    parser = ConfigParser()
+    parser.read('settings.config')
+    try:
+        order = literal_eval(parser.get('Notebook', 'pages'))
+    except Exception:
+        order = []
+    return order, parser.get('Notebook', 'current', fallback='')
+
+
+def _read_legacy_tempfile(path: str, type_: str):
+    parser = ConfigParser()
+    parser.read(path)
+    fields = {'database': parser.get('Databases', 'current'),
+              'id': literal_eval(parser.get('Attributes', 'id'))}
+    if type_ == 'Reader':
+        fields.update({'date_filter': parser.getint('Settings', 'date filter'),
+                       'tag_filter': parser.getint('Settings', 'tag filter'),
+                       'tags_sort': parser.getint('Settings', 'tags sort'),
+                       'sort': literal_eval(parser.get('Settings', 'sort', fallback='()')),
+                       'has_attachments': parser.getint('Flags', 'has attachments'),
+                       'has_parent': parser.getint('Flags', 'has parent'),
+                       'has_children': parser.getint('Flags', 'has children'),
+                       'tags': literal_eval(parser.get('Strings', 'tags')),
+                       'body': parser.get('Strings', 'body', raw=True),
+                       'query': parser.get('Strings', 'query', fallback=''),
+                       'dates': {k: parser.getint('Dates', k) for k in parser.options('Dates')}})
+    else:
+        date = parser.get('Attributes', 'date')
+        fields.update({'body': parser.get('Attributes', 'body', raw=True),
+                       'date': None if date == 'None' else datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f'),
+                       'tags': literal_eval(parser.get('Attributes', 'tags')),
+                       'attachments': literal_eval(parser.get('Attributes', 'attachments')),
+                       'parent': literal_eval(parser.get('Attributes', 'parent'))})
+    return fields
+
+
+def last_accessed(database: str, path: str = SESSION_DATABASE):
+    """Reads when each entry of a database was last opened for editing. The store is read through a connection of its
+    own, so this can be called from a worker thread
+
+    :param database: a str representing the location of the database
+    :param path: a str representing the location of the session database
+    :return: a dict of each entry id and the datetime it was last opened
+    :rtype: Dict[int, datetime]
+    """
+    if not exists(path):
+        return {}
+    with closing(connect(path)) as c:
+        rows = c.execute('SELECT entry_id, accessed FROM last_access WHERE database = ?', (abspath(database),))
+        return {entry_id: from_column(_DATE, accessed) for entry_id, accessed in rows}
+
+
+def access_version():
+    """An int that changes whenever this process opens an entry for editing"""
+    return _accesses
+
+
+_session = None
+
+
+def get_session():
+    """Gets the session store of the working directory, opening it the first time it is asked for
+
+    :rtype: SessionStore
+    """
+    global _session
+    if _session is None:
+        _session = SessionStore()
+    return _session
@@ -0,0 +1,151 @@
+"""Stages the start of the application. The window is built and shown on the Tk thread straight away, while the upgrade
+of the databases, the backup, and the import of new entries run on the workers. Each stage signals when it is ready, so
+stages that depend on others, like refreshing the readers after an import, start as soon as they can rather than after a
+fixed delay. The time each stage takes is recorded"""
+from time import perf_counter
+from tkinter import Misc
+from typing import Callable, Dict, Tuple, List, Set, Any
+
+from workers import WorkerPool, get_pool
+
+STAGES = ('upgrade', 'window', 'backup', 'import', 'refresh')
+MESSAGES = {'upgrade': 'Upgrading databases',
+            'window': 'Opening pages',
+            'backup': 'Backing up databases',
+            'import': 'Importing entries',
+            'refresh': 'Refreshing readers'}
+
+
+class StartupPipeline:
+    """Runs the stages of startup, each on the Tk thread or on a worker, once the stages it depends on are ready"""
+
+    def __init__(self, master: Misc, pool: WorkerPool = None):
+        """
+
+        :param master: the main window
+        :param pool: the WorkerPool that runs the background stages
+        """
+        self._master = master
+        self._pool = pool if pool else get_pool(master)
+        self._start = perf_counter()
+        self._timings: Dict[str, Tuple[float, float]] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._running: Set[str] = set()
+        self._ready: Set[str] = set()
+        self._waiting: List[Tuple[Tuple[str, ...], Callable[[], Any]]] = []
+        self._listeners: List[Callable[[str], Any]] = []
+
+    @property
+    def timings(self):
+        """A dict of each finished stage and the seconds it took"""
+        return {stage: end - start for stage, (start, end) in self._timings.items() if stage in self._ready}
+
+    @property
+    def finished_at(self):
+        """A dict of each finished stage and the seconds from the start of the pipeline to its end"""
+        return {stage: end for stage, (start, end) in self._timings.items() if stage in self._ready}
+
+    @property
+    def running(self):
+        return bool(self._running)
+
+    @property
+    def errors(self):
+        return dict(self._errors)
+
+    def ready(self, *stages: str):
+        return self._ready.issuperset(stages)
+
+    def when_ready(self, *stages: str, callback: Callable[[], Any]):
+        """Calls a callable once every one of the stages is ready, straight away if they already are"""
+        if self.ready(*stages):
+            callback()
+        else:
+            self._waiting.append((stages, callback))
+
+    def add_progress_listener(self, callback: Callable[[str], Any]):
+        """Calls a callable with a message whenever a stage starts or the pipeline finishes, e.g. for a status bar. It
+        is also called straight away with the current message, so stages that began before it was added are shown"""
+        self._listeners.append(callback)
+        message = self._message()
+        if message:
+            callback(message)
+
+    def begin(self, stage: str):
+        now = perf_counter() - self._start
+        self._running.add(stage)
+        self._timings[stage] = (now, now)
+        self._report()
+
+    def finish(self, stage: str):
+        """Marks a stage as ready and starts whatever was waiting on it"""
+        start = self._timings.get(stage, (perf_counter() - self._start,))[0]
+        self._timings[stage] = (start, perf_counter() - self._start)
+        self._running.discard(stage)
+        self._ready.add(stage)
+        waiting, self._waiting = self._waiting, []
+        for stages, callback in waiting:
+            if self.ready(*stages):
+                callback()
+            else:
+                self._waiting.append((stages, callback))
+        self._report()
+
+    def skip(self, stage: str):
+        """Marks a stage that is not needed this time as ready, taking no time"""
+        self.finish(stage)
+
+    def fail(self, stage: str, error: Exception):
+        """Records an error and marks the stage as ready, so the stages after it still run"""
+        self._errors[stage] = error
+        self.finish(stage)
+
+    def run(self, stage: str, function: Callable, *args, after: Tuple[str, ...] = ()):
+        """Runs a callable on the Tk thread once the stages it depends on are ready"""
+        def _run():
+            self.begin(stage)
+            try:
+                function(*args)
+            except Exception as e:
+                self.fail(stage, e)
+                raise
+            self.finish(stage)
+        self.when_ready(*after, callback=lambda: self._master.after_idle(_run))
+
+    def run_in_background(self, stage: str, function: Callable, *args, after: Tuple[str, ...] = (),
+                          callback: Callable[[Any], Any] = None):
+        """Runs a callable on a worker once the stages it depends on are ready
+
+        :param callback: a callable that is given the result on the Tk thread before the stage is marked as ready
+        """
+        def _done(result: Any):
+            if callback:
+                callback(result)
+            self.finish(stage)
+
+        def _submit():
+            self.begin(stage)
+            self._pool.submit(('startup', stage), function, *args, callback=_done,
+                              errback=lambda e: self.fail(stage, e))
+        self.when_ready(*after, callback=_submit)
+
+    def summary(self):
+        """A str of the time each stage took, in the order they finished"""
+        timings = self.timings
+        stages = sorted(timings, key=lambda x: self._timings[x][1])
+        return ', '.join('{} {:.0f} ms'.format(x, timings[x] * 1000) for x in stages)
+
+    def _message(self):
+        if self._running:
+            return '{}...'.format(', '.join(MESSAGES.get(x, x) for x in STAGES if x in self._running))
+        elif self._errors:
+            return '; '.join('{} failed: {}'.format(MESSAGES.get(x, x), e) for x, e in self._errors.items())
+        elif self.ready(*STAGES):
+            return 'Ready in {:.1f} s'.format(max(self.finished_at.values()))
+        return ''
+
+    def _report(self):
+        message = self._message()
+        if message:
+            for callback in self._listeners:
+                callback(message)
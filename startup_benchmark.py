@@ -0,0 +1,110 @@
+"""Measures how long the application takes to start. The imports are timed with `python -X importtime`, and the time to
+the first window is taken from a fresh interpreter up to the moment the main window is mapped, along with the time
+each stage of the startup pipeline takes. Run it from the directory the application runs in:
+
+    python startup_benchmark.py --runs 5 --log startup_times.jsonl
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dumps, loads
+from statistics import median
+from subprocess import run, PIPE
+from sys import executable
+from typing import List, Tuple
+
+# Modules that should not be imported before the first window is shown
+HEAVY_MODULES = ('PIL', 'matplotlib', 'networkx', 'dateutil', 'numpy')
+
+_STARTUP = """
+from json import dumps
+from time import perf_counter
+start = perf_counter()
+from application import App
+from startup import STAGES
+
+
+class _TimedApp(App):
+    def mainloop(self, n=0):
+        window = []
+        self.startup.when_ready('window', callback=lambda: window.append(perf_counter() - start))
+
+        def _done():
+            print(dumps({'first_window': window[0], 'stages': self.startup.timings}))
+            self.after_idle(self.destroy)
+        self.startup.when_ready(*STAGES, callback=_done)
+        super(_TimedApp, self).mainloop(n)
+
+
+_TimedApp(className='app')
+"""
+
+
+def import_times(module: str = 'application'):
+    """Imports a module in a fresh interpreter with -X importtime
+
+    :param module: a str representing the module to import
+    :return: a list of tuples of each imported module's name, its own import time and its cumulative import time, in
+    microseconds
+    """
+    result = run([executable, '-X', 'importtime', '-c', 'import {}'.format(module)], stderr=PIPE,
+                 universal_newlines=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(own), int(cumulative)))
+    return times
+
+
+def time_startup():
+    """Starts the application in a fresh interpreter and closes it as soon as every stage of startup is ready
+
+    :return: a tuple of a float representing the seconds from the interpreter's first import to the window being mapped
+    and a dict of each stage and the seconds it took
+    """
+    result = run([executable, '-c', _STARTUP], stdout=PIPE, universal_newlines=True, check=True)
+    times = loads(result.stdout.strip().splitlines()[-1])
+    return times['first_window'], times['stages']
+
+
+def heavy_imports(times: List[Tuple[str, int, int]]):
+    return sorted({x[0].split('.')[0] for x in times if x[0].split('.')[0] in HEAVY_MODULES})
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='application', help='the module whose imports are timed')
+    parser.add_argument('--runs', type=int, default=3, help='the number of times the first window is timed')
+    parser.add_argument('--top', type=int, default=15, help='the number of slowest imports listed')
+    parser.add_argument('--no-window', action='store_true', help='only time the imports')
+    parser.add_argument('--log', help='a file the results are appended to as a line of JSON, to track them over time')
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total = max((x[2] for x in times if x[0] == args.module), default=0)
+    print('import {}: {:.1f} ms'.format(args.module, total / 1000))
+    for name, own, cumulative in sorted(times, key=lambda x: x[2], reverse=True)[:args.top]:
+        print('  {:>9.1f} ms  {:>9.1f} ms  {}'.format(cumulative / 1000, own / 1000, name))
+    heavy = heavy_imports(times)
+    print('heavy modules imported at startup: {}'.format(', '.join(heavy) if heavy else 'none'))
+
+    window = None
+    stages = {}
+    if not args.no_window:
+        runs = [time_startup() for _ in range(args.runs)]
+        window = median(x[0] for x in runs)
+        print('time to first window: {:.1f} ms (median of {})'.format(window * 1000, len(runs)))
+        stages = {stage: median(x[1][stage] for x in runs) * 1000 for stage in runs[0][1]}
+        for stage, ms in stages.items():
+            print('  {:>9.1f} ms  {}'.format(ms, stage))
+
+    if args.log:
+        with open(args.log, 'a') as file:
+            file.write(dumps({'date': datetime.now().isoformat(timespec='seconds'), 'module': args.module,
+                              'import_ms': total / 1000, 'first_window_ms': window * 1000 if window else None,
+                              'stages_ms': stages, 'heavy': heavy}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
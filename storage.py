@@ -128,7 +128,8 @@ def is_database(location: str):
         try:
             database = connect(location)
             names = set(database.execute('SELECT name FROM sqlite_master WHERE type=\'table\''))
-            if {('bodies',), ('dates',), ('attachments',), ('relations',), ('tags',)} == names:
+            # Journals upgraded by upgrade_database also have an entry_metrics table
+            if {('bodies',), ('dates',), ('attachments',), ('relations',), ('tags',)} <= names:
                 is_ = True
                 message = ''
         except DatabaseError:
@@ -0,0 +1,220 @@
+"""Functions for building set-algebra queries that filter entries by their tags"""
+from contextlib import closing
+from sqlite3 import connect
+from typing import Tuple
+
+from configurations import default_database
+
+ANY_OF = 0
+ALL_OF = 1
+ONLY = 2
+UNTAGGED = '(UNTAGGED)'
+
+
+def _marks(tags: list):
+    return ','.join(['?'] * len(tags))
+
+
+def _membership(subquery: str, params: list, negate: bool):
+    return 'entry_id {}IN ({})'.format('NOT ' if negate else '', subquery), params
+
+
+def any_of_query(tags: Tuple[str]):
+    """Builds the query selecting the entries that have at least one of the given tags
+
+    :param tags: a tuple of str representing the tags
+    :return: a tuple of the SQL query and its parameters
+    :rtype: Tuple[str, list]
+    """
+    tags = list(dict.fromkeys(tags))
+    return 'SELECT DISTINCT entry_id FROM tags WHERE tag IN ({})'.format(_marks(tags)), tags
+
+
+def all_of_query(tags: Tuple[str]):
+    """Builds the query selecting the entries that have every one of the given tags
+
+    :param tags: a tuple of str representing the tags
+    :return: a tuple of the SQL query and its parameters
+    :rtype: Tuple[str, list]
+    """
+    tags = list(dict.fromkeys(tags))
+    sql = 'SELECT entry_id FROM tags WHERE tag IN ({}) GROUP BY entry_id HAVING COUNT(DISTINCT tag)=?'.format(
+        _marks(tags))
+    return sql, tags + [len(tags)]
+
+
+def only_query(tags: Tuple[str]):
+    """Builds the query selecting the entries whose tags are exactly the given tags. The candidates are found through
+    the tag index first, so only the entries that have all of the tags have their tags counted
+
+    :param tags: a tuple of str representing the tags
+    :return: a tuple of the SQL query and its parameters
+    :rtype: Tuple[str, list]
+    """
+    tags = list(dict.fromkeys(tags))
+    if not tags:
+        return 'SELECT entry_id FROM bodies WHERE entry_id NOT IN (SELECT entry_id FROM tags)', []
+    candidates, params = all_of_query(tuple(tags))
+    sql = 'SELECT entry_id FROM tags WHERE entry_id IN ({}) GROUP BY entry_id HAVING COUNT(DISTINCT tag)=?'.format(
+        candidates)
+    return sql, params + [len(tags)]
+
+
+def any_of_clause(tags: Tuple[str], negate: bool = False):
+    """Builds the WHERE clause matching entries that have at least one of the given tags
+
+    :param tags: a tuple of str representing the tags
+    :param negate: a bool indicating whether the clause should instead match the entries that have none of the tags
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    if not tags:
+        return '1' if negate else '0', []
+    return _membership(*any_of_query(tags), negate)
+
+
+def all_of_clause(tags: Tuple[str], negate: bool = False):
+    """Builds the WHERE clause matching entries that have every one of the given tags
+
+    :param tags: a tuple of str representing the tags
+    :param negate: a bool indicating whether the clause should instead match the entries missing any of the tags
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    if not tags:
+        return '1' if negate else '0', []
+    return _membership(*all_of_query(tags), negate)
+
+
+def only_clause(tags: Tuple[str], negate: bool = False):
+    """Builds the WHERE clause matching entries whose tags are exactly the given tags
+
+    :param tags: a tuple of str representing the tags
+    :param negate: a bool indicating whether the clause should instead match the entries with any other set of tags
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    if not tags:
+        return 'entry_id {}IN (SELECT entry_id FROM tags)'.format('' if negate else 'NOT '), []
+    return _membership(*only_query(tags), negate)
+
+
+def untagged_clause(negate: bool = False):
+    """Builds the WHERE clause matching entries that were saved without any tags
+
+    :param negate: a bool indicating whether the clause should instead match the entries that have tags
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    return only_clause((UNTAGGED,), negate)
+
+
+def tag_clause(tags: Tuple[str], mode: int = ANY_OF, negate: bool = False):
+    """Builds the WHERE clause for one of the three tag filter modes
+
+    :param tags: a tuple of str representing the tags
+    :param mode: an int: ANY_OF for 'Contains One Of', ALL_OF for 'Contains At Least', ONLY for 'Contains Only'
+    :param negate: a bool indicating whether the clause should match the entries that fail the filter instead
+    :return: a tuple of the SQL clause and its parameters
+    :rtype: Tuple[str, list]
+    """
+    if mode == ALL_OF:
+        return all_of_clause(tags, negate)
+    if mode == ONLY:
+        return only_clause(tags, negate)
+    return any_of_clause(tags, negate)
+
+
+def tagged_ids(tags: Tuple[str], mode: int = ANY_OF, negate: bool = False, database: str = None):
+    """Gets the ids of the entries that satisfy a tag filter
+
+    :param tags: a tuple of str representing the tags
+    :param mode: an int: ANY_OF for 'Contains One Of', ALL_OF for 'Contains At Least', ONLY for 'Contains Only'
+    :param negate: a bool indicating whether the entries that fail the filter should be returned instead
+    :param database: a str representing the database that is being queried
+    :return: a tuple of int representing the filtered entries
+    :rtype: tuple
+    """
+    if negate or (not tags and mode != ONLY):
+        sql, params = tag_clause(tags, mode, negate)
+        sql = 'SELECT entry_id FROM bodies WHERE ' + sql
+    elif mode == ALL_OF:
+        sql, params = all_of_query(tags)
+    elif mode == ONLY:
+        sql, params = only_query(tags)
+    else:
+        sql, params = any_of_query(tags)
+    db = connect(database) if database else connect(default_database())
+    with closing(db) as d:
+        return tuple(x[0] for x in d.execute(sql, params).fetchall())
+
+
+def _benchmark(entries: int = 100000, tags: int = 2000, repeat: int = 5):
+    """Times the set-algebra queries against the per-tag and per-entry loops they replaced on a synthetic journal"""
+    from os import remove
+    from os.path import join
+    from random import Random
+    from tempfile import mkdtemp
+    from time import perf_counter
+
+    from database import create_database
+
+    path = join(mkdtemp(), 'benchmark.sqlite')
+    create_database(path)
+    rnd = Random(0)
+    names = ['tag{:04d}'.format(i) for i in range(tags)]
+    # Tag popularity follows a long tail, like most journals
+    weights = [1 / (i + 1) for i in range(tags)]
+    with closing(connect(path)) as d:
+        d.executemany('INSERT INTO bodies(entry_id, body) VALUES(?,?)', ((i, '') for i in range(1, entries + 1)))
+        rows = []
+        for i in range(1, entries + 1):
+            chosen = set(rnd.choices(names, weights, k=rnd.randint(0, 4)))
+            rows += [(i, t) for t in chosen] if chosen else [(i, UNTAGGED)]
+        d.executemany('INSERT INTO tags(entry_id, tag) VALUES(?,?)', rows)
+        d.commit()
+
+    def legacy(selected: tuple, op_type: int):
+        with closing(connect(path)) as c:
+            if op_type == ALL_OF:
+                sql = 'SELECT entry_id FROM tags WHERE tag=?'
+                temp = set(c.execute(sql, (selected[0],)).fetchall())
+                for tag in selected[1:]:
+                    temp = temp.intersection(c.execute(sql, (tag,)).fetchall())
+                return {i[0] for i in temp}
+            if op_type == ONLY:
+                # The old loop opened two connections per entry; grouping the rows in Python keeps its cost model
+                # (a pass over every entry's tags) without spending minutes on connection overhead
+                ids = set()
+                for entry in (x[0] for x in c.execute('SELECT entry_id FROM bodies').fetchall()):
+                    entry_tags = c.execute('SELECT tag FROM tags WHERE entry_id=?', (entry,)).fetchall()
+                    if len(entry_tags) == len(selected) and {x[0] for x in entry_tags} == set(selected):
+                        ids.add(entry)
+                return ids
+            sql = 'SELECT entry_id FROM tags WHERE tag IN ({})'.format(_marks(list(selected)))
+            return {x[0] for x in c.execute(sql, selected).fetchall()}
+
+    def timed(function, *args):
+        best = None
+        result = None
+        for _ in range(repeat):
+            start = perf_counter()
+            result = function(*args)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    print('{} entries, {} tags'.format(entries, tags))
+    for label, selected in [('popular', tuple(names[:2])), ('mixed', (names[0], names[50], names[500])),
+                            ('rare', tuple(names[-3:]))]:
+        for mode, mode_name in [(ANY_OF, 'any of'), (ALL_OF, 'all of'), (ONLY, 'only')]:
+            old_time, old = timed(legacy, selected, mode)
+            new_time, new = timed(tagged_ids, selected, mode, False, path)
+            assert old == set(new), (label, mode_name)
+            print('{:8} {:7} legacy {:9.2f} ms   set-algebra {:9.2f} ms   ({} matches)'.format(
+                label, mode_name, old_time * 1000, new_time * 1000, len(new)))
+    remove(path)
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -1,45 +1,115 @@
-"""Classes and functions for managing the tempfile, which tracks open Readers and Writers after the application is
-closed """
-from ast import literal_eval
-from configparser import ConfigParser
+"""Classes and functions for managing the state of each open Reader and Writer, which is kept after the application is
+closed. The state lives in the session store (see session.py), one row per tab. While the application runs, changes are
+appended to a log as they are made and the rows themselves are written at most every FLUSH_INTERVAL ms, when the
+application is idle, and when it closes. Each row is written in one transaction along with the number of the flush,
+which every line of the log is tagged with, so the log is applied to the row if the application stopped before writing
+it and skipped if it stopped after writing it but before removing the log"""
+from contextlib import contextmanager
 from datetime import datetime
+from json import dumps, loads
 
-from os import makedirs, remove, scandir, getcwd
-from os.path import exists, join, isfile
-from typing import Tuple, Dict
+from os import makedirs, remove, getcwd
+from os.path import exists, join, basename
+from tkinter import Misc
+from typing import Tuple, Dict, List, Set, Any
 
 from database import create_database
 from database_info import get_oldest_date, get_newest_date
+from session import COLUMNS, get_session, to_column, from_column
 
 
-def _parse_datestring(date: str):
-    if date == 'None':
-        return None
-    else:
-        return datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f')
+LOG_DIRECTORY = join('.tempfiles', 'Logs')
+FLUSH_INTERVAL = 500
+# Values longer than this are logged as the part that changed rather than in full
+_SPLICE_LENGTH = 64
 
+_scheduler = None
 
-def _get_file_id(directory: str):
-    """Searches for and returns the next available tempfile filename
 
-    :return: a str representing the next available tempfile filename
+class FlushScheduler:
+    """Writes the tabs that have changed through the event loop of the application: no sooner than an interval
+    after the first change, once the application is idle"""
+
+    def __init__(self, master: Misc, interval: int = FLUSH_INTERVAL):
+        """
+
+        :param master: the widget whose event loop runs the flushes
+        :param interval: an int representing the milliseconds a change may wait before it is written
+        """
+        self._master = master
+        self._interval = interval
+        self._pending: Set['_TempFileManager'] = set()
+        self._timer = None
+
+    def mark(self, manager: '_TempFileManager'):
+        self._pending.add(manager)
+        if self._timer is None:
+            self._timer = self._master.after(self._interval, self._when_idle)
+
+    def _when_idle(self):
+        self._timer = self._master.after_idle(self.flush)
+
+    def flush(self):
+        """Writes every tab with changes now"""
+        if self._timer is not None:
+            self._master.after_cancel(self._timer)
+            self._timer = None
+        pending, self._pending = self._pending, set()
+        for manager in pending:
+            manager.flush_pending()
+
+
+def coalesce_writes(master: Misc, interval: int = FLUSH_INTERVAL):
+    """Makes every tab log its changes and leave writing itself to a FlushScheduler. Without one, each change is
+    written straight away
+
+    :param master: the widget whose event loop runs the flushes, usually the main window
+    :param interval: an int representing the milliseconds a change may wait before it is written
+    :rtype: FlushScheduler
     """
-    ids = [int(x.name) for x in scandir(join('.tempfiles', directory))]
-    ids.sort()
-    diff = False
-    i = 0
-    while not diff and i < len(ids):
-        if i != ids[i]:
-            diff = True
-        i += 1
-    if i == 0:
-        id_ = 0
-    elif diff:
-        id_ = i - 1
-    else:
-        id_ = i
-    id_ = '{:03d}'.format(id_)
-    return id_
+    global _scheduler
+    _scheduler = FlushScheduler(master, interval)
+    return _scheduler
+
+
+def flush_tempfiles():
+    """Writes every tab with changes, e.g. when the application closes"""
+    if _scheduler:
+        _scheduler.flush()
+
+
+def common_prefix(a: str, b: str):
+    """Finds the length of the longest start two strs share, comparing slices rather than characters"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix(a: str, b: str, limit: int):
+    """Finds the length of the longest end two strs share, up to a limit, e.g. so it does not overlap their prefix"""
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _log_entry(field: str, old: Any, new: Any):
+    """Describes a change to a field. A long value, like the body of an entry, is described by the text that replaced
+    its middle, so typing a character logs a few bytes however long the body is"""
+    if not isinstance(old, str) or not isinstance(new, str) or len(old) < _SPLICE_LENGTH:
+        return ['set', field, new]
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return ['splice', field, prefix, suffix, new[prefix:len(new) - suffix]]
 
 
 def _check_attachments(_attachments):
@@ -58,275 +128,357 @@ def _check_attachments(_attachments):
 
 
 class _TempFileManager:
-    """Manages a single tempfile containing all fields of an entry"""
+    """Manages the fields of a single tab, kept in a row of the session store"""
 
     def __init__(self, module: str, file_path: str = None):
-        self._tempdir_path = join('.tempfiles', module)
-        if not exists(self._tempdir_path):
-            makedirs(self._tempdir_path)
+        """
+
+        :param module: a str, either 'Reader' or 'Writer'
+        :param file_path: a str representing the key of the tab in the session store, e.g. 'Reader/000'. A new tab is
+        opened if it is None or there is no such tab
+        """
         self._type = module
         self._file_path = file_path
-        self.parser = ConfigParser(
-            converters={
-                'date': _parse_datestring,
-                'tuple': literal_eval,
-                'literal': literal_eval
-            }
-        )
+        self._store = get_session()
+        self._batch_depth = 0
+        self._dirty = False
+        self._fields: Dict[str, Any] = {}
+        self._written: Dict[str, Any] = {}
+        # The number of the last flush of the row, which the changes logged since will be written with the one after
+        self._generation = 0
 
     @property
     def type_(self):
         return self._type
 
-    @type_.setter
-    def type_(self, v: str):
-        if v in ['Reader', 'Writer']:
-            self._type = v
-            self.parser['Meta']['type'] = v
-            self.write_file()
-        else:
-            raise KeyError('Allowed arguments include \'Reader\' and \'Writer\'.')
-
     @property
     def path(self):
+        """The key of the tab in the session store"""
         return self._file_path
 
     @path.setter
     def path(self, v: str):
-        if exists(v) and isfile(v):
+        if self._store.tab_type(v) == self._type:
             self._file_path = v
 
     @property
     def database(self):
-        return self.parser.get('Databases', 'current')
+        return self._fields['database'] or ''
 
     @database.setter
     def database(self, v: str):
         if type(v) == str and exists(v):
-            self.parser.set('Databases', 'current', v)
+            self._fields['database'] = v
             self.write_file()
 
     @property
     def id_(self):
-        return self.parser.getliteral('Attributes', 'id')
+        return self._fields['id']
 
     @id_.setter
     def id_(self, v: int = None):
         if type(v) == int or v is None:
-            self.parser['Attributes']['id'] = str(v)
+            self._fields['id'] = v
             self.write_file()
         else:
             raise TypeError('Argument is not of type int/is not None.')
 
-    def create_parser(self):
-        self.parser['Meta'] = {
-            'type': self._type
-        }
-        self.parser['Databases'] = {
-            'current': ''
-        }
-        self.parser['Attributes'] = {
-            'id': 'None'
-        }
-
-    def load_parser(self):
-        if self._file_path and exists(self._file_path):
-            self.parser.read(self._file_path)
+    def create_fields(self):
+        self._fields = {'database': '', 'id': None}
+
+    def load_fields(self):
+        """Reads the fields of the tab, applying any changes logged since they were last written, or opens a new tab"""
+        fields = self._store.load(self._file_path) if self._file_path else None
+        if fields is None:
+            self.create_fields()
+            self._file_path = self._store.add_tab(self._type, self._fields)
+            self._written = self._values()
         else:
-            self.create_parser()
-            self.write_file()
+            self._fields = fields
+            self._written = self._values()
+            self._generation = self._store.generation(self._file_path)
+            if exists(self._log_path):
+                self._recover()
 
     def delete_tempfile(self):
-        if exists(self._file_path):
-            remove(self._file_path)
+        """Closes the tab, removing it from the session store"""
+        self._store.remove_tab(self._file_path)
+        if exists(self._log_path):
+            remove(self._log_path)
+
+    @contextmanager
+    def batch(self):
+        """Defers writing the fields until the outermost batch closes, so a group of fields is written once"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self.write_file()
 
     def write_file(self):
-        with open(self._file_path, 'w') as file:
-            self.parser.write(file)
-            file.close()
+        """Saves the fields. While writes are coalesced, the changes are appended to the log and the row is written
+        later; otherwise it is written now. Nothing is written before the tab has been added to the store"""
+        if self._batch_depth:
+            self._dirty = True
+            return
+        self._dirty = False
+        if not self._file_path:
+            return
+        if _scheduler is None:
+            self.flush()
+            return
+        changes = self._changes()
+        if changes:
+            makedirs(LOG_DIRECTORY, exist_ok=True)
+            with open(self._log_path, 'a') as file:
+                file.write(''.join(dumps([self._generation + 1] + x) + '\n' for x in changes))
+            _scheduler.mark(self)
+
+    def flush(self):
+        """Writes every field of the tab in one transaction and clears the log"""
+        self._store.save(self._file_path, self._fields, self._generation + 1)
+        self._generation += 1
+        self._written = self._values()
+        if exists(self._log_path):
+            remove(self._log_path)
+
+    def flush_pending(self):
+        """Writes the changes waiting in the log, unless the tab has been closed in the meantime"""
+        if self._store.has_tab(self._file_path):
+            self.flush()
+        elif exists(self._log_path):
+            remove(self._log_path)
+
+    @property
+    def _log_path(self):
+        return join(LOG_DIRECTORY, '{}.{}.log'.format(self._type, basename(self._file_path)))
+
+    def _values(self):
+        """The fields as they are kept in the store"""
+        return {k: to_column(kind, self._fields.get(k)) for k, kind in COLUMNS[self._type].items()}
+
+    def _changes(self):
+        """Lists the fields that have changed since they were last written or logged"""
+        changes: List[list] = []
+        for key, value in self._values().items():
+            old = self._written.get(key)
+            if value != old:
+                changes.append(_log_entry(key, old, value))
+                self._written[key] = value
+        return changes
+
+    def _recover(self):
+        """Applies the changes logged before the application stopped without writing them, then writes them"""
+        values = self._values()
+        with open(self._log_path) as file:
+            for line in file:
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    # The last line may have been cut short
+                    break
+                # Lines logged before the flushes were numbered have no generation and are always applied
+                generation = entry.pop(0) if isinstance(entry[0], int) else self._generation + 1
+                if generation <= self._generation:
+                    # The row was written with this change, but the application stopped before removing the log
+                    continue
+                kind, field = entry[:2]
+                if kind == 'splice':
+                    old = values.get(field) or ''
+                    prefix, suffix, text = entry[2:]
+                    values[field] = old[:prefix] + text + old[len(old) - suffix:]
+                else:
+                    values[field] = entry[2]
+        columns = COLUMNS[self._type]
+        self._fields.update({k: from_column(columns[k], v) for k, v in values.items() if k in columns})
+        self.flush()
+
+
+def _default_database():
+    db = join(getcwd(), 'jurnl.sqlite')
+    if not exists(db):
+        create_database(db)
+    return db
+
+
+def _default_dates():
+    return {
+        'low year': get_oldest_date().year,
+        'high year': get_newest_date().year,
+        'low month': 1,
+        'high month': 12,
+        'low day': 1,
+        'high day': 31,
+        'low hour': 0,
+        'high hour': 23,
+        'low minute': 0,
+        'high minute': 59,
+        'low weekday': 0,
+        'high weekday': 6
+    }
 
 
 class ReaderFileManager(_TempFileManager):
-    """Manages a single tempfile containing all fields of a reading module"""
+    """Manages the fields of a reading module"""
 
     def __init__(self, file_path: str = None):
         super(ReaderFileManager, self).__init__(file_path=file_path, module='Reader')
 
-        self.load_parser()
+        self.load_fields()
 
     @property
     def body(self):
-        return self.parser.get('Strings', 'body')
+        return self._fields['body']
 
     @body.setter
     def body(self, v: str):
-        self.parser['Strings']['body'] = str(v)
+        self._fields['body'] = str(v)
+        self.write_file()
+
+    @property
+    def query(self):
+        return self._fields['query'] or ''
+
+    @query.setter
+    def query(self, v: str):
+        self._fields['query'] = str(v)
         self.write_file()
 
     @property
     def tags(self):
-        return self.parser.gettuple('Strings', 'tags')
+        return self._fields['tags']
 
     @tags.setter
     def tags(self, v: Tuple[str]):
         if all([isinstance(x, str) for x in v]):
-            v = tuple(v)
-            self.parser['Strings']['tags'] = str(v)
+            self._fields['tags'] = tuple(v)
             self.write_file()
 
     @property
     def dates(self):
-        d = dict()
-        for key in self.parser.options('Dates'):
-            d[key] = self.parser.getint('Dates', key)
-        return d
+        return dict(self._fields['dates'])
 
     @dates.setter
     def dates(self, v: Dict[str, int]):
-        for key in v:
-            self.parser.set('Dates', key, str(v[key]))
+        dates = dict(self._fields['dates'])
+        dates.update({key: int(v[key]) for key in v})
+        self._fields['dates'] = dates
         self.write_file()
 
     @property
     def has_children(self):
-        return self.parser.getint('Flags', 'has children')
+        return self._fields['has_children']
 
     @has_children.setter
     def has_children(self, v: int):
         if type(v) == int:
-            self.parser['Flags']['has children'] = str(v)
+            self._fields['has_children'] = v
             self.write_file()
 
     @property
     def has_parent(self):
-        return self.parser.getint('Flags', 'has parent')
+        return self._fields['has_parent']
 
     @has_parent.setter
     def has_parent(self, v: int):
         if type(v) == int:
-            self.parser['Flags']['has parent'] = str(v)
+            self._fields['has_parent'] = v
             self.write_file()
 
     @property
     def has_attachments(self):
-        return self.parser.getint('Flags', 'has attachments')
+        return self._fields['has_attachments']
 
     @has_attachments.setter
     def has_attachments(self, v: int):
         if type(v) == int:
-            self.parser['Flags']['has attachments'] = str(v)
+            self._fields['has_attachments'] = v
             self.write_file()
 
     @property
     def date_filter(self):
-        return self.parser.getint('Settings', 'date filter')
+        return self._fields['date_filter']
 
     @date_filter.setter
     def date_filter(self, v: int):
         if type(v) == int:
-            self.parser.set('Settings', 'date filter', str(v))
+            self._fields['date_filter'] = v
             self.write_file()
 
     @property
     def tag_filter(self):
-        return self.parser.getint('Settings', 'tag filter')
+        return self._fields['tag_filter']
 
     @tag_filter.setter
     def tag_filter(self, v: int):
         if type(v) == int:
-            self.parser.set('Settings', 'tag filter', str(v))
+            self._fields['tag_filter'] = v
             self.write_file()
 
+    @property
+    def sort(self):
+        return self._fields['sort'] or ()
+
+    @sort.setter
+    def sort(self, v: Tuple[Tuple[str, bool]]):
+        self._fields['sort'] = tuple(tuple(x) for x in v)
+        self.write_file()
+
     @property
     def tags_sort(self):
-        return self.parser.getint('Settings', 'tags sort')
+        return self._fields['tags_sort']
 
     @tags_sort.setter
     def tags_sort(self, v: int):
         if type(v) == int:
-            self.parser.set('Settings', 'tags sort', str(v))
+            self._fields['tags_sort'] = v
             self.write_file()
 
-    def create_parser(self):
-        super(ReaderFileManager, self).create_parser()
-        self.parser['Settings'] = {
-            'date filter': '0',
-            'tags sort': '0',
-            'tag filter': '0'
-        }
-        self.parser['Flags'] = {
-            'has attachments': '0',
-            'has parent': '0',
-            'has children': '0'
-        }
-        self.parser['Strings'] = {
-            'tags': '()',
-            'body': ''
-        }
-        self.parser['Dates'] = {
-            'low year': str(get_oldest_date().year),
-            'high year': str(get_newest_date().year),
-            'low month': '1',
-            'high month': '12',
-            'low day': '01',
-            'high day': '31',
-            'low hour': '00',
-            'high hour': '23',
-            'low minute': '00',
-            'high minute': '59',
-            'low weekday': '0',
-            'high weekday': '6'
-        }
-        if not self.database:
-            db = join(getcwd(), 'jurnl.sqlite')
-            if not exists(db):
-                create_database(db)
-            self.database = db
-
-    def load_parser(self):
-        if self._file_path and exists(self._file_path):
-            self.parser.read(self._file_path)
-        else:
-            self._file_path = join(self._tempdir_path, _get_file_id(self._type))
-            self.create_parser()
-            self.write_file()
+    def create_fields(self):
+        super(ReaderFileManager, self).create_fields()
+        self._fields.update({
+            'date_filter': 0,
+            'tags_sort': 0,
+            'tag_filter': 0,
+            'sort': (),
+            'has_attachments': 0,
+            'has_parent': 0,
+            'has_children': 0,
+            'tags': (),
+            'body': '',
+            'query': '',
+            'dates': _default_dates(),
+            'database': _default_database()
+        })
 
     def reset_all_fields(self):
-        self.id_ = 0
-        self.body = ''
-        self.tags = ()
-        self.has_attachments = 0
-        self.has_parent = 0
-        self.has_children = 0
-        self.date_filter = 0
-        self.tag_filter = 0
-        self.tags_sort = 0
-        self.reset_dates()
+        with self.batch():
+            self.id_ = 0
+            self.body = ''
+            self.query = ''
+            self.tags = ()
+            self.has_attachments = 0
+            self.has_parent = 0
+            self.has_children = 0
+            self.date_filter = 0
+            self.tag_filter = 0
+            self.tags_sort = 0
+            self.sort = ()
+            self.reset_dates()
 
     def reset_dates(self):
-        self.dates = {
-            'low year': str(get_oldest_date().year),
-            'high year': str(get_newest_date().year),
-            'low month': '1',
-            'high month': '12',
-            'low day': '01',
-            'high day': '31',
-            'low hour': '00',
-            'high hour': '23',
-            'low minute': '00',
-            'high minute': '59',
-            'low weekday': '0',
-            'high weekday': '6'
-        }
+        self.dates = _default_dates()
 
 
 class WriterFileManager(_TempFileManager):
-    """Manages a single tempfile containing all fields of a writing module"""
+    """Manages the fields of a writing module"""
 
     def __init__(self, file_path: str = None):
         super(WriterFileManager, self).__init__(file_path=file_path, module='Writer')
 
-        self.load_parser()
+        self.load_fields()
 
     @property
     def errors(self):
@@ -334,98 +486,85 @@ class WriterFileManager(_TempFileManager):
 
     @property
     def body(self):
-        return self.parser.get('Attributes', 'body')
+        return self._fields['body']
 
     @body.setter
     def body(self, v: str):
         if type(v) == str:
-            self.parser['Attributes']['body'] = v
+            self._fields['body'] = v
             self.write_file()
         else:
             raise TypeError('Argument is not of type str.')
 
     @property
     def date(self) -> datetime:
-        return self.parser.getdate('Attributes', 'date')
+        return self._fields['date']
 
     @date.setter
     def date(self, v: datetime):
-        if type(v) == datetime:
-            self.parser['Attributes']['date'] = v.strftime('%Y-%m-%d %H:%M:%S.%f')
-            self.write_file()
-        elif v is None:
-            self.parser['Attributes']['date'] = 'None'
+        if type(v) == datetime or v is None:
+            self._fields['date'] = v
             self.write_file()
         else:
             raise TypeError('Argument is not of type datetime.')
 
     @property
     def tags(self):
-        return self.parser.gettuple('Attributes', 'tags')
+        return self._fields['tags']
 
     @tags.setter
     def tags(self, v: Tuple[str]):
         if type(v) == tuple and all(isinstance(x, str) for x in v):
-            self.parser['Attributes']['tags'] = str(v)
+            self._fields['tags'] = v
             self.write_file()
         else:
             raise TypeError('Argument should be a tuple of str.')
 
     @property
     def attachments(self):
-        return self.parser.gettuple('Attributes', 'attachments')
+        return self._fields['attachments']
 
     @attachments.setter
     def attachments(self, v: Tuple[str]):
         if type(v) == tuple:
             d = [x for x in v if type(x) == int]
             v = _check_attachments(list(set(v).difference(d)))
-            t = tuple([k for k in v.keys() if v[k] == 'good'] + d)
-            self.parser['Attributes']['attachments'] = str(t)
+            self._fields['attachments'] = tuple([k for k in v.keys() if v[k] == 'good'] + d)
             self.write_file()
         else:
             raise TypeError('Argument should be a tuple of str.')
 
     @property
     def parent(self):
-        return self.parser.getliteral('Attributes', 'parent')
+        return self._fields['parent']
 
     @parent.setter
     def parent(self, v: int):
         if type(v) == int or v is None:
-            self.parser['Attributes']['parent'] = str(v)
+            self._fields['parent'] = v
             self.write_file()
         else:
             raise TypeError('Argument is not of type int/is not None.')
 
-    def create_parser(self):
-        super(WriterFileManager, self).create_parser()
-        self.parser.set('Attributes', 'body', '')
-        self.parser.set('Attributes', 'date', 'None')
-        self.parser.set('Attributes', 'tags', '()')
-        self.parser.set('Attributes', 'attachments', '()')
-        self.parser.set('Attributes', 'parent', 'None')
-        if not self.database:
-            db = join(getcwd(), 'jurnl.sqlite')
-            if not exists(db):
-                create_database(db)
-            self.database = db
-
-    def load_parser(self):
-        if self._file_path:
-            self.parser.read(self._file_path)
-        else:
-            self._file_path = join(self._tempdir_path, _get_file_id(self._type))
-            self.create_parser()
-            self.write_file()
+    def create_fields(self):
+        super(WriterFileManager, self).create_fields()
+        self._fields.update({
+            'body': '',
+            'date': None,
+            'tags': (),
+            'attachments': (),
+            'parent': None,
+            'database': _default_database()
+        })
 
     def reset_all_fields(self):
-        self.id_ = 0
-        self.body = ''
-        self.date = None
-        self.tags = ()
-        self.attachments = ()
-        self.parent = 0
+        with self.batch():
+            self.id_ = 0
+            self.body = ''
+            self.date = None
+            self.tags = ()
+            self.attachments = ()
+            self.parent = 0
 
 
 def _test_reader():
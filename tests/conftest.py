@@ -0,0 +1,152 @@
+"""Fixtures shared by the tests. The modules keep their files relative to the working directory, so every test runs in
+a directory of its own with a journal of random entries"""
+import sys
+from contextlib import closing
+from datetime import datetime, timedelta
+from os.path import dirname, abspath
+from random import Random
+from sqlite3 import connect
+
+import pytest
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+import session  # noqa: E402
+import tempfiles  # noqa: E402
+from database import create_database  # noqa: E402
+from entry_metrics import store_metrics  # noqa: E402
+
+TAGS = ('red', 'green', 'blue', 'two words', 'a,b')
+WORDS = ('deadline', 'garden', 'letter', 'Deadline', 'river', 'quiet', 'storm')
+UNTAGGED = '(UNTAGGED)'
+
+
+class FakeMaster:
+    """Stands in for the main window, running the callbacks it is given only when asked to"""
+
+    def __init__(self):
+        self.timers = {}
+        self.errors = []
+        self.bindings = {}
+        self._ids = 0
+
+    def bind_class(self, tag: str, event: str, func, add=None):
+        self.bindings.setdefault((tag, event), []).append(func)
+
+    def fire(self, tag: str, event: str):
+        """Calls the functions bound to an event of a bind tag, as event_generate would"""
+        for func in self.bindings.get((tag, event), ()):
+            func(None)
+
+    def after(self, ms: int, func, *args):
+        self._ids += 1
+        self.timers[self._ids] = func, args
+        return self._ids
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, id_):
+        self.timers.pop(id_, None)
+
+    def report_callback_exception(self, exc, val, tb):
+        self.errors.append(val)
+
+    def run(self):
+        """Runs every callback, including the ones scheduled by the callbacks themselves"""
+        while self.timers:
+            func, args = self.timers.pop(min(self.timers))
+            func(*args)
+
+
+class FakePool:
+    """Holds the requests it is given until they are run, delivering the results the way the workers would. A newer
+    request supersedes one that is waiting under the same key"""
+
+    def __init__(self):
+        self.requests = []
+        self.cancelled = []
+
+    def submit(self, key, function, *args, callback=None, errback=None, on_partial=None):
+        self.cancel(key)
+        self.requests.append((key, function, args, callback, errback))
+
+    def cancel(self, key):
+        if any(x[0] == key for x in self.requests):
+            self.cancelled.append(key)
+        self.requests = [x for x in self.requests if x[0] != key]
+
+    def run(self):
+        while self.requests:
+            key, function, args, callback, errback = self.requests.pop(0)
+            try:
+                result = function(*args)
+            except Exception as e:
+                errback(e)
+            else:
+                if callback:
+                    callback(result)
+
+
+def fill(database: str, count: int, seed: int = 0):
+    """Adds random entries to a journal, with tags, attachments, parents, and dates spread over a few years, measured as
+    the writers would measure them
+
+    :return: a dict of each id and its creation date
+    """
+    random = Random(seed)
+    start = datetime(2018, 1, 1)
+    created = {}
+    with closing(connect(database)) as d:
+        for entry_id in range(1, count + 1):
+            body = ' '.join(random.choice(WORDS) for _ in range(random.randint(0, 12)))
+            date = start + timedelta(minutes=random.randint(0, 4 * 365 * 24 * 60))
+            created[entry_id] = date
+            d.execute('INSERT INTO bodies(entry_id, body) VALUES(?, ?)', (entry_id, body))
+            store_metrics(d, entry_id, body)
+            d.execute('INSERT INTO dates(entry_id, created, last_edit) VALUES(?, ?, ?)',
+                      (entry_id, str(date), str(date)))
+            tags = random.sample(TAGS, random.randint(0, 3))
+            for tag in tags if tags else [UNTAGGED]:
+                d.execute('INSERT INTO tags(entry_id, tag) VALUES(?, ?)', (entry_id, tag))
+            if random.random() < 0.2:
+                d.execute('INSERT INTO attachments(entry_id, filename, file) VALUES(?, ?, ?)',
+                          (entry_id, 'file.txt', b'x'))
+            if entry_id > 1 and random.random() < 0.2:
+                d.execute('INSERT INTO relations(child, parent) VALUES(?, ?)',
+                          (entry_id, random.randint(1, entry_id - 1)))
+        d.commit()
+    return created
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A fresh working directory, with no session store or write scheduler carried over from another test"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(session, '_session', None)
+    monkeypatch.setattr(tempfiles, '_scheduler', None)
+    yield tmp_path
+    if session._session is not None:
+        session._session.close()
+
+
+@pytest.fixture
+def tk_root():
+    """A hidden main window for the tests of widgets, which are skipped where there is no display"""
+    from tkinter import Tk, TclError
+    try:
+        root = Tk()
+    except TclError:
+        pytest.skip('needs a display')
+    root.withdraw()
+    yield root
+    root.destroy()
+
+
+@pytest.fixture
+def journal(workdir):
+    """The location of an up to date journal of 400 random entries"""
+    path = str(workdir / 'jurnl.sqlite')
+    create_database(path)
+    fill(path, 400)
+    return path
@@ -0,0 +1,27 @@
+from json import dump, load
+from os import makedirs
+
+import autoimport
+from autoimport import import_entries
+from database import create_database
+from filter import Filter
+
+
+def test_import_counts_the_new_entries(workdir, monkeypatch):
+    path = str(workdir / 'jurnl.sqlite')
+    create_database(path)
+    monkeypatch.setattr(autoimport, 'imports_location', lambda: 'imports')
+    monkeypatch.setattr(autoimport, 'default_database', lambda: path)
+    makedirs('imports')
+    for i, imported in enumerate((False, False, True)):
+        with open('imports/{}.mjson'.format(i), 'w') as file:
+            dump({'imported': imported, 'date': '2020-01-0{}-10-00-00'.format(i + 1), 'body': 'entry {}'.format(i),
+                  'tags': ['red'], 'attachments': []}, file)
+    assert import_entries() == 2
+    with open('imports/0.mjson') as file:
+        assert load(file)['imported']
+    f = Filter(path)
+    f.update(tags=('red',))
+    assert f.count() == 2
+    # Files that were imported before are left alone, so nothing changes the second time
+    assert import_entries() == 0
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from base_widgets import TagChecklist
+
+TAGS = ['Garden', 'river', 'Rivers', 'storm', 'letters', 'deadline']
+
+
+@pytest.fixture
+def checklist(tk_root):
+    changes = []
+    checklist = TagChecklist(master=tk_root, command=lambda: changes.append(checklist.selected))
+    checklist.tags = TAGS + ['river']
+    checklist.changes = changes
+    return checklist
+
+
+def _toggle(checklist: TagChecklist, tag: str, on: bool):
+    """Checks or unchecks a tag as a click on its row would"""
+    checklist._toggle(SimpleNamespace(tag=tag, var=SimpleNamespace(get=lambda: int(on))))
+
+
+def test_tags_are_kept_once_in_order(checklist):
+    assert checklist.tags == tuple(sorted(set(TAGS)))
+    assert checklist._list.count == len(TAGS)
+
+
+def test_the_selection_is_a_set_of_tags(checklist):
+    checklist.selected = ['storm', 'river', 'storm']
+    assert checklist.selected == ('river', 'storm')
+    assert 'storm' not in checklist.unselected
+    _toggle(checklist, 'Garden', True)
+    _toggle(checklist, 'storm', False)
+    assert checklist.selected == ('Garden', 'river')
+    assert checklist.changes == [('Garden', 'river', 'storm'), ('Garden', 'river')]
+
+
+def test_the_pattern_ignores_case_and_narrows_as_it_is_typed(checklist):
+    checklist.pattern = 'R'
+    assert checklist._shown == ['Garden', 'Rivers', 'letters', 'river', 'storm']
+    checklist.pattern = 'rIv'
+    assert checklist._shown == ['Rivers', 'river']
+    assert checklist._list.count == 2
+    # A pattern that does not extend the last one searches every tag again
+    checklist.pattern = 'e'
+    assert checklist._shown == ['Garden', 'Rivers', 'deadline', 'letters', 'river']
+    checklist.pattern = ''
+    assert checklist._list.count == len(TAGS)
+
+
+def test_autosort_lists_the_selected_tags_first(checklist):
+    checklist.selected = ['storm', 'letters']
+    checklist.autosort = True
+    assert checklist._shown[:2] == ['letters', 'storm']
+    checklist.pattern = 's'
+    assert checklist._shown == ['letters', 'storm', 'Rivers']
+    checklist.tags = ['storm', 'sun']
+    # Only the tags that are listed count as selected, and the pattern still applies
+    assert checklist.selected == ('storm',)
+    assert checklist._shown == ['storm', 'sun']
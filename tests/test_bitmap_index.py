@@ -0,0 +1,146 @@
+from contextlib import closing
+from shutil import copyfile
+from sqlite3 import connect
+
+import pytest
+
+from bitmap_index import BitmapIndex, get_index, popcount, DATE_PARTS
+from conftest import UNTAGGED
+from database_info import get_change_counter
+from writer import set_body, create_entry
+
+
+def _ids(database: str, sql: str, params: tuple = ()):
+    with closing(connect(database)) as d:
+        return {x[0] for x in d.execute(sql, params)}
+
+
+def _rows(database: str, sql: str):
+    with closing(connect(database)) as d:
+        return d.execute(sql).fetchall()
+
+
+def _date_order(database: str):
+    with closing(connect(database)) as d:
+        return tuple(x[0] for x in d.execute('SELECT entry_id FROM dates ORDER BY created, entry_id'))
+
+
+def test_ids_are_in_date_order(journal):
+    index = BitmapIndex(journal)
+    assert index.ids == _date_order(journal)
+    assert popcount(index.all) == len(index.ids)
+
+
+def test_bits_and_decode_round_trip(journal):
+    index = BitmapIndex(journal)
+    ids = set(index.ids[::3]) | {10 ** 6}
+    assert set(index.decode(index.bits(ids))) == ids - {10 ** 6}
+
+
+@pytest.mark.parametrize('tags', [('red',), ('red', 'blue'), ('two words', 'a,b', UNTAGGED), ()])
+def test_tag_modes_match_sql(journal, tags):
+    index = BitmapIndex(journal)
+    tag_sets = {i: set() for i in index.ids}
+    for entry_id, tag in _rows(journal, 'SELECT entry_id, tag FROM tags'):
+        tag_sets[entry_id].add(tag)
+    wanted = set(tags)
+    assert set(index.decode(index.any_of(tags))) == {i for i, t in tag_sets.items() if t & wanted}
+    assert set(index.decode(index.all_of(tags))) == {i for i, t in tag_sets.items() if wanted and t >= wanted}
+    assert set(index.decode(index.only(tags))) == {i for i, t in tag_sets.items() if t == wanted}
+
+
+def test_flags_match_sql(journal):
+    index = BitmapIndex(journal)
+    assert set(index.decode(index.has_attachments)) == _ids(journal, 'SELECT entry_id FROM attachments')
+    assert set(index.decode(index.has_parent)) == _ids(journal, 'SELECT child FROM relations')
+    assert set(index.decode(index.has_children)) == _ids(journal, 'SELECT parent FROM relations')
+
+
+@pytest.mark.parametrize('part, fmt', [('year', '%Y'), ('month', '%m'), ('day', '%d'), ('hour', '%H'),
+                                       ('minute', '%M'), ('weekday', '%w')])
+def test_date_parts_match_sql(journal, part, fmt):
+    index = BitmapIndex(journal)
+    low, high = {'year': (2019, 2020), 'month': (3, 7), 'day': (10, 20), 'hour': (22, 23), 'minute': (0, 15),
+                 'weekday': (1, 5)}[part]
+    expected = _ids(journal, 'SELECT entry_id FROM dates WHERE CAST(strftime(?, created) AS INTEGER) BETWEEN ? AND ?',
+                    (fmt, low, high))
+    assert set(index.decode(index.date_part(part, low, high))) == expected
+
+
+def test_histograms_add_up(journal):
+    index = BitmapIndex(journal)
+    bits = index.any_of(('red',))
+    for part in DATE_PARTS:
+        assert sum(index.histogram(part, bits).values()) == popcount(bits)
+
+
+def test_select_pages_through_a_bitmap(journal):
+    index = BitmapIndex(journal)
+    bits = index.any_of(('green', 'blue'))
+    ordinals = [i for i in range(len(index.ids)) if bits >> i & 1]
+    assert index.select(bits) == ordinals
+    assert index.select(bits, 50, 300, limit=20) == [o for o in ordinals if 50 <= o < 300][:20]
+    assert index.select(bits, 50, 300, limit=20, reverse=True) == [o for o in ordinals if 50 <= o < 300][-20:]
+    for n in (0, 1, len(ordinals) - 1):
+        assert index.nth(bits, n) == ordinals[n]
+    assert index.nth(bits, len(ordinals)) is None
+
+
+def test_nth_crosses_chunks():
+    index = BitmapIndex.__new__(BitmapIndex)
+    ordinals = [3, 4095, 4096, 9000, 20000]
+    bits = sum(1 << o for o in ordinals)
+    assert [index.nth(bits, n) for n in range(len(ordinals))] == ordinals
+
+
+def test_position_finds_keys(journal):
+    index = BitmapIndex(journal)
+    rows = index.rows(range(len(index.ids)))
+    for o in (0, 17, len(rows) - 1):
+        assert index.position(rows[o], after=False) == o
+        assert index.position(rows[o], after=True) == o + 1
+        assert index.ordinal(rows[o][1]) == o
+
+
+def test_columns_match_sql(journal):
+    index = BitmapIndex(journal)
+    words = dict(_rows(journal, 'SELECT entry_id, words FROM entry_metrics'))
+    assert [words[i] for i in index.ids] == index.column('words')
+    attachments = dict(_rows(journal, 'SELECT entry_id, COUNT(*) FROM attachments GROUP BY entry_id'))
+    assert [attachments.get(i, 0) for i in index.ids] == index.column('attachments')
+
+
+def test_get_index_is_rebuilt_when_the_database_changes(journal):
+    index = get_index(journal)
+    assert get_index(journal) is index
+    set_body('a new entry', journal)
+    assert get_index(journal) is not index
+    assert get_index(journal).version == get_change_counter(journal)
+
+
+def test_get_index_accepts_a_version_already_read(journal):
+    version = get_change_counter(journal)
+    index = get_index(journal, version)
+    set_body('a new entry', journal)
+    # The version read before the change is still satisfied by the index built for it
+    assert get_index(journal, version) is index
+    assert get_index(journal, get_change_counter(journal)) is not index
+
+
+def test_get_index_is_rebuilt_when_the_counter_goes_back(journal):
+    copyfile(journal, journal + '.backup')
+    version = get_change_counter(journal)
+    create_entry(journal, 'a new entry', ('red',), attachments=())
+    newer = get_index(journal)
+    # Restoring the backup gives the database a lower counter than the index was built for
+    copyfile(journal + '.backup', journal)
+    assert get_change_counter(journal) == version
+    assert get_index(journal, version) is not newer
+    assert get_index(journal, version).version == version
+
+
+def test_created_dates_are_read_from_the_index(journal):
+    index = BitmapIndex(journal)
+    created = dict(_rows(journal, 'SELECT entry_id, created FROM dates'))
+    ids = list(index.ids[::7]) + [10 ** 6]
+    assert [x.isoformat(' ') if x else x for x in index.created_dates(ids)] == [created.get(i) for i in ids]
@@ -0,0 +1,190 @@
+from configparser import ConfigParser, NoSectionError
+from multiprocessing import get_context, get_all_start_methods
+
+import pytest
+
+import configurations
+from configurations import Settings, create_file
+from conftest import FakeMaster
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(configurations, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def config_file(workdir):
+    create_file(path='settings.config')
+    return 'settings.config'
+
+
+def _on_disk(path: str):
+    parser = ConfigParser()
+    parser.read(path)
+    return parser
+
+
+def _external_write(path: str, section: str, option: str, value: str):
+    """Changes the file the way another instance of the application would"""
+    parser = _on_disk(path)
+    parser.set(section, option, value)
+    with open(path, 'w') as file:
+        parser.write(file)
+
+
+def test_the_file_is_created_when_missing(workdir):
+    settings = Settings('settings.config')
+    assert settings.get('Backup', 'enabled') == 'yes'
+    assert settings.getint('Backup', 'number of backups') == 3
+    assert settings.getliteral('Notebook', 'pages') == []
+    assert settings.options('Databases') == {'jurnl': str(workdir / 'jurnl.sqlite')}
+
+
+def test_reads_are_served_from_memory(config_file, clock, monkeypatch):
+    settings = Settings(config_file)
+    settings.get('Backup', 'enabled')
+    reads = []
+    monkeypatch.setattr(Settings, 'reload', lambda self: reads.append(self))
+    for _ in range(100):
+        settings.get('Backup', 'enabled')
+    clock.now += configurations.REVALIDATE_INTERVAL
+    settings.get('Backup', 'enabled')
+    # The file is only read again if its modification time or size has changed
+    assert reads == []
+
+
+def test_external_changes_are_picked_up(config_file, clock):
+    settings = Settings(config_file)
+    assert settings.get('Backup', 'backup interval') == '72'
+    _external_write(config_file, 'Backup', 'backup interval', '240')
+    assert settings.get('Backup', 'backup interval') == '72'
+    clock.now += configurations.REVALIDATE_INTERVAL
+    assert settings.get('Backup', 'backup interval') == '240'
+
+
+def test_copies_are_independent(config_file):
+    settings = Settings(config_file)
+    copy = settings.copy()
+    copy.set('Backup', 'enabled', 'no')
+    assert settings.get('Backup', 'enabled') == 'yes'
+
+
+def test_changes_are_written_straight_away(config_file, monkeypatch):
+    settings = Settings(config_file)
+    settings.set('Backup', 'enabled', 'no')
+    assert _on_disk(config_file).get('Backup', 'enabled') == 'no'
+    settings.remove_option('Visual', 'theme')
+    assert not _on_disk(config_file).has_option('Visual', 'theme')
+    assert not settings.pending
+    with pytest.raises(NoSectionError):
+        settings.set('Missing', 'option', 'value')
+
+
+def _count_writes(monkeypatch):
+    writes = []
+    replace = configurations.replace
+
+    def counted(src, dst):
+        writes.append(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(configurations, 'replace', counted)
+    return writes
+
+
+def test_an_edit_is_written_once(config_file, monkeypatch):
+    settings = Settings(config_file)
+    writes = _count_writes(monkeypatch)
+    with settings.edit():
+        settings.set('Backup', 'enabled', 'no')
+        with settings.edit():
+            settings.set('Backup', 'number of backups', '5')
+        settings.set('Backup', 'number of backups', '6')
+        assert settings.get('Backup', 'number of backups') == '6'
+        assert writes == []
+    assert len(writes) == 1
+    assert _on_disk(config_file).get('Backup', 'number of backups') == '6'
+
+
+def test_an_edit_that_fails_changes_nothing(config_file, monkeypatch):
+    settings = Settings(config_file)
+    writes = _count_writes(monkeypatch)
+    with pytest.raises(RuntimeError):
+        with settings.edit():
+            settings.set('Backup', 'enabled', 'no')
+            raise RuntimeError
+    assert writes == []
+    assert settings.get('Backup', 'enabled') == 'yes'
+    assert not settings.pending
+
+
+def test_debounced_options_are_written_once_they_settle(config_file, monkeypatch):
+    master = FakeMaster()
+    settings = Settings(config_file)
+    settings.debounce(master, 250)
+    writes = _count_writes(monkeypatch)
+    for width in range(1000, 1010):
+        settings.set('Visual', 'dimensions', str((width, 600)))
+    assert writes == []
+    assert settings.pending
+    # Each change replaces the timer of the one before
+    assert len(master.timers) == 1
+    master.run()
+    assert len(writes) == 1
+    assert _on_disk(config_file).get('Visual', 'dimensions') == '(1009, 600)'
+    # Other options are not held back
+    settings.set('Backup', 'enabled', 'no')
+    assert len(writes) == 2
+    assert not master.timers
+
+
+def test_commits_keep_changes_from_other_instances(config_file):
+    first, second = Settings(config_file), Settings(config_file)
+    first.get('Backup', 'enabled')
+    second.get('Backup', 'enabled')
+    first.set('Backup', 'enabled', 'no')
+    second.set('Backup', 'number of backups', '9')
+    on_disk = _on_disk(config_file)
+    assert on_disk.get('Backup', 'enabled') == 'no'
+    assert on_disk.get('Backup', 'number of backups') == '9'
+
+
+def _add_databases(path: str, name: str, count: int):
+    settings = Settings(path)
+    for i in range(count):
+        settings.set('Databases', '{}{}'.format(name, i), 'value')
+
+
+@pytest.mark.skipif('fork' not in get_all_start_methods(), reason='needs fork')
+def test_concurrent_commits_lose_nothing(config_file):
+    context = get_context('fork')
+    processes = [context.Process(target=_add_databases, args=(config_file, name, 200)) for name in 'abc']
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    options = _on_disk(config_file).options('Databases')
+    assert len([x for x in options if x != 'jurnl']) == 600
+
+
+def test_pages_are_not_prefetched_unless_set_to(config_file, monkeypatch):
+    settings = Settings(config_file)
+    monkeypatch.setattr(configurations, 'settings', settings)
+    assert configurations.prefetch_pages() is False
+    configurations.prefetch_pages(True)
+    assert configurations.prefetch_pages() is True
+    # Files written by earlier versions have no such option
+    settings.remove_option('Notebook', 'prefetch pages')
+    assert configurations.prefetch_pages() is False
@@ -0,0 +1,78 @@
+from contextlib import closing
+from sqlite3 import connect
+
+import pytest
+
+import database
+from conftest import fill
+from database import create_database, upgrade_database, SCHEMA_VERSION
+from entry_metrics import measure, METRICS
+from filter import Filter
+from reader_functions import get_metrics
+from writer import create_entry, modify_body, delete_entry
+
+
+@pytest.fixture
+def old_journal(workdir):
+    """A journal as an older version left it, with no entry_metrics table and no recorded version"""
+    path = str(workdir / 'old.sqlite')
+    create_database(path)
+    fill(path, 50)
+    with closing(connect(path)) as d:
+        d.execute('DROP TABLE entry_metrics')
+        d.execute('PRAGMA user_version = 0')
+    return path
+
+
+def _metrics(path: str):
+    with closing(connect(path)) as d:
+        return {x[0]: x[1:] for x in d.execute('SELECT entry_id, {} FROM entry_metrics'.format(', '.join(METRICS)))}
+
+
+def test_entries_can_be_saved_before_the_upgrade(old_journal):
+    entry = create_entry(old_journal, 'written before the upgrade', ('red',), attachments=())
+    modify_body(entry, 'edited before the upgrade', old_journal)
+    assert get_metrics(entry, old_journal)['words'] == 4
+    delete_entry(1, old_journal)
+    assert set(_metrics(old_journal)) == {entry}
+
+
+def test_metrics_can_be_read_before_the_upgrade(old_journal):
+    f = Filter(old_journal)
+    f.update(tags='all', is_untagged=True, sort=(('words', True),))
+    # Every entry counts as unmeasured, so the order falls back to the date
+    assert len(f.filtered_ids) == 50
+    assert f.metric_sum('words') == 0
+    assert get_metrics(1, old_journal) is None
+    delete_entry(1, old_journal)
+    assert len(f.filtered_ids) == 49
+
+
+def test_upgrade_measures_every_entry_once(old_journal, monkeypatch):
+    entry = create_entry(old_journal, 'saved before the upgrade', ('red',), attachments=())
+    assert upgrade_database(old_journal)
+    metrics = _metrics(old_journal)
+    with closing(connect(old_journal)) as d:
+        bodies = dict(d.execute('SELECT entry_id, body FROM bodies'))
+        assert d.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    assert metrics == {i: measure(body) for i, body in bodies.items()}
+    assert entry in metrics
+    # A database that is up to date is not scanned again
+    monkeypatch.setattr(database, 'backfill_metrics', lambda *args: pytest.fail('scanned again'))
+    assert not upgrade_database(old_journal)
+
+
+def test_an_outdated_table_is_rebuilt(old_journal):
+    with closing(connect(old_journal)) as d:
+        d.execute('CREATE TABLE entry_metrics(entry_id INTEGER PRIMARY KEY, chars INTEGER)')
+    entry = create_entry(old_journal, 'one two three', attachments=())
+    assert set(_metrics(old_journal)) == {entry}
+    upgrade_database(old_journal)
+    assert len(_metrics(old_journal)) == 51
+
+
+def test_new_databases_are_up_to_date(workdir, monkeypatch):
+    path = str(workdir / 'new.sqlite')
+    create_database(path)
+    monkeypatch.setattr(database, 'backfill_metrics', lambda *args: pytest.fail('scanned'))
+    assert not upgrade_database(path)
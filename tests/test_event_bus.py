@@ -0,0 +1,169 @@
+import pytest
+
+from conftest import FakeMaster, FakePool
+from event_bus import reader_bus, ReaderSnapshot, READER_EVENTS, PAGE
+from filter import Filter
+from modules import ReaderModule
+
+
+class Page:
+    """A Reader bus with a subscriber for each topic that records the snapshots it is given, in order"""
+
+    def __init__(self, pool: FakePool = None):
+        self.master = FakeMaster()
+        self.pool = pool
+        self.reader = ReaderModule(lazy=True)
+        self.bus = reader_bus(self.master, self.reader, 'Reader0', pool)
+        self.delivered = []
+        self.busy = []
+        for topic in ('ids', 'entry'):
+            self.bus.subscribe(topic, lambda s, t=topic: self.delivered.append((t, s)))
+            self.bus.add_busy_listener(topic, lambda b, t=topic: self.busy.append((t, b)))
+
+    def load(self):
+        while self.master.timers or self.pool and self.pool.requests:
+            self.master.run()
+            if self.pool:
+                self.pool.run()
+
+    def topics(self):
+        return [t for t, _ in self.delivered]
+
+
+@pytest.fixture
+def page(journal):
+    page = Page(FakePool())
+    page.load()
+    page.delivered.clear()
+    page.busy.clear()
+    return page
+
+
+def test_a_burst_of_events_is_loaded_once(page):
+    for event in ('<<Filter Attributes Changed>>', '<<Tempfile Updated>>', '<<Id Selected>>', '<<Tempfile Updated>>'):
+        page.master.fire('Reader0', event)
+    assert len(page.master.timers) == 1
+    page.master.run()
+    assert len(page.pool.requests) == 1
+    page.pool.run()
+    # The ids come first, as the first event named them first, and every subscriber shares one snapshot
+    assert page.topics() == ['ids', 'entry']
+    assert page.delivered[0][1] is page.delivered[1][1]
+    assert page.bus.latest('ids') is page.bus.latest('entry')
+
+
+def test_the_events_of_popups_are_coalesced_too(page):
+    for event in READER_EVENTS:
+        assert ('Child.Reader0', event) in page.master.bindings
+    page.master.fire('Child.Reader0', '<<Id Selected>>')
+    page.load()
+    assert page.topics() == ['entry']
+
+
+def test_a_snapshot_reads_each_value_once(page, monkeypatch):
+    expected = page.reader.filter.count()
+    page.bus.invalidate('ids')
+    page.master.run()
+    counts = []
+    count = Filter.count
+    monkeypatch.setattr(Filter, 'count', lambda self: counts.append(self) or count(self))
+    page.pool.run()
+    snapshot = page.bus.latest('ids')
+    assert snapshot.count == snapshot.count == expected
+    assert len(counts) == 1
+
+
+def test_a_load_in_flight_is_cancelled_and_loaded_again_with_the_new_topics(page):
+    page.bus.invalidate('entry')
+    page.master.run()
+    assert page.busy == [('entry', True)]
+    page.bus.invalidate('ids')
+    assert page.pool.cancelled == [('bus', 'Reader0')]
+    page.master.run()
+    assert len(page.pool.requests) == 1
+    page.pool.run()
+    assert page.topics() == ['ids', 'entry']
+    # A topic still loading when it is superseded is not reported as busy again
+    assert sorted(page.busy) == [('entry', False), ('entry', True), ('ids', False), ('ids', True)]
+
+
+def test_a_restored_snapshot_replaces_a_load_in_flight(page):
+    snapshot = ReaderSnapshot.restored(page.reader, {'count': 12345})
+    page.bus.invalidate('ids', 'entry')
+    page.master.run()
+    page.bus.restore(('ids', 'entry'), snapshot)
+    assert page.pool.cancelled == [('bus', 'Reader0')]
+    assert set(page.busy[2:]) == {('ids', False), ('entry', False)}
+    assert [s for _, s in page.delivered] == [snapshot, snapshot]
+    assert page.bus.latest('ids').count == 12345
+    page.load()
+    assert len(page.delivered) == 2
+
+
+def test_a_restored_snapshot_clears_only_its_own_topics(page):
+    page.bus.invalidate('ids', 'entry')
+    page.bus.restore(('ids',), ReaderSnapshot.restored(page.reader, {}))
+    page.load()
+    assert page.topics() == ['ids', 'entry']
+    assert page.delivered[1][1] is not page.delivered[0][1]
+
+
+def test_an_entry_that_is_filtered_out_is_deselected(page):
+    ids = page.reader.filter.filtered_ids
+    page.reader.id_ = ids[0]
+    page.bus.invalidate('entry')
+    page.load()
+    assert page.bus.latest('entry').id_ == ids[0]
+    page.delivered.clear()
+    page.reader.update(body='no entry says this')
+    page.bus.invalidate('ids')
+    page.load()
+    # The entry is reloaded along with the ids, and the page's selection is cleared before either is delivered
+    assert page.topics() == ['ids', 'entry']
+    assert page.reader.id_ == 0
+    assert page.bus.latest('entry').id_ == 0
+    assert page.bus.latest('entry').body == ''
+
+
+def test_without_a_pool_the_snapshot_is_read_on_the_next_idle_tick(journal):
+    page = Page()
+    assert page.delivered == []
+    page.master.run()
+    assert page.topics() == ['ids', 'entry']
+    assert page.delivered[0][1].count == page.reader.filter.count()
+
+
+def test_fetches_run_beside_the_snapshot(page):
+    results = []
+    page.bus.fetch('rows', lambda: 'first', callback=results.append)
+    page.bus.fetch('rows', lambda: 'second', callback=results.append)
+    page.load()
+    assert results == ['second']
+    page.bus.fetch('rows', lambda: 'third', callback=results.append)
+    page.bus.cancel('rows')
+    page.load()
+    assert results == ['second']
+
+
+def test_the_snapshot_holds_the_page_of_rows_around_the_selected_entry(page):
+    ids = page.reader.filter.filtered_ids
+    page.reader.id_ = ids[250]
+    page.bus.invalidate('ids')
+    page.load()
+    snapshot = page.bus.latest('ids')
+    assert snapshot.position == 250
+    assert snapshot.first == 250 - PAGE // 2
+    assert [x[1] for x in snapshot.rows] == list(ids[snapshot.first:snapshot.first + PAGE])
+    assert snapshot.count == len(ids)
+
+
+def test_rows_coming_into_view_are_fetched_from_the_snapshot(page):
+    ids = page.reader.filter.filtered_ids
+    snapshot = page.bus.latest('ids')
+    rows = []
+    page.bus.fetch('rows', snapshot.page, snapshot.rows[-1], callback=rows.append)
+    page.load()
+    page.bus.fetch('rows', snapshot.seek, len(ids) - 10, callback=rows.append)
+    page.load()
+    assert [x[1] for x in rows[0]] == list(ids[PAGE:2 * PAGE])
+    assert [x[1] for x in rows[1]] == list(ids[-10:])
@@ -0,0 +1,265 @@
+from contextlib import closing
+from shutil import copyfile
+from datetime import datetime
+from random import Random
+from sqlite3 import connect
+
+import pytest
+
+import filter as filter_module
+from conftest import TAGS, WORDS, UNTAGGED
+from filter import Filter
+from session import get_session
+from writer import create_entry
+
+
+def _journal(database: str):
+    """Reads every entry of a journal into plain Python values"""
+    with closing(connect(database)) as d:
+        created = {i: datetime.fromisoformat(c) for i, c in d.execute('SELECT entry_id, created FROM dates')}
+        bodies = dict(d.execute('SELECT entry_id, body FROM bodies').fetchall())
+        tags = {i: set() for i in created}
+        for i, tag in d.execute('SELECT entry_id, tag FROM tags'):
+            tags[i].add(tag)
+        attachments = {x[0] for x in d.execute('SELECT entry_id FROM attachments')}
+        relations = d.execute('SELECT child, parent FROM relations').fetchall()
+    return created, bodies, tags, attachments, relations
+
+
+def _baseline(database: str, settings: dict):
+    """The filter as it worked before the bitmap index: each criterion narrows down the set of every entry, and the
+    result is sorted by date"""
+    created, bodies, tags, attachments, relations = _journal(database)
+    wanted = set(settings['tags']) | ({UNTAGGED} if settings['is_untagged'] else set())
+    mode = settings['tag_filter']
+    if mode == 0:
+        filtered = {i for i in created if tags[i] & wanted}
+    elif mode == 1:
+        filtered = {i for i in created if wanted and tags[i] >= wanted}
+    else:
+        filtered = {i for i in created if tags[i] == wanted}
+    if settings['has_attachments']:
+        filtered &= attachments
+    if settings['body']:
+        filtered = {i for i in filtered if settings['body'].lower() in bodies[i].lower()}
+    dates = settings['dates']
+    if dates:
+        if settings['date_filter'] == 0:
+            lower = datetime(dates['low year'], dates['low month'], dates['low day'], dates['low hour'],
+                             dates['low minute'])
+            upper = datetime(dates['high year'], dates['high month'], dates['high day'], dates['high hour'],
+                             dates['high minute'], 59, 999999)
+            filtered = {i for i in filtered if lower <= created[i] <= upper}
+        else:
+            def inside(date: datetime):
+                values = {'year': date.year, 'month': date.month, 'day': date.day, 'hour': date.hour,
+                          'minute': date.minute, 'weekday': int(date.strftime('%w'))}
+                return all(dates['low ' + k] <= v <= dates['high ' + k] for k, v in values.items())
+            filtered = {i for i in filtered if inside(created[i])}
+    if settings['has_children']:
+        filtered &= {parent for _, parent in relations}
+    if settings['has_parent']:
+        filtered &= {child for child, _ in relations}
+    return tuple(sorted(filtered, key=lambda i: (created[i], i)))
+
+
+def _random_settings(random: Random):
+    date_filter = random.randint(0, 1)
+    dates = None
+    if random.random() < 0.5:
+        years = sorted(random.sample(range(2018, 2022), 2))
+        dates = {'low year': years[0], 'high year': years[1]}
+        for part, low, high in [('month', 1, 12), ('day', 1, 28), ('hour', 0, 23), ('minute', 0, 59)]:
+            a, b = sorted(random.randint(low, high) for _ in range(2))
+            dates['low ' + part], dates['high ' + part] = a, b
+        if date_filter:
+            dates['low weekday'], dates['high weekday'] = sorted(random.randint(0, 6) for _ in range(2))
+    return dict(date_filter=date_filter, dates=dates, tag_filter=random.randint(0, 2),
+                tags=tuple(random.sample(TAGS, random.randint(0, 3))), is_untagged=random.random() < 0.3,
+                has_attachments=int(random.random() < 0.3), has_parent=int(random.random() < 0.2),
+                has_children=int(random.random() < 0.2), body=random.choice(('', '', 'dead', 'GARDEN', 'river q')))
+
+
+def _sql_ids(f: Filter, **kwargs):
+    with closing(connect(f.database_location)) as d:
+        return tuple(x[0] for x in d.execute(*f.compile(**kwargs)))
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_filter_matches_baseline(journal, seed):
+    settings = _random_settings(Random(seed))
+    f = Filter(journal)
+    f.update(**settings)
+    expected = _baseline(journal, settings)
+    assert f.filtered_ids == expected
+    assert f.count() == len(expected)
+
+
+@pytest.mark.parametrize('seed', range(40, 60))
+def test_sql_plan_matches_bitmap_plan(journal, seed):
+    f = Filter(journal)
+    f.update(**_random_settings(Random(seed)))
+    ids = f.filtered_ids
+    assert _sql_ids(f) == ids
+    if ids:
+        row = f.page(limit=len(ids) // 2 + 1)[-1]
+        assert _sql_ids(f, after=row, limit=10) == ids[len(ids) // 2 + 1:len(ids) // 2 + 11]
+
+
+def test_changing_one_criterion_gives_the_baseline_result(journal):
+    f = Filter(journal)
+    settings = _random_settings(Random(1))
+    f.update(**settings)
+    for name, value in [('tags', ('green',)), ('body', 'letter'), ('has_attachments', 0), ('tag_filter', 1),
+                        ('is_untagged', True), ('tags', 'all')]:
+        setattr(f, name, value)
+        settings = f.settings
+        assert f.filtered_ids == _baseline(journal, settings)
+
+
+def test_database_changes_are_picked_up(journal):
+    f = Filter(journal)
+    f.update(tags=('red',), body='unmistakable')
+    assert f.filtered_ids == ()
+    create_entry(journal, 'an unmistakable entry', ('red',), attachments=())
+    assert len(f.filtered_ids) == 1
+
+
+def test_sort_keeps_every_entry(journal):
+    f = Filter(journal)
+    f.update(tags=TAGS, is_untagged=True, sort=(('words', True),))
+    with closing(connect(journal)) as d:
+        words = dict(d.execute('SELECT entry_id, words FROM entry_metrics').fetchall())
+    ids = f.filtered_ids
+    assert sorted(ids) == sorted(words)
+    assert [words[i] for i in ids] == sorted(words.values(), reverse=True)
+
+
+def _count_reads(monkeypatch):
+    reads = []
+    counter = filter_module.get_change_counter
+
+    def get_change_counter(database):
+        reads.append(database)
+        return counter(database)
+
+    monkeypatch.setattr(filter_module, 'get_change_counter', get_change_counter)
+    return reads
+
+
+def test_pinned_reads_the_counter_once(journal, monkeypatch):
+    f = Filter(journal)
+    f.update(tags=('red', 'blue'), body=WORDS[0])
+    f.filtered_ids
+    reads = _count_reads(monkeypatch)
+    with f.pinned():
+        f.count()
+        f.total()
+        f.page()
+        f.seek(3)
+        f.position(f.filtered_ids[0])
+        with f.pinned():
+            f.count()
+    assert len(reads) == 1
+
+
+def test_batch_reads_the_counter_once(journal, monkeypatch):
+    f = Filter(journal)
+    reads = _count_reads(monkeypatch)
+    with f.batch():
+        f.tags = ('green',)
+        f.tag_filter = 2
+        f.body = 'storm'
+    assert len(reads) == 1
+    assert f.filtered_ids == _baseline(journal, f.settings)
+
+
+def test_pinned_filter_sees_a_newer_version_it_is_given(journal):
+    f = Filter(journal)
+    f.update(tags=('red',), body='unmistakable')
+    with f.pinned():
+        version = filter_module.get_change_counter(journal)
+    create_entry(journal, 'an unmistakable entry', ('red',), attachments=())
+    with f.pinned(version):
+        assert f.count() == 0
+    with f.pinned(filter_module.get_change_counter(journal)):
+        assert f.count() == 1
+
+
+def test_unknown_criteria_are_rejected(journal):
+    with pytest.raises(TypeError):
+        Filter(journal).update(colour='red')
+    with pytest.raises(KeyError):
+        Filter(journal).sort = (('colour', False),)
+
+
+def _walk(f: Filter, limit: int):
+    """Pages through the filtered entries forwards and then backwards, using the last row of each page as the cursor"""
+    forwards, page = [], f.page(limit=limit)
+    while page:
+        forwards += page
+        page = f.page(after=page[-1], limit=limit)
+    backwards, page = [], f.page(before=forwards[-1], limit=limit) if forwards else ()
+    while page:
+        backwards = list(page) + backwards
+        page = f.page(before=page[0], limit=limit)
+    return forwards, backwards + forwards[-1:]
+
+
+@pytest.mark.parametrize('sort', [(), (('words', True),), (('tags', False), ('attachments', True)), (('thread', True),)])
+@pytest.mark.parametrize('limit', [1, 7, 100, 1000])
+def test_pages_round_trip(journal, sort, limit):
+    f = Filter(journal)
+    f.update(tags=('red', 'green'), is_untagged=True, sort=sort)
+    ids = f.filtered_ids
+    forwards, backwards = _walk(f, limit)
+    assert [x[1] for x in forwards] == list(ids)
+    assert [x[1] for x in backwards] == list(ids)
+    assert f.page(after=forwards[3], before=forwards[9], limit=limit) == tuple(forwards[4:min(9, 4 + limit)])
+
+
+@pytest.mark.parametrize('sort', [(), (('avg_word_len', False),)])
+def test_seek_and_position_match_the_ids(journal, sort):
+    f = Filter(journal)
+    f.update(tags=('blue', 'two words'), sort=sort)
+    ids = f.filtered_ids
+    for position in (0, 1, len(ids) // 2, len(ids) - 1):
+        assert [x[1] for x in f.seek(position, 20)] == list(ids[position:position + 20])
+        assert f.position(ids[position]) == position
+    assert f.seek(len(ids)) == ()
+    assert f.position(next(i for i in range(1, 500) if i not in ids)) is None
+
+
+def test_page_cursor_survives_a_filter_change(journal):
+    f = Filter(journal)
+    f.update(tags=TAGS, is_untagged=True)
+    row = f.page(limit=50)[-1]
+    f.update(tags=('red',), is_untagged=False)
+    # The cursor entry may have been filtered out, but the page still starts after it in date order
+    created = _journal(journal)[0]
+    expected = [i for i in f.filtered_ids if (created[i], i) > row][:5]
+    assert [x[1] for x in f.page(after=row, limit=5)] == expected
+
+
+def test_last_access_order_follows_the_session_store(journal):
+    f = Filter(journal)
+    f.update(tags=('red',), sort=(('last_access', True),))
+    ids = f.filtered_ids
+    version = filter_module.get_change_counter(journal)
+    get_session().record_access(journal, ids[-1])
+    # Opening an entry changes the order without counting as a change to the journal
+    assert f.filtered_ids[0] == ids[-1]
+    assert sorted(f.filtered_ids) == sorted(ids)
+    assert filter_module.get_change_counter(journal) == version
+
+
+def test_a_restored_backup_is_not_served_from_a_newer_index(journal):
+    copyfile(journal, journal + '.backup')
+    f = Filter(journal)
+    f.update(tags=('red',), body='unmistakable')
+    create_entry(journal, 'an unmistakable entry', ('red',), attachments=())
+    assert f.count() == 1
+    copyfile(journal + '.backup', journal)
+    with f.pinned():
+        assert f.count() == 0
+        assert f.page() == ()
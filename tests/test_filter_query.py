@@ -0,0 +1,161 @@
+from datetime import datetime
+from random import Random
+
+import pytest
+
+from conftest import TAGS, UNTAGGED
+from filter import Filter
+import filter_query
+from filter_query import parse, optimize, query_ids, explain, Term, And, Or, Not
+from test_filter import _journal
+from writer import create_entry
+
+_NAMES = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('tag:work', 'tag:work'),
+    ('tag:"a, b"', 'tag:"a, b"'),
+    ('tag:a,b body:"x y"', 'tag:a,b AND body:"x y"'),
+    ('deadline OR "a \\"quoted\\" word"', 'body:"deadline" OR body:"a \\"quoted\\" word"'),
+    ('NOT (has:attachments OR is:untagged)', 'NOT (has:attachments OR is:untagged)'),
+    ('has:tags', 'NOT is:untagged'),
+    ('created:2020', 'created:2020-01-01T00:00:00..2020-12-31T23:59:59.999999'),
+    ('created:2020-02..', 'created:2020-02-01T00:00:00..'),
+    ('created:..2020-02-10T08:30', 'created:..2020-02-10T08:30:59.999999'),
+    ('month:jan..mar,dec', 'month:1..3,12..12'),
+    ('hour:22..2', 'hour:22..23,0..2'),
+    ('weekday:fri..mon', 'weekday:5..6,0..1'),
+])
+def test_parse(text, expected):
+    assert str(parse(text)) == expected
+    # The printed form of a query parses back to the same query
+    assert str(parse(str(parse(text)))) == expected
+
+
+@pytest.mark.parametrize('text', ['', '   ', 'tag:', 'colour:red', 'has:wings', 'is:tagged', 'month:13', 'hour:x',
+                                  'year:2020..2019', 'created:2021..2020', 'created:2020-13', '(tag:a', 'tag:a)',
+                                  'tag:a AND', 'OR tag:a', 'NOT', 'body:"unterminated'])
+def test_invalid_queries_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+def test_optimize_flattens_and_drops_double_negatives(journal):
+    node = optimize(parse('(tag:red AND (tag:blue AND NOT NOT has:parent)) AND storm'), journal)
+    assert isinstance(node, And)
+    assert len(node.operands) == 4
+    assert all(isinstance(x, Term) for x in node.operands)
+    # The body search is the most costly, so it is run last
+    assert node.operands[-1].field == 'body'
+
+
+def _matches(node, entry_id: int, data):
+    """Evaluates a query against one entry in plain Python"""
+    created, bodies, tags, attachments, relations = data
+    if isinstance(node, And):
+        return all(_matches(x, entry_id, data) for x in node.operands)
+    if isinstance(node, Or):
+        return any(_matches(x, entry_id, data) for x in node.operands)
+    if isinstance(node, Not):
+        return not _matches(node.operand, entry_id, data)
+    date = created[entry_id]
+    if node.field == 'tag':
+        return bool(tags[entry_id] & set(node.value))
+    if node.field == 'is':
+        return UNTAGGED in tags[entry_id]
+    if node.field == 'has':
+        return entry_id in {'attachments': attachments, 'parent': {c for c, _ in relations},
+                            'children': {p for _, p in relations}}[node.value]
+    if node.field == 'body':
+        return node.value.lower() in bodies[entry_id].lower()
+    if node.field == 'created':
+        return (node.value[0] or datetime.min) <= date <= (node.value[1] or datetime.max)
+    value = int(date.strftime('%w')) if node.field == 'weekday' else getattr(date, node.field)
+    return any(low <= value <= high for low, high in node.value)
+
+
+def _random_term(random: Random):
+    kind = random.choice(('tag', 'body', 'has', 'is', 'created', 'year', 'month', 'hour', 'weekday'))
+    if kind == 'tag':
+        return 'tag:' + ','.join('"{}"'.format(x) if ' ' in x or ',' in x else x
+                                 for x in random.sample(TAGS, random.randint(1, 2)))
+    if kind == 'body':
+        return random.choice(('storm', 'body:"river q"', 'GARDEN', 'letter'))
+    if kind == 'has':
+        return 'has:' + random.choice(('attachments', 'parent', 'children', 'tags'))
+    if kind == 'is':
+        return 'is:untagged'
+    if kind == 'created':
+        a, b = sorted((random.randint(2018, 2021), random.randint(1, 12)) for _ in range(2))
+        return 'created:{}-{:02d}..{}-{:02d}'.format(*a, *b)
+    if kind == 'year':
+        return 'year:{}'.format(random.randint(2018, 2021))
+    if kind == 'month':
+        return 'month:{}..{}'.format(random.choice(_NAMES), random.randint(1, 12))
+    if kind == 'hour':
+        return 'hour:{}..{}'.format(random.randint(0, 23), random.randint(0, 23))
+    return 'weekday:{},{}'.format(random.randint(0, 6), random.choice(('sat', 'sun')))
+
+
+def _random_query(random: Random, depth: int = 0):
+    if depth > 2 or random.random() < 0.35:
+        term = _random_term(random)
+        return 'NOT ' + term if random.random() < 0.2 else term
+    operator = random.choice((' AND ', ' OR ', ' '))
+    query = operator.join(_random_query(random, depth + 1) for _ in range(random.randint(2, 3)))
+    return 'NOT ({})'.format(query) if random.random() < 0.2 else '({})'.format(query)
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_plans_agree(journal, seed):
+    text = _random_query(Random(seed))
+    data = _journal(journal)
+    node = parse(text)
+    expected = tuple(sorted((i for i in data[0] if _matches(node, i, data)), key=lambda i: (data[0][i], i)))
+    assert query_ids(text, journal, plan='bitmap') == expected, text
+    assert query_ids(text, journal, plan='sql') == expected, text
+
+
+def test_filter_query_combines_with_the_other_criteria(journal):
+    f = Filter(journal)
+    f.update(tags=('red',), query='NOT storm OR has:attachments')
+    expected = set(query_ids('tag:red AND (NOT storm OR has:attachments)', journal))
+    assert set(f.filtered_ids) == expected
+    with pytest.raises(ValueError):
+        f.query = 'tag:red AND'
+    assert f.query == 'NOT storm OR has:attachments'
+
+
+def test_unknown_plans_are_rejected(journal):
+    with pytest.raises(ValueError):
+        query_ids('tag:red', journal, plan='fastest')
+
+
+def test_explain_shows_the_optimized_query(journal):
+    text = explain('storm AND tag:red', journal)
+    assert text.startswith('Optimized: tag:red AND body:"storm"')
+    assert 'Query plan:' in text
+
+
+def test_term_bitmaps_are_built_once_per_index(journal, monkeypatch):
+    built = []
+    term_bits = filter_query._term_bits
+
+    def counted(term, index, database):
+        built.append(str(term))
+        return term_bits(term, index, database)
+
+    monkeypatch.setattr(filter_query, '_term_bits', counted)
+    text = 'tag:red AND NOT has:attachments AND (month:1..6 OR storm)'
+    first = query_ids(text, journal)
+    assert query_ids(text, journal) == first
+    assert sorted(built) == sorted(['tag:red', 'has:attachments', 'month:1..6', 'body:"storm"', 'body:"storm"'])
+    f = Filter(journal)
+    f.update(tags=TAGS, is_untagged=True, query=text)
+    assert f.filtered_ids == first
+    # A new version of the database gets new bitmaps
+    create_entry(journal, 'storm', ('red',), attachments=())
+    built.clear()
+    query_ids(text, journal)
+    assert 'tag:red' in built
@@ -0,0 +1,26 @@
+import sys
+from os.path import dirname, abspath
+from subprocess import run
+
+from lazy_imports import lazy_import
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+
+def test_modules_are_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / 'heavy_module.py').write_text('VALUE = 42\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'heavy_module', raising=False)
+    module = lazy_import('heavy_module')
+    assert not module.loaded
+    assert module.VALUE == 42
+    assert module.loaded
+    assert 'loaded' in repr(module)
+
+
+def test_the_application_starts_without_the_heavy_modules():
+    code = 'import sys, application\n' \
+           'print(",".join(m for m in ("PIL", "matplotlib", "networkx", "dateutil") if m in sys.modules))'
+    result = run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
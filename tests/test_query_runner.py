@@ -0,0 +1,71 @@
+from contextlib import closing
+from sqlite3 import connect
+from threading import Timer
+from time import monotonic
+
+import pytest
+
+from query_runner import CancelToken, Cancelled, execute, current_token
+
+# A query that runs for far longer than any test, unless it is stopped
+ENDLESS = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT SUM(i) FROM n'
+ROWS = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1200) SELECT i FROM n'
+
+
+@pytest.fixture
+def connection():
+    with closing(connect(':memory:')) as c:
+        yield c
+
+
+def test_a_cancelled_token_stops_the_query_it_is_in(connection):
+    token = CancelToken()
+    Timer(0.05, token.cancel).start()
+    start = monotonic()
+    with pytest.raises(Cancelled, match='Cancelled'):
+        execute(connection, ENDLESS, token=token)
+    assert monotonic() - start < 5
+    # The connection is left as it was
+    assert connection.execute('SELECT 1').fetchone() == (1,)
+
+
+def test_a_spent_budget_stops_the_query(connection):
+    with pytest.raises(Cancelled, match='Time budget spent'):
+        execute(connection, ENDLESS, token=CancelToken(budget=0.05))
+
+
+def test_a_stopped_token_runs_nothing(connection):
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(Cancelled):
+        execute(connection, 'SELECT 1', token=token)
+
+
+def test_rows_are_reported_as_they_are_fetched(connection):
+    partial = []
+    token = CancelToken(on_partial=partial.append)
+    rows = execute(connection, ROWS, token=token)
+    assert [x[0] for x in rows] == list(range(1, 1201))
+    assert partial == [500, 1000, 1200]
+    batches = []
+    execute(connection, ROWS, token=token, on_rows=batches.append)
+    assert [len(x) for x in batches] == [500, 500, 200]
+
+
+def test_the_active_token_is_found_by_the_queries_of_its_thread(connection):
+    outer, inner = CancelToken(), CancelToken()
+    assert current_token() is None
+    with outer.active():
+        with inner.active():
+            assert current_token() is inner
+            inner.cancel()
+            with pytest.raises(Cancelled):
+                execute(connection, 'SELECT 1')
+        assert current_token() is outer
+        assert execute(connection, 'SELECT 1') == [(1,)]
+    assert current_token() is None
+
+
+def test_other_errors_are_raised_as_they_are(connection):
+    with pytest.raises(Exception, match='no such table'):
+        execute(connection, 'SELECT * FROM missing', token=CancelToken())
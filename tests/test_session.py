@@ -0,0 +1,111 @@
+from datetime import datetime
+from os import makedirs
+from os.path import exists, join
+
+import session
+from session import SessionStore, last_accessed, access_version
+
+READER = {'database': 'jurnl.sqlite', 'id': 4, 'date_filter': 1, 'tag_filter': 2, 'tags_sort': 0,
+          'sort': (('words', True),), 'has_attachments': 1, 'has_parent': 0, 'has_children': 0, 'tags': ('a', 'b c'),
+          'body': 'text', 'query': 'tag:a', 'dates': {'low year': 2019, 'high year': 2021}}
+WRITER = {'database': 'jurnl.sqlite', 'id': None, 'body': 'draft', 'date': datetime(2020, 5, 6, 7, 8, 9, 10),
+          'tags': ('x',), 'attachments': (), 'parent': 2}
+
+
+def test_fields_round_trip(workdir):
+    store = SessionStore('session.sqlite')
+    reader = store.add_tab('Reader', READER)
+    writer = store.add_tab('Writer', WRITER)
+    assert store.load(reader) == READER
+    assert store.load(writer) == WRITER
+    assert store.save(writer, {'body': 'edited', 'unknown': 1})
+    assert store.load(writer) == dict(WRITER, body='edited')
+    assert store.load('Writer/999') is None
+
+
+def test_tabs_take_the_lowest_free_number(workdir):
+    store = SessionStore('session.sqlite')
+    keys = [store.add_tab('Reader', {}) for _ in range(3)] + [store.add_tab('Writer', {})]
+    assert keys == ['Reader/000', 'Reader/001', 'Reader/002', 'Writer/000']
+    store.remove_tab('Reader/001')
+    assert store.add_tab('Reader', {}) == 'Reader/001'
+    # New tabs are always shown last
+    assert store.tabs() == ['Reader/000', 'Reader/002', 'Writer/000', 'Reader/001']
+    assert store.tab_type('Writer/000') == 'Writer'
+    assert store.tab_type('Writer/001') is None
+
+
+def test_closing_the_current_tab_clears_it(workdir):
+    store = SessionStore('session.sqlite')
+    key = store.add_tab('Writer', WRITER)
+    store.current = key
+    assert store.current == key
+    store.remove_tab(key)
+    assert store.current == ''
+    assert not store.has_tab(key)
+    assert not store.save(key, WRITER)
+
+
+def test_the_store_is_kept_between_runs(workdir):
+    store = SessionStore('session.sqlite')
+    key = store.add_tab('Reader', READER)
+    store.current = key
+    store.close()
+    store = SessionStore('session.sqlite')
+    assert store.tabs() == [key]
+    assert store.current == key
+
+
+def _write_legacy(path: str, text: str):
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def test_legacy_tempfiles_are_imported(workdir):
+    for type_ in ('Reader', 'Writer'):
+        makedirs(join('.tempfiles', type_))
+    writer = join('.tempfiles', 'Writer', 'abc')
+    reader = join('.tempfiles', 'Reader', 'def')
+    broken = join('.tempfiles', 'Reader', 'ghi')
+    _write_legacy(writer, '[Databases]\ncurrent = jurnl.sqlite\n[Attributes]\nid = None\nbody = draft %% 1\n'
+                          'date = 2020-05-06 07:08:09.000010\ntags = (\'x\',)\nattachments = ()\nparent = 2\n')
+    _write_legacy(reader, '[Databases]\ncurrent = jurnl.sqlite\n[Attributes]\nid = 4\n[Settings]\ndate filter = 1\n'
+                          'tag filter = 2\ntags sort = 0\n[Flags]\nhas attachments = 1\nhas parent = 0\n'
+                          'has children = 0\n[Strings]\ntags = (\'a\', \'b c\')\nbody = text\n[Dates]\n'
+                          'low year = 2019\nhigh year = 2021\n')
+    _write_legacy(broken, '[Databases]\ncurrent = jurnl.sqlite\n[Attributes]\nid = (\n')
+    _write_legacy('settings.config', '[Notebook]\npages = [{!r}, {!r}]\ncurrent = {}\n'.format(writer, reader, reader))
+    store = SessionStore(session.SESSION_DATABASE)
+    assert store.tabs() == ['Writer/000', 'Reader/000']
+    assert store.current == 'Reader/000'
+    assert store.load('Writer/000') == dict(WRITER, body='draft %% 1')
+    assert store.load('Reader/000') == dict(READER, sort=(), query='')
+    assert store.skipped == [broken]
+    assert not exists(writer) and not exists(reader) and exists(broken)
+
+
+def test_last_access_times(workdir):
+    store = SessionStore(session.SESSION_DATABASE)
+    version = access_version()
+    assert last_accessed('jurnl.sqlite') == {}
+    store.record_access('jurnl.sqlite', 3)
+    store.record_access(join(str(workdir), 'jurnl.sqlite'), 5)
+    store.record_access('other.sqlite', 3)
+    assert access_version() == version + 3
+    accessed = last_accessed('jurnl.sqlite')
+    assert set(accessed) == {3, 5}
+    assert accessed[3] <= accessed[5] <= datetime.now()
+    assert last_accessed('missing.sqlite', 'missing/session.sqlite') == {}
+
+
+def test_generations_are_saved_with_the_fields(workdir):
+    store = SessionStore('session.sqlite')
+    key = store.add_tab('Writer', WRITER)
+    assert store.generation(key) == 0
+    store.save(key, {'body': 'one'}, 3)
+    store.save(key, {'body': 'two'})
+    assert store.generation(key) == 3
+    store.remove_tab(key)
+    # A new tab that takes the same number starts again
+    assert store.add_tab('Writer', WRITER) == key
+    assert store.generation(key) == 0
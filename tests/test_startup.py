@@ -0,0 +1,76 @@
+import pytest
+
+from startup import StartupPipeline, STAGES
+from conftest import FakeMaster, FakePool
+
+
+class Pipeline(StartupPipeline):
+    def __init__(self):
+        self.master, self.pool = FakeMaster(), FakePool()
+        super(Pipeline, self).__init__(self.master, self.pool)
+
+    def run_everything(self):
+        while self.master.timers or self.pool.requests:
+            self.master.run()
+            self.pool.run()
+
+
+@pytest.fixture
+def pipeline():
+    return Pipeline()
+
+
+def test_stages_wait_for_the_stages_they_depend_on(pipeline):
+    order = []
+    pipeline.run('window', order.append, 'window', after=('upgrade',))
+    pipeline.run_in_background('backup', order.append, 'backup', after=('upgrade',))
+    pipeline.run_in_background('import', order.append, 'import', after=('backup',))
+    pipeline.run('refresh', order.append, 'refresh', after=('window', 'import'))
+    pipeline.run_everything()
+    assert order == []
+    pipeline.begin('upgrade')
+    pipeline.finish('upgrade')
+    pipeline.run_everything()
+    assert order.index('refresh') == 3
+    assert order.index('backup') < order.index('import')
+    assert pipeline.ready(*STAGES)
+    assert set(pipeline.timings) == set(STAGES)
+
+
+def test_a_failed_stage_does_not_hold_up_the_rest(pipeline):
+    messages = []
+    pipeline.add_progress_listener(messages.append)
+    results = []
+
+    def fail():
+        raise OSError('disk full')
+
+    pipeline.skip('upgrade')
+    pipeline.skip('window')
+    pipeline.run_in_background('backup', fail)
+    pipeline.run_in_background('import', lambda: 3, after=('backup',), callback=results.append)
+    pipeline.run('refresh', lambda: None, after=('import',))
+    pipeline.run_everything()
+    assert results == [3]
+    assert isinstance(pipeline.errors['backup'], OSError)
+    assert pipeline.ready(*STAGES)
+    assert 'Backing up databases...' in messages
+    assert messages[-1] == 'Backing up databases failed: disk full'
+
+
+def test_when_ready_calls_straight_away_once_ready(pipeline):
+    called = []
+    pipeline.skip('upgrade')
+    pipeline.when_ready('upgrade', callback=lambda: called.append(1))
+    assert called == [1]
+
+
+def test_listeners_are_told_of_stages_that_began_before_them(pipeline):
+    pipeline.begin('upgrade')
+    messages = []
+    pipeline.add_progress_listener(messages.append)
+    assert messages == ['Upgrading databases...']
+    pipeline.finish('upgrade')
+    assert messages == ['Upgrading databases...']
+    pipeline.begin('window')
+    assert messages[-1] == 'Opening pages...'
@@ -0,0 +1,165 @@
+from json import loads
+from os import remove
+from os.path import exists
+from random import Random
+
+import pytest
+
+import tempfiles
+from conftest import FakeMaster
+from session import get_session
+from tempfiles import WriterFileManager, coalesce_writes, flush_tempfiles, _log_entry
+
+
+def _log_lines(manager: WriterFileManager):
+    if not exists(manager._log_path):
+        return []
+    with open(manager._log_path) as file:
+        return [loads(x) for x in file]
+
+
+def test_changes_are_written_straight_away_without_a_scheduler(workdir):
+    writer = WriterFileManager()
+    writer.body = 'hello'
+    writer.tags = ('a', 'b')
+    assert get_session().load(writer.path)['body'] == 'hello'
+    assert WriterFileManager(writer.path).tags == ('a', 'b')
+    assert not exists(writer._log_path)
+
+
+def test_changes_are_logged_and_written_on_flush(workdir):
+    master = FakeMaster()
+    coalesce_writes(master, 500)
+    writer = WriterFileManager()
+    writer.body = 'hello'
+    writer.parent = 3
+    writer.body = 'hello there'
+    assert [x[:3] for x in _log_lines(writer)] == [[1, 'set', 'body'], [1, 'set', 'parent'], [1, 'set', 'body']]
+    assert get_session().load(writer.path)['body'] == ''
+    # Only one flush is scheduled however many changes are made
+    assert len(master.timers) == 1
+    master.run()
+    assert get_session().load(writer.path)['body'] == 'hello there'
+    assert get_session().load(writer.path)['parent'] == 3
+    assert not exists(writer._log_path)
+
+
+def test_flush_tempfiles_writes_without_waiting(workdir):
+    master = FakeMaster()
+    coalesce_writes(master)
+    writer = WriterFileManager()
+    writer.body = 'closing'
+    flush_tempfiles()
+    assert get_session().load(writer.path)['body'] == 'closing'
+    assert not master.timers
+
+
+def test_batch_logs_once(workdir):
+    coalesce_writes(FakeMaster())
+    writer = WriterFileManager()
+    with writer.batch():
+        writer.body = 'a'
+        writer.body = 'ab'
+        writer.tags = ('x',)
+    assert [x[2] for x in _log_lines(writer)] == ['body', 'tags']
+
+
+def test_log_is_recovered_after_a_crash(workdir):
+    coalesce_writes(FakeMaster())
+    writer = WriterFileManager()
+    long = 'word ' * 40
+    writer.body = long
+    writer.body = long + 'more'
+    writer.tags = ('kept',)
+    assert _log_lines(writer)[1][1] == 'splice'
+    # The application stops before the flush, leaving the log behind, and the tab is opened again on the next start
+    tempfiles._scheduler = None
+    recovered = WriterFileManager(writer.path)
+    assert recovered.body == long + 'more'
+    assert recovered.tags == ('kept',)
+    assert get_session().load(writer.path)['body'] == long + 'more'
+    assert not exists(writer._log_path)
+
+
+def test_a_line_cut_short_is_ignored(workdir):
+    coalesce_writes(FakeMaster())
+    writer = WriterFileManager()
+    writer.body = 'saved'
+    writer.tags = ('lost',)
+    with open(writer._log_path) as file:
+        text = file.read()
+    with open(writer._log_path, 'w') as file:
+        file.write(text[:-5])
+    tempfiles._scheduler = None
+    recovered = WriterFileManager(writer.path)
+    assert recovered.body == 'saved'
+    assert recovered.tags == ()
+
+
+def test_closed_tabs_drop_their_log(workdir):
+    master = FakeMaster()
+    coalesce_writes(master)
+    writer = WriterFileManager()
+    writer.body = 'unsaved'
+    get_session().remove_tab(writer.path)
+    master.run()
+    assert not exists(writer._log_path)
+    assert not get_session().has_tab(writer.path)
+
+
+def test_a_log_left_behind_after_its_flush_is_not_applied_again(workdir, monkeypatch):
+    master = FakeMaster()
+    coalesce_writes(master)
+    writer = WriterFileManager()
+    long = 'word ' * 40
+    writer.body = long
+    master.run()
+    # Splices applied to the value they produced can garble it, e.g. the first of these would cut the second short
+    writer.body = long + 'end'
+    writer.body = 'start ' + long + 'end'
+    assert [x[1] for x in _log_lines(writer)] == ['splice', 'splice']
+    # The application stops after the row is written but before the log is removed
+    monkeypatch.setattr(tempfiles, 'remove', lambda path: None)
+    flush_tempfiles()
+    monkeypatch.setattr(tempfiles, 'remove', remove)
+    assert exists(writer._log_path)
+    tempfiles._scheduler = None
+    recovered = WriterFileManager(writer.path)
+    assert recovered.body == 'start ' + long + 'end'
+    assert get_session().load(writer.path)['body'] == 'start ' + long + 'end'
+    assert not exists(writer._log_path)
+
+
+def test_changes_logged_after_a_flush_are_recovered(workdir):
+    master = FakeMaster()
+    coalesce_writes(master)
+    writer = WriterFileManager()
+    long = 'word ' * 40
+    writer.body = long
+    master.run()
+    writer.body = long + 'more'
+    writer.body = long + 'more and more'
+    tempfiles._scheduler = None
+    recovered = WriterFileManager(writer.path)
+    assert recovered.body == long + 'more and more'
+    # The recovered row is written as the next flush, so a log left behind by it would be skipped in turn
+    assert get_session().generation(writer.path) == 2
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_splices_reproduce_the_new_value(seed):
+    random = Random(seed)
+    old = ''.join(random.choice('abc ') for _ in range(random.randint(64, 200)))
+    start = random.randint(0, len(old))
+    end = random.randint(start, len(old))
+    inserted = ''.join(random.choice('abcd') for _ in range(random.randint(0, 10)))
+    new = old[:start] + inserted + old[end:]
+    kind, field, prefix, suffix, text = _log_entry('body', old, new)
+    assert kind == 'splice'
+    assert old[:prefix] + text + old[len(old) - suffix:] == new
+    assert len(text) <= len(inserted)
+
+
+def test_short_values_are_logged_in_full():
+    assert _log_entry('body', 'short', 'shorter') == ['set', 'body', 'shorter']
+    assert _log_entry('tags', None, '["a"]') == ['set', 'tags', '["a"]']
@@ -0,0 +1,57 @@
+from json import dump
+from os import makedirs, utime
+from os.path import join
+
+import pytest
+
+from themes import IconRegistry
+
+NAMES = ['ic_close', 'ic_save']
+
+
+def _cache(base: str, names, mtime: float):
+    """Writes the index of a sprite sheet and stands in a file for the sheet itself"""
+    with open(base + '.json', 'w') as file:
+        dump({name: i for i, name in enumerate(names)}, file)
+    with open(base + '.png', 'wb') as file:
+        file.write(b'')
+    utime(base + '.png', (mtime, mtime))
+
+
+def test_a_sheet_is_reused_while_it_is_up_to_date(tmp_path):
+    base = str(tmp_path / 'dark-green-16')
+    assert IconRegistry._read_index(base, NAMES, 100) is None
+    _cache(base, NAMES, 200)
+    assert IconRegistry._read_index(base, NAMES, 100) == {'ic_close': 0, 'ic_save': 1}
+    # A PNG changed since the sheet was built, or one added or removed, means the sheet is built again
+    assert IconRegistry._read_index(base, NAMES, 300) is None
+    assert IconRegistry._read_index(base, NAMES + ['ic_new'], 100) is None
+
+
+def test_icons_are_loaded_once_per_theme_and_size(tk_root, tmp_path):
+    from tkinter import PhotoImage
+
+    source = tmp_path / 'dark' / 'green'
+    makedirs(str(source))
+    for name in NAMES:
+        PhotoImage(master=tk_root, width=4, height=4).write(str(source / (name + '.png')), format='png')
+    registry = IconRegistry(str(tmp_path), str(tmp_path / 'cache'))
+    registry._colors = ('dark', 'green')
+    makedirs(str(tmp_path / 'cache'))
+    for size in (16, 24):
+        # Sheets already in the cache are read without PIL
+        sheet = PhotoImage(master=tk_root, width=size * len(NAMES), height=size)
+        base = join(str(tmp_path / 'cache'), 'dark-green-{}'.format(size))
+        sheet.write(base + '.png', format='png')
+        with open(base + '.json', 'w') as file:
+            dump({name: i for i, name in enumerate(NAMES)}, file)
+    icon = registry.get('ic_save')
+    assert registry.get('ic_save') is icon
+    assert (icon.width(), icon.height()) == (16, 16)
+    assert registry.get('ic_save', 24) is not icon
+    assert registry.get('ic_save', 24).width() == 24
+    with pytest.raises(FileNotFoundError):
+        registry.get('ic_missing')
+    registry.invalidate()
+    registry._colors = ('dark', 'green')
+    assert registry.get('ic_save') is not icon
@@ -0,0 +1,97 @@
+from os.path import exists
+
+import pytest
+
+import filter as filter_module
+from conftest import FakeMaster, FakePool
+from database_info import get_change_counter
+from event_bus import reader_bus
+from modules import ReaderModule
+from warm_start import save_state, restore_state, warm_start, discard_state, state_file, TOPICS
+from writer import create_entry
+
+
+class Page:
+    """The parts of a Reader page the warm start works with: its reader, its bus, and what its frames were shown"""
+
+    def __init__(self, path: str = None):
+        self.master, self.pool = FakeMaster(), FakePool()
+        self.reader = ReaderModule(path, lazy=True)
+        self.bus = reader_bus(self.master, self.reader, 'Reader0', self.pool)
+        self.shown = {t: [] for t in TOPICS}
+        for topic in TOPICS:
+            self.bus.subscribe(topic, self.shown[topic].append)
+
+    def load(self):
+        while self.master.timers or self.pool.requests:
+            self.master.run()
+            self.pool.run()
+
+
+@pytest.fixture
+def saved(journal):
+    """The key of a Reader tab whose state was saved when the application closed"""
+    page = Page()
+    page.reader.update(body='garden', sort=(('words', True),))
+    page.reader.id_ = page.reader.filter.filtered_ids[3]
+    page.load()
+    assert save_state(page.bus, page.reader)
+    return page.reader.path
+
+
+def _count_runs(monkeypatch):
+    runs = []
+    run = filter_module.Filter._run
+
+    def counted(self):
+        runs.append(self)
+        run(self)
+
+    monkeypatch.setattr(filter_module.Filter, '_run', counted)
+    return runs
+
+
+def test_a_restored_page_with_an_unchanged_counter_never_loads_its_filter(saved, monkeypatch):
+    page = Page(saved)
+    runs = _count_runs(monkeypatch)
+    assert warm_start(page.bus, page.reader)
+    page.load()
+    snapshot = page.shown['ids'][-1]
+    assert snapshot.position == 3
+    assert snapshot.rows[snapshot.position - snapshot.first][1] == page.reader.id_
+    # The readers are refreshed at startup and after a save, and the page still shows the database as it is
+    assert page.bus.current(TOPICS, get_change_counter(page.reader.database))
+    assert runs == []
+    assert not page.pool.cancelled
+
+
+def test_a_restored_page_is_loaded_again_after_a_change(saved, journal):
+    create_entry(journal, 'a new garden', ('red',), attachments=())
+    page = Page(saved)
+    assert warm_start(page.bus, page.reader)
+    # The saved state is shown until the page has loaded again
+    assert page.shown['ids'][-1].version != get_change_counter(journal)
+    page.load()
+    snapshot = page.shown['ids'][-1]
+    assert snapshot.version == get_change_counter(journal)
+    assert snapshot.count == page.reader.filter.count()
+    assert page.bus.current(TOPICS, get_change_counter(journal))
+
+
+def test_state_saved_for_other_settings_is_not_restored(saved):
+    page = Page(saved)
+    page.reader.update(body='storm')
+    assert restore_state(page.reader) is None
+    assert not warm_start(page.bus, page.reader)
+
+
+def test_a_page_that_has_not_loaded_is_not_saved(journal):
+    page = Page()
+    assert not save_state(page.bus, page.reader)
+    assert not exists(state_file(page.reader.path))
+
+
+def test_closed_pages_drop_their_state(saved):
+    discard_state(saved)
+    assert not exists(state_file(saved))
+    assert restore_state(ReaderModule(saved, lazy=True)) is None
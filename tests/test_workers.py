@@ -0,0 +1,81 @@
+from threading import Event
+
+from conftest import FakeMaster
+from workers import WorkerPool
+
+
+def _pool():
+    master = FakeMaster()
+    return master, WorkerPool(master, interval=1)
+
+
+def test_results_are_delivered_on_the_polling_thread():
+    master, pool = _pool()
+    results = []
+    pool.submit('a', sum, (1, 2), callback=results.append)
+    pool.submit('b', max, (4, 5), callback=results.append)
+    master.run()
+    assert sorted(results) == [3, 5]
+    assert not pool.busy('a') and not pool.busy('b')
+
+
+def test_a_newer_request_supersedes_an_older_one():
+    master, pool = _pool()
+    results = []
+    started = Event()
+    release = Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'old'
+
+    pool.submit('key', slow, callback=results.append)
+    started.wait(5)
+    pool.submit('key', lambda: 'new', callback=results.append)
+    release.set()
+    master.run()
+    assert results == ['new']
+
+
+def test_failures_do_not_stop_the_results_behind_them():
+    master, pool = _pool()
+    results = []
+
+    def broken_callback(result):
+        raise RuntimeError('callback')
+
+    def fail():
+        raise ValueError('request')
+
+    pool.submit('a', fail)
+    pool.submit('b', lambda: 1, callback=broken_callback)
+    pool.submit('c', lambda: 2, callback=results.append)
+    master.run()
+    assert results == [2]
+    assert sorted(type(x).__name__ for x in master.errors) == ['RuntimeError', 'ValueError']
+    # The pool still delivers requests made after the failures
+    pool.submit('d', lambda: 3, callback=results.append)
+    master.run()
+    assert results == [2, 3]
+
+
+def test_errbacks_are_given_the_error():
+    master, pool = _pool()
+    errors = []
+    pool.submit('a', int, 'x', errback=errors.append)
+    master.run()
+    assert isinstance(errors[0], ValueError)
+    assert master.errors == []
+
+
+def test_busy_listeners():
+    master, pool = _pool()
+    states = []
+    pool.add_busy_listener('a', states.append)
+    pool.submit('a', lambda: None)
+    master.run()
+    pool.submit('a', lambda: None)
+    pool.cancel('a')
+    master.run()
+    assert states == [True, False, True, False]
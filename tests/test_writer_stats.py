@@ -0,0 +1,27 @@
+from random import Random
+
+import pytest
+
+from writer_stats import count_words
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_edits_are_counted_like_the_whole_body(seed):
+    random = Random(seed)
+    body, words = '', 0
+    for _ in range(40):
+        start = random.randint(0, len(body))
+        end = random.randint(start, min(len(body), start + random.choice((0, 1, 5, 40))))
+        inserted = ''.join(random.choice('ab \n') for _ in range(random.choice((0, 1, 1, 3, 20))))
+        new = body[:start] + inserted + body[end:]
+        words = count_words(body, new, words)
+        assert words == len(new.split())
+        body = new
+
+
+def test_typing_at_a_word_boundary():
+    assert count_words('one two', 'one two ', 2) == 2
+    assert count_words('one two ', 'one two t', 2) == 3
+    assert count_words('one two', 'one  two', 2) == 2
+    assert count_words('one two', 'onetwo', 2) == 1
+    assert count_words('', '', 0) == 0
@@ -1,9 +1,15 @@
-from os.path import join, exists, abspath
+from json import load, dump
+from os import scandir, makedirs, replace
+from os.path import join, exists, splitext, getmtime
+from tkinter import PhotoImage
 from tkinter.ttk import Style
-
-from PIL import ImageTk, Image
+from typing import Dict, Tuple, List
 
 from configurations import color_scheme
+from lazy_imports import lazy_import
+
+# PIL is only needed to build a sprite sheet, which most runs find already on disk
+Image = lazy_import('PIL.Image')
 
 frame_bg = '#222222'
 fg = '#00cb00'
@@ -13,6 +19,8 @@ unselected_bg = '#550000'
 unselected_fg = '#000'
 listbutton_bg = '#006600'
 
+ICON_SIZE = 16
+
 
 class ThemeEngine:
     def __init__(self):
@@ -118,9 +126,108 @@ class ThemeEngine:
             s.configure('TCombobox', fieldbackground=interactive_bg, foreground=fg)
 
 
-def get_icon(name: str):
-    colors = color_scheme()
-    icon_path = abspath(join('.resources', join(colors[0], join(colors[1], '{}.png'.format(name)))))
-    img = Image.open(icon_path)
-    img = img.resize((16, 16))
-    return ImageTk.PhotoImage(image=img)
+class IconRegistry:
+    """Loads each icon once per theme, color and size for the whole process. The icons of a theme are resized once and
+    kept on disk as a single sprite sheet, so later runs load all of them with one image read and no resizing"""
+
+    def __init__(self, resources: str = '.resources', cache: str = None):
+        """
+
+        :param resources: a str representing the directory of the themes, laid out as <theme>/<color>/<name>.png
+        :param cache: a str representing the directory the sprite sheets are kept in
+        """
+        self._resources = resources
+        self._cache = cache if cache else join(resources, 'cache')
+        self._colors = None
+        self._sheets: Dict[Tuple[str, str, int], Tuple[PhotoImage, Dict[str, int]]] = {}
+        self._icons: Dict[Tuple[str, str, int, str], PhotoImage] = {}
+
+    @property
+    def colors(self):
+        """The theme and color of the icons, read from settings.config the first time they are needed"""
+        if self._colors is None:
+            self._colors = tuple(color_scheme())
+        return self._colors
+
+    def get(self, name: str, size: int = ICON_SIZE):
+        """Gets an icon of the current theme
+
+        :param name: a str representing the name of the icon's PNG, without the extension
+        :param size: an int representing the width and height of the icon in pixels
+        :rtype: PhotoImage
+        """
+        theme, color = self.colors
+        key = (theme, color, size, name)
+        if key not in self._icons:
+            sheet, index = self.load_theme(theme, color, size)
+            if name not in index:
+                raise FileNotFoundError('No icon named {} in {}'.format(name, join(self._resources, theme, color)))
+            x = index[name] * size
+            icon = PhotoImage(width=size, height=size)
+            icon.tk.call(icon, 'copy', sheet, '-from', x, 0, x + size, size)
+            self._icons[key] = icon
+        return self._icons[key]
+
+    def load_theme(self, theme: str, color: str, size: int = ICON_SIZE):
+        """Loads the sprite sheet of every icon of a theme at a size, building it first if it is missing or older than
+        any of the theme's PNGs
+
+        :return: a tuple of the sheet and a dict of each icon name and its position in the sheet
+        """
+        key = (theme, color, size)
+        if key not in self._sheets:
+            source = join(self._resources, theme, color)
+            files = [x for x in scandir(source) if x.name.endswith('.png')]
+            names = sorted(splitext(x.name)[0] for x in files)
+            newest = max((x.stat().st_mtime for x in files), default=0)
+            base = join(self._cache, '{}-{}-{}'.format(theme, color, size))
+            index = self._read_index(base, names, newest)
+            if index is None:
+                index = self._build_sheet(source, names, size, base)
+            self._sheets[key] = PhotoImage(file='{}.png'.format(base)), index
+        return self._sheets[key]
+
+    def invalidate(self):
+        """Forgets the loaded icons and the current theme, e.g. after the theme is switched. Widgets keep the icons they
+        already hold"""
+        self._colors = None
+        self._sheets.clear()
+        self._icons.clear()
+
+    @staticmethod
+    def _read_index(base: str, names: List[str], newest: float):
+        sheet, index = '{}.png'.format(base), '{}.json'.format(base)
+        if not exists(sheet) or not exists(index) or getmtime(sheet) < newest:
+            return None
+        with open(index) as file:
+            positions = load(file)
+        return positions if sorted(positions) == names else None
+
+    def _build_sheet(self, source: str, names: List[str], size: int, base: str):
+        """Resizes a theme's icons into a single row and writes it and its index to the cache"""
+        makedirs(self._cache, exist_ok=True)
+        sheet = Image.new('RGBA', (max(len(names), 1) * size, size))
+        for i, name in enumerate(names):
+            with Image.open(join(source, '{}.png'.format(name))) as img:
+                sheet.paste(img.convert('RGBA').resize((size, size)), (i * size, 0))
+        index = {name: i for i, name in enumerate(names)}
+        # Written under temporary names and moved into place, so another instance never reads half a sheet
+        sheet.save('{}.tmp.png'.format(base))
+        with open('{}.tmp.json'.format(base), 'w') as file:
+            dump(index, file)
+        replace('{}.tmp.json'.format(base), '{}.json'.format(base))
+        replace('{}.tmp.png'.format(base), '{}.png'.format(base))
+        return index
+
+
+icons = IconRegistry()
+
+
+def get_icon(name: str, size: int = ICON_SIZE):
+    return icons.get(name, size)
+
+
+def set_color_scheme(theme: str, color: str):
+    """Switches the theme and color of the icons. Icons fetched afterwards are of the new theme"""
+    color_scheme((theme, color))
+    icons.invalidate()
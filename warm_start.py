@@ -0,0 +1,105 @@
+"""Saves what each Reader page was showing when the application closed, so the page can show it again straight away the
+next time it is opened rather than running its filter. The state is saved with the change counter of the database; if
+the database has changed since, the restored state is shown while the page is loaded again in the background"""
+from datetime import datetime
+from json import load, dump
+from os import makedirs, remove, replace
+from os.path import join, exists, basename, dirname
+from typing import Union
+
+from database_info import get_change_counter
+from event_bus import PageBus, ReaderSnapshot
+from modules import ReaderModule
+
+STATE_DIRECTORY = join('.tempfiles', 'Warm')
+TOPICS = ('ids', 'entry')
+
+
+def state_file(tempfile: str):
+    """Gets the location of the saved state of a page
+
+    :param tempfile: a str representing the key of the page's tab in the session store, e.g. 'Reader/000'
+    """
+    return join(STATE_DIRECTORY, '{}.{}.json'.format(basename(dirname(tempfile)), basename(tempfile)))
+
+
+def save_state(bus: PageBus, reader: ReaderModule):
+    """Saves the values a Reader page was last shown with
+
+    :param bus: the PageBus of the page
+    :param reader: the ReaderModule of the page
+    :return: True if the state was saved, or False if the page has not finished loading
+    """
+    ids, entry = bus.latest('ids'), bus.latest('entry')
+    if not isinstance(ids, ReaderSnapshot) or not isinstance(entry, ReaderSnapshot):
+        return False
+    values = {k: v for k, v in ids.values().items() if k in ReaderSnapshot.VALUES['ids']}
+    values.update({k: v for k, v in entry.values().items() if k in ReaderSnapshot.VALUES['entry']})
+    # Only the page of rows around the selected entry is kept, not the ids of every filtered entry
+    values['rows'] = [(created.isoformat(), id_) for created, id_ in values.get('rows', ())]
+    state = {'database': ids.database,
+             'settings': _settings_key(ids.settings),
+             'id': entry.id_ or 0,
+             # The older of the two, so a change made between them is still caught
+             'version': min(ids.version, entry.version),
+             'values': values}
+    makedirs(STATE_DIRECTORY, exist_ok=True)
+    path = state_file(reader.path)
+    with open('{}.tmp'.format(path), 'w') as file:
+        dump(state, file)
+    replace('{}.tmp'.format(path), path)
+    return True
+
+
+def restore_state(reader: ReaderModule) -> Union[ReaderSnapshot, None]:
+    """Reads the saved state of a Reader page
+
+    :param reader: the ReaderModule of the page
+    :return: a snapshot of the saved values, or None if there are none or they were saved for a different database,
+    filter or selection than the page now has
+    """
+    path = state_file(reader.path)
+    try:
+        with open(path) as file:
+            state = load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    values = state.get('values', {})
+    if state.get('database') != reader.database or state.get('settings') != _settings_key(reader.filter_settings) \
+            or state.get('id') != (reader.id_ or 0) or any(x not in values for t in TOPICS
+                                                          for x in ReaderSnapshot.VALUES[t]):
+        return None
+    # JSON has no tuples or dates
+    values['rows'] = tuple((datetime.fromisoformat(created), id_) for created, id_ in values['rows'])
+    values['tags'] = tuple(values['tags'])
+    values['version'] = state['version']
+    return ReaderSnapshot.restored(reader, values)
+
+
+def warm_start(bus: PageBus, reader: ReaderModule):
+    """Shows a Reader page's saved state, if it has one, and loads the page again in the background only if the
+    database has changed since it was saved
+
+    :return: True if the saved state was shown
+    """
+    snapshot = restore_state(reader)
+    if snapshot is None:
+        return False
+    bus.restore(TOPICS, snapshot)
+    if snapshot.version != get_change_counter(reader.database):
+        bus.invalidate(*TOPICS)
+    return True
+
+
+def discard_state(tempfile: str):
+    """Deletes the saved state of a page, e.g. when the page is closed"""
+    path = state_file(tempfile)
+    if exists(path):
+        remove(path)
+
+
+def _settings_key(settings: dict):
+    """Writes filter settings as a str that is the same for the same filter. The order of the tags makes no difference
+    to the result, and it is not kept from one run to the next"""
+    return repr({k: tuple(sorted(v)) if k == 'tags' and v else v for k, v in settings.items()})
+
@@ -0,0 +1,198 @@
+"""Runs database work on background threads so the Tk main loop keeps repainting. Each worker thread has its own Filters,
+requests are keyed so that a newer request supersedes an older one with the same key, and results are handed back to
+the Tk thread through a queue that is polled with after(). Every request runs with its own CancelToken active, so
+cancelling it also stops the SQLite query it is in the middle of. A callback that fails is reported through
+report_callback_exception, like any other Tk callback, and the results behind it are still delivered"""
+from queue import Queue, Empty
+from sys import exc_info
+from threading import Thread, local
+from tkinter import Misc
+from typing import Any, Callable, Dict, Hashable, List, Tuple, Union
+
+from filter import Filter
+from query_runner import CancelToken
+
+POLL_INTERVAL = 15
+
+_local = local()
+# Marks a partial result in the results queue
+_PARTIAL = object()
+
+
+def worker_filter(database: str, settings: Dict[str, Any]):
+    """Gets the calling thread's Filter for a database, set to the given settings. Only criteria that differ from the
+    thread's last request are evaluated again, and bitmaps are shared with every other Filter through the result cache
+
+    :param database: a str representing the location of the database
+    :param settings: a dict of settings, as returned by Filter.settings
+    :rtype: Filter
+    """
+    filters: Dict[str, Filter] = getattr(_local, 'filters', None)
+    if filters is None:
+        filters = _local.filters = {}
+    if database not in filters:
+        filters[database] = Filter(database)
+    f = filters[database]
+    f.update(**settings)
+    return f
+
+
+class Request:
+    """A unit of work submitted to a WorkerPool"""
+
+    def __init__(self, key: Hashable, function: Callable, args: tuple, kwargs: dict,
+                 callback: Callable[[Any], Any] = None, errback: Callable[[Exception], Any] = None,
+                 on_partial: Callable[[Any], Any] = None, budget: float = None, results: Queue = None):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.errback = errback
+        self.on_partial = on_partial
+        partial = (lambda value: results.put((self, value, _PARTIAL))) if on_partial else None
+        self.token = CancelToken(budget, partial)
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def cancel(self):
+        """Cancels the request. It is skipped if it has not started, its query is interrupted if it is running, and its
+        result is discarded if it has finished"""
+        self.token.cancel()
+
+
+class WorkerPool:
+    """A fixed number of worker threads serving requests in the order they were submitted. Callbacks always run on the
+    Tk thread"""
+
+    def __init__(self, master: Misc, threads: int = 2, interval: int = POLL_INTERVAL):
+        """
+
+        :param master: the widget whose event loop polls for results
+        :param threads: an int representing the number of worker threads
+        :param interval: an int representing the milliseconds between polls while there are requests in flight
+        """
+        self._master = master
+        self._interval = interval
+        self._requests: Queue = Queue()
+        self._results: Queue = Queue()
+        self._current: Dict[Hashable, Request] = {}
+        self._listeners: Dict[Hashable, List[Callable[[bool], Any]]] = {}
+        self._polling = None
+        self._threads = [Thread(target=self._work, name='worker-{}'.format(i), daemon=True) for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: Hashable, function: Callable, *args, callback: Callable[[Any], Any] = None,
+               errback: Callable[[Exception], Any] = None, on_partial: Callable[[Any], Any] = None,
+               budget: float = None, **kwargs):
+        """Runs a callable on a worker thread, cancelling any request that is still in flight under the same key
+
+        :param key: a hashable identifying what the request is for, e.g. the bind tag of a page
+        :param function: the callable to run. It must not touch any widget
+        :param callback: a callable that is given the result on the Tk thread
+        :param errback: a callable that is given any exception raised by the function on the Tk thread, including
+        query_runner.Cancelled when the budget is spent. Without one, the exception is reported through the Tk thread's
+        report_callback_exception
+        :param on_partial: a callable that is given partial results on the Tk thread, e.g. the number of entries a body
+        search has matched so far
+        :param budget: a float representing the seconds the request may take, or None for no limit
+        :return: the Request
+        """
+        old = self._current.get(key)
+        if old:
+            old.cancel()
+        request = Request(key, function, args, kwargs, callback, errback, on_partial, budget, self._results)
+        self._current[key] = request
+        self._requests.put(request)
+        if not old:
+            self._notify(key, True)
+        self._poll_soon()
+        return request
+
+    def cancel(self, key: Hashable):
+        """Cancels the request in flight under a key, if there is one"""
+        request = self._current.pop(key, None)
+        if request:
+            request.cancel()
+            self._notify(key, False)
+
+    def busy(self, key: Hashable):
+        return key in self._current
+
+    def add_busy_listener(self, key: Hashable, callback: Callable[[bool], Any]):
+        """Calls a callable with True when a key becomes busy and with False when its last request is finished"""
+        self._listeners.setdefault(key, []).append(callback)
+
+    def _notify(self, key: Hashable, busy: bool):
+        for callback in self._listeners.get(key, ()):
+            callback(busy)
+
+    def _work(self):
+        while True:
+            request: Request = self._requests.get()
+            if request.cancelled:
+                continue
+            try:
+                with request.token.active():
+                    result: Tuple[Any, Union[Exception, None]] = request.function(*request.args, **request.kwargs), None
+            except Exception as e:
+                result = None, e
+            self._results.put((request, *result))
+
+    def _poll_soon(self):
+        if self._polling is None:
+            self._polling = self._master.after(self._interval, self._poll)
+
+    def _poll(self):
+        self._polling = None
+        try:
+            while True:
+                try:
+                    request, result, error = self._results.get_nowait()
+                except Empty:
+                    break
+                # Results of superseded requests are dropped
+                if request.cancelled or self._current.get(request.key) is not request:
+                    continue
+                try:
+                    self._dispatch(request, result, error)
+                except Exception:
+                    # A failed callback must not keep the results behind it from being delivered
+                    self._master.report_callback_exception(*exc_info())
+        finally:
+            if self._current or not self._results.empty():
+                self._poll_soon()
+
+    def _dispatch(self, request: Request, result: Any, error: Union[Exception, None]):
+        """Hands a result to its callback, or an error to its errback. An error without an errback is raised, to be
+        reported by the caller"""
+        if error is _PARTIAL:
+            request.on_partial(result)
+            return
+        del self._current[request.key]
+        self._notify(request.key, False)
+        if error is None:
+            if request.callback:
+                request.callback(result)
+        elif request.errback:
+            request.errback(error)
+        else:
+            raise error
+
+
+_pools: Dict[str, WorkerPool] = {}
+
+
+def get_pool(widget: Misc):
+    """Gets the pool shared by every page of a window, starting it the first time it is asked for
+
+    :param widget: any widget of the window
+    :rtype: WorkerPool
+    """
+    root = widget.winfo_toplevel()
+    if str(root) not in _pools:
+        _pools[str(root)] = WorkerPool(root)
+    return _pools[str(root)]
@@ -6,6 +6,7 @@ from sqlite3 import connect
 from typing import Union, Tuple, Any
 
 from configurations import default_database
+from entry_metrics import store_metrics, delete_metrics
 from reader_functions import Reader, get_tags, get_attachment_ids
 
 
@@ -277,6 +278,7 @@ def set_body(body: str, database: str = None):
     with closing(db) as d:
         c = d.execute('INSERT INTO bodies(body) VALUES(?)', (body.strip(),))
         entry = c.lastrowid
+        store_metrics(d, entry, body.strip())
         d.commit()
     return entry
 
@@ -291,6 +293,7 @@ def modify_body(entry_id: int, body: str, database: str = None, **kwargs):
     db = connect(database) if database else connect(default_database())
     with closing(db) as d:
         d.execute('UPDATE bodies SET body=? WHERE entry_id=?', (body.strip(), entry_id))
+        store_metrics(d, entry_id, body.strip())
         d.commit()
 
 
@@ -404,4 +407,5 @@ def delete_entry(entry_id, database: str = None):
         d.execute('DELETE FROM tags WHERE entry_id=?', (entry_id,))
         d.execute('DELETE FROM attachments WHERE entry_id=?', (entry_id,))
         d.execute('DELETE FROM relations WHERE child=? OR parent=?', (entry_id, entry_id))
+        delete_metrics(d, entry_id)
         d.commit()
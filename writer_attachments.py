@@ -4,8 +4,6 @@ from tkinter import Toplevel
 from tkinter.filedialog import askopenfilename
 from tkinter.ttk import Button, Frame, Label
 
-from PIL import Image, ImageTk
-
 from base_widgets import ScrollingFrame
 from modules import WriterModule
 from scrolled_frame import VScrolledFrame
@@ -55,7 +55,7 @@ def _test():
 
     r = Tk()
 
-    w = WriterModule('.tempfiles/Writer/000')
+    w = WriterModule('Writer/000')
 
     b = BodyFrame(master=r, writer=w)
     b.pack()
@@ -164,7 +164,7 @@ def _test():
 
     r = Tk()
 
-    w = WriterModule('.tempfiles/Writer/000')
+    w = WriterModule('Writer/000')
 
     d = DateFrame(master=r, writer=w)
     d.pack(fill='x')
@@ -1,17 +1,43 @@
 from tkinter import StringVar, Event
 from tkinter.ttk import Button, Label, Frame
 
+from event_bus import PageBus, WriterSnapshot, writer_bus
 from modules import WriterModule
+from tempfiles import common_prefix, common_suffix
+
+
+def count_words(old: str, new: str, words: int):
+    """Counts the words of a body from the count before it was edited, splitting only the words around the part that
+    changed, so typing costs the same however long the entry is. Words are split on whitespace, as in entry_metrics
+
+    :param old: a str representing the body before the edit
+    :param new: a str representing the body after the edit
+    :param words: an int representing the number of words in old
+    :return: an int representing the number of words in new
+    """
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    # The part that changed is widened to whole words, which are the same in both outside it
+    start, end = prefix, len(old) - suffix
+    while start and not old[start - 1].isspace():
+        start -= 1
+    while end < len(old) and not old[end].isspace():
+        end += 1
+    tail = len(old) - end
+    return words - len(old[start:end].split()) + len(new[start:len(new) - tail].split())
 
 
 # TODO add stats about tags usage, attachments, last edit, connections
 class WriterStatsFrame(Frame):
-    def __init__(self, writer: WriterModule, bind_tag: str = None, **kwargs):
+    def __init__(self, writer: WriterModule, bind_tag: str = None, bus: PageBus = None, **kwargs):
         super(WriterStatsFrame, self).__init__(**kwargs)
 
         self._bind_tag = bind_tag if bind_tag is not None else ''
 
         self._writer = writer
+
+        self._measured = ''
+        self._words = 0
         
         stats_button = Button(master=self, text='Stats')
         # stats_button.pack(side='left', padx=(5, 0))
@@ -28,14 +54,19 @@ class WriterStatsFrame(Frame):
         count_descriptor = Label(master=self, text='character | word')
         count_descriptor.pack(side='right', padx=(5, 0))
 
-        self.bind_class(self._bind_tag, '<<Writer Changed>>', self.update_counter)
         self.bind_class(self._bind_tag, '<<Status Updated>>', self.update_status, add=True)
-        self.update_counter()
 
-    def update_counter(self, event: Event = None):
-        words = self._writer.body.split(' ')
-        words = len([x for x in words if x])
-        chars = len(self._writer.body)
+        # A burst of keystrokes is measured once
+        self._bus = bus if bus else writer_bus(self, self._writer, self._bind_tag)
+        self._bus.subscribe('body', self.update_counter)
+
+    def update_counter(self, snapshot: WriterSnapshot):
+        body = snapshot.body
+        if body == self._measured:
+            return
+        self._words = count_words(self._measured, body, self._words)
+        self._measured = body
+        chars, words = len(body), self._words
         try:
             prop = round(chars / words, 2)
             text = '{} | {} ({:.2f})'.format(chars, words, prop)